@@ -0,0 +1,164 @@
+"""
+Forecast Service Load Test
+
+Drives src/forecast_service.py with concurrent keep-alive connections and reports
+latency percentiles (p50/p90/p99) and throughput, per request type and overall:
+- point: GET /skus/<product_id>
+- bulk:  POST /skus with --bulk-size product_ids
+- risk:  POST /risk with one posted stock level (micro-batched by the service)
+
+Runs against a service that is already up (--host/--port), or starts one with
+--spawn from the current directory (which must hold the pipeline's data/).
+
+    python benchmarks/load_test.py --spawn --connections 64 --requests 20000
+    python benchmarks/load_test.py --port 8765 --mix point=1 risk=3 --output benchmarks/results/load.json
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+SERVICE_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src", "forecast_service.py")
+DEFAULT_MIX = {'point': 4, 'bulk': 1, 'risk': 5}
+STARTUP_TIMEOUT = 60
+
+async def request(reader, writer, method, path, payload=None):
+    body = b'' if payload is None else json.dumps(payload).encode()
+    writer.write((f"{method} {path} HTTP/1.1\r\nHost: localhost\r\nContent-Type: application/json\r\n"
+                  f"Content-Length: {len(body)}\r\n\r\n").encode() + body)
+    await writer.drain()
+    head = await reader.readuntil(b"\r\n\r\n")
+    status = int(head.split(b" ", 2)[1])
+    length = 0
+    for line in head.split(b"\r\n"):
+        if line.lower().startswith(b"content-length:"):
+            length = int(line.split(b":", 1)[1])
+    return status, await reader.readexactly(length)
+
+def build_request(kind, product_ids, bulk_size, rng):
+    if kind == 'point':
+        return 'GET', f"/skus/{rng.choice(product_ids)}", None
+    if kind == 'bulk':
+        return 'POST', "/skus", {'product_ids': rng.sample(product_ids, min(bulk_size, len(product_ids)))}
+    return 'POST', "/risk", {'product_id': rng.choice(product_ids), 'stock_on_hand': rng.randint(0, 500)}
+
+async def worker(host, port, plan, product_ids, bulk_size, seed, latencies, errors):
+    rng = random.Random(seed)
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        while plan:
+            kind = plan.pop()
+            method, path, payload = build_request(kind, product_ids, bulk_size, rng)
+            started = time.perf_counter()
+            status, _ = await request(reader, writer, method, path, payload)
+            latencies[kind].append(time.perf_counter() - started)
+            if status != 200:
+                errors[kind] += 1
+    finally:
+        writer.close()
+
+async def run_load(host, port, connections, total_requests, mix, bulk_size, seed):
+    reader, writer = await asyncio.open_connection(host, port)
+    _, body = await request(reader, writer, 'GET', "/skus")
+    writer.close()
+    product_ids = json.loads(body)['product_ids']
+
+    # The request kinds are drawn up front, so every run with a seed sends the same mix
+    rng = random.Random(seed)
+    kinds = list(mix)
+    plan = rng.choices(kinds, weights=[mix[k] for k in kinds], k=total_requests)
+    latencies = {kind: [] for kind in kinds}
+    errors = {kind: 0 for kind in kinds}
+
+    started = time.perf_counter()
+    await asyncio.gather(*[worker(host, port, plan, product_ids, bulk_size, seed + i, latencies, errors)
+                           for i in range(connections)])
+    elapsed = time.perf_counter() - started
+    return latencies, errors, elapsed
+
+def summarize(latencies, errors, elapsed):
+    rows = []
+    for kind, values in list(latencies.items()) + [('all', [v for vs in latencies.values() for v in vs])]:
+        if not values:
+            continue
+        ms = np.array(values) * 1000
+        rows.append({
+            'type': kind,
+            'requests': len(values),
+            'errors': sum(errors.values()) if kind == 'all' else errors[kind],
+            'p50_ms': round(float(np.percentile(ms, 50)), 3),
+            'p90_ms': round(float(np.percentile(ms, 90)), 3),
+            'p99_ms': round(float(np.percentile(ms, 99)), 3),
+            'max_ms': round(float(ms.max()), 3),
+            'throughput_rps': round(len(values) / elapsed, 1)
+        })
+    return rows
+
+def wait_for_service(host, port, process):
+    deadline = time.time() + STARTUP_TIMEOUT
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise SystemExit("The service exited during startup")
+        try:
+            asyncio.run(asyncio.wait_for(asyncio.open_connection(host, port), 1))
+            return
+        except (OSError, asyncio.TimeoutError):
+            time.sleep(0.2)
+    raise SystemExit(f"The service did not come up within {STARTUP_TIMEOUT}s")
+
+def parse_mix(values):
+    mix = {}
+    for value in values:
+        kind, _, weight = value.partition('=')
+        if kind not in DEFAULT_MIX:
+            raise SystemExit(f"Unknown request type {kind!r} (choose from {', '.join(DEFAULT_MIX)})")
+        mix[kind] = float(weight or 1)
+    return mix
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load-test the forecast service")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--spawn", action="store_true", help="Start the service for the duration of the test")
+    parser.add_argument("--connections", type=int, default=32, help="Concurrent keep-alive connections")
+    parser.add_argument("--requests", type=int, default=10000, help="Total requests")
+    parser.add_argument("--mix", nargs='+', default=None,
+                        help="Request types and weights, e.g. point=4 bulk=1 risk=5 (default)")
+    parser.add_argument("--bulk-size", type=int, default=50, help="product_ids per bulk request")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", default=None, help="Also write the summary as JSON")
+    args = parser.parse_args()
+
+    mix = parse_mix(args.mix) if args.mix else DEFAULT_MIX
+    process = None
+    if args.spawn:
+        process = subprocess.Popen([sys.executable, SERVICE_SCRIPT, "--host", args.host, "--port", str(args.port)])
+        wait_for_service(args.host, args.port, process)
+    try:
+        latencies, errors, elapsed = asyncio.run(run_load(args.host, args.port, args.connections, args.requests,
+                                                          mix, args.bulk_size, args.seed))
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait()
+
+    summary = summarize(latencies, errors, elapsed)
+    print(f"\n{args.requests:,} requests over {args.connections} connections in {elapsed:.2f}s\n")
+    print(f"{'type':<7} {'requests':>9} {'errors':>7} {'p50 ms':>9} {'p90 ms':>9} {'p99 ms':>9} {'max ms':>9} {'req/s':>9}")
+    for row in summary:
+        print(f"{row['type']:<7} {row['requests']:>9,} {row['errors']:>7} {row['p50_ms']:>9.2f} {row['p90_ms']:>9.2f} "
+              f"{row['p99_ms']:>9.2f} {row['max_ms']:>9.2f} {row['throughput_rps']:>9.1f}")
+
+    if args.output:
+        os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+        with open(args.output, 'w') as f:
+            json.dump({'connections': args.connections, 'requests': args.requests, 'mix': mix,
+                       'seconds': round(elapsed, 3), 'results': summary}, f, indent=2)
+        print(f"\n✓ Saved load test results to {args.output}")
@@ -0,0 +1,230 @@
+"""
+Pipeline Benchmarks
+
+Times every pipeline stage on synthetic datasets built with the data_generation
+functions, along a ladder of catalog sizes and history lengths:
+- Scales: every combination of --products and --years (e.g. 50 -> 50k products, 1 -> 5 years);
+  transactions per day grow with the catalog
+- Per stage: best wall time over --repeat runs and peak traced memory (tracemalloc, one extra run)
+- Results are written as JSON and can be compared against a stored baseline;
+  a stage slower (or bigger) than baseline * (1 + threshold) fails the run
+
+Runs offline; the datasets are generated into a temporary directory.
+
+    python benchmarks/run_benchmarks.py --products 50 500 5000 --years 1 5
+    python benchmarks/run_benchmarks.py --save-baseline
+    python benchmarks/run_benchmarks.py --compare --threshold 0.25
+"""
+
+import argparse
+import gc
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+import storage
+import aggregates
+import data_generation
+import demand_tensor
+import dimensions
+import eda_analysis
+import feature_store
+import hierarchical
+from data_cleaning import clean_data, aggregate_data, build_master_table
+from forecasting import daily_revenue, train_exponential_smoothing, fit_holt_winters_batch
+from inventory_optimization import calculate_inventory_metrics
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+RESULTS_FILE = os.path.join(BENCHMARK_DIR, "results", "latest.json")
+BASELINE_FILE = os.path.join(BENCHMARK_DIR, "baseline.json")
+
+PRODUCT_LADDER = [50, 500, 5000]
+YEAR_LADDER = [1]
+START_DATE = datetime(2021, 1, 1)
+TRANSACTIONS_PER_PRODUCT = (0.4, 1.0)    # Base daily transactions per product (min, max)
+REGRESSION_THRESHOLD = 0.25
+MIN_COMPARABLE_SECONDS = 0.05            # Faster stages are too noisy to compare
+
+def measure(fn, *args, repeat=1, memory=True):
+    # Best-of-`repeat` wall time, then one run under tracemalloc for the peak
+    # (tracing slows Python-heavy code, so it is kept out of the timed runs)
+    times = []
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        result = fn(*args)
+        times.append(time.perf_counter() - start)
+    peak_mb = None
+    if memory:
+        gc.collect()
+        tracemalloc.start()
+        fn(*args)
+        peak_mb = tracemalloc.get_traced_memory()[1] / 2**20
+        tracemalloc.stop()
+    return result, {'seconds': min(times), 'peak_mb': peak_mb}
+
+def generate_dataset(n_products, years, workdir):
+    days = (START_DATE.replace(year=START_DATE.year + years) - START_DATE).days
+    suppliers = data_generation.generate_suppliers(data_generation.NUM_SUPPLIERS)
+    products = data_generation.generate_products(n_products, suppliers['supplier_id'].tolist())
+    daily_transactions = tuple(max(1, int(round(rate * n_products))) for rate in TRANSACTIONS_PER_PRODUCT)
+
+    generated = {}
+
+    def generate_sales():
+        path = os.path.join(workdir, "sales")
+        generated['sales_quantity'] = data_generation.generate_sales_vectorized(
+            products, START_DATE, days, path, daily_transactions=daily_transactions)
+        return storage.load_table(path)
+
+    def generate_inventory():
+        inventory, generated['units_sold'] = data_generation.generate_inventory(
+            products, suppliers, START_DATE, days, generated['sales_quantity'])
+        return inventory
+
+    def cap_sales(sales):
+        # Sales on stockout days are capped at the units in stock, as data_generation.py does
+        return data_generation.cap_sales(sales, generated['units_sold'], products, START_DATE)
+
+    return suppliers, products, generate_sales, generate_inventory, cap_sales
+
+def run_scale(n_products, years, stages, repeat, memory):
+    results = []
+    with tempfile.TemporaryDirectory() as workdir:
+        suppliers, products, generate_sales, generate_inventory, cap_sales = generate_dataset(n_products, years, workdir)
+
+        def step(name, fn, *args):
+            if stages is not None and name not in stages and not name.startswith('generate'):
+                # Still needed as input for later stages, just not reported
+                return fn(*args)
+            result, stats = measure(fn, *args, repeat=repeat, memory=memory)
+            rows = len(result) if isinstance(result, pd.DataFrame) else None
+            results.append({'scale': f"{n_products}p_{years}y", 'products': n_products, 'years': years,
+                            'stage': name, 'rows': rows, **stats})
+            memory_note = f", peak {stats['peak_mb']:.0f} MB" if memory else ""
+            print(f"  {name:<22} {stats['seconds']:8.3f}s{memory_note}" + (f", {rows:,} rows" if rows else ""))
+            return result
+
+        sales = step('generate_sales', generate_sales)
+        inventory = step('generate_inventory', generate_inventory)
+        sales = cap_sales(sales)
+        inventory['date'] = pd.to_datetime(inventory['date'])
+
+        dim_product = dimensions.product_dimension(products, dimensions.supplier_dimension(suppliers))
+        cleaned = step('clean_data', lambda: clean_data(sales.copy(), inventory, products, suppliers,
+                                                        dim_product=dim_product))
+        daily_sales = step('aggregate_data', aggregate_data, cleaned)
+        master_table = step('build_master_table', build_master_table, daily_sales, inventory, dim_product)
+        step('dashboard_aggregates', aggregates.build_aggregates, master_table, dim_product)
+
+        tensor_path = os.path.join(workdir, "demand_tensor")
+        step('build_demand_tensor', demand_tensor.tensor_from_master, master_table, dim_product, tensor_path,
+             os.path.join(workdir, "master_table"))
+        step('tensor_aggregates', lambda: aggregates.tensor_aggregates(demand_tensor.load_tensor(tensor_path)))
+        step('eda_aggregates', lambda: eda_analysis.eda_aggregates(demand_tensor.load_tensor(tensor_path)))
+
+        step('feature_store', lambda: feature_store.build_features(
+            demand_tensor.load_tensor(tensor_path, measures=['quantity', 'stock_on_hand']), os.path.join(workdir, "features")))
+
+        def fit_total():
+            # Same 30-day holdout fit as forecasting.run_total_forecast
+            df = daily_revenue(master_table)
+            return train_exponential_smoothing(df.iloc[:-30], df.iloc[-30:], horizon=30)[0]
+        step('hw_fit_total', fit_total)
+
+        def fit_products():
+            demand = master_table.pivot_table(index='date', columns='product_key', values='quantity',
+                                              aggfunc='sum').asfreq('D').fillna(0)
+            return fit_holt_winters_batch(demand.to_numpy(dtype=float).T)
+        step('hw_fit_products', fit_products)
+
+        def fit_hierarchy():
+            tensor = demand_tensor.load_tensor(tensor_path, measures=['revenue'])
+            Y = np.asarray(tensor['revenue'], dtype=float).T
+            return hierarchical.hierarchical_forecast(products, Y, tensor['dates'], use_registry=False)
+        step('hierarchical_forecast', fit_hierarchy)
+
+        step('inventory_metrics', calculate_inventory_metrics, master_table, dim_product)
+    return results
+
+def compare(results, baseline, threshold=REGRESSION_THRESHOLD):
+    # Returns the rows that regressed past the threshold, in time or in peak memory
+    previous = {(r['scale'], r['stage']): r for r in baseline['results']}
+    regressions = []
+    print(f"\n{'scale':<12} {'stage':<22} {'baseline':>10} {'current':>10} {'ratio':>7}")
+    for r in results:
+        old = previous.get((r['scale'], r['stage']))
+        if old is None:
+            continue
+        ratio = r['seconds'] / old['seconds'] if old['seconds'] > 0 else float('nan')
+        slower = old['seconds'] >= MIN_COMPARABLE_SECONDS and ratio > 1 + threshold
+        bigger = (r['peak_mb'] is not None and old.get('peak_mb') and
+                  r['peak_mb'] > old['peak_mb'] * (1 + threshold))
+        flag = "  <-- slower" if slower else "  <-- more memory" if bigger else ""
+        print(f"{r['scale']:<12} {r['stage']:<22} {old['seconds']:9.3f}s {r['seconds']:9.3f}s {ratio:6.2f}x{flag}")
+        if slower or bigger:
+            regressions.append(r)
+    return regressions
+
+def environment():
+    return {
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'numpy': np.__version__,
+        'pandas': pd.__version__
+    }
+
+def write_json(path, payload):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w') as f:
+        json.dump(payload, f, indent=2)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the pipeline stages along a scale ladder")
+    parser.add_argument("--products", type=int, nargs='+', default=PRODUCT_LADDER)
+    parser.add_argument("--years", type=int, nargs='+', default=YEAR_LADDER)
+    parser.add_argument("--stages", nargs='+', default=None, help="Only report these stages")
+    parser.add_argument("--repeat", type=int, default=1, help="Timed runs per stage (best is kept)")
+    parser.add_argument("--no-memory", action="store_true", help="Skip the tracemalloc run")
+    parser.add_argument("--output", default=RESULTS_FILE)
+    parser.add_argument("--baseline", default=BASELINE_FILE)
+    parser.add_argument("--save-baseline", action="store_true", help="Also store these results as the baseline")
+    parser.add_argument("--compare", action="store_true", help="Compare against the baseline and fail on regressions")
+    parser.add_argument("--threshold", type=float, default=REGRESSION_THRESHOLD,
+                        help="Allowed slowdown/memory growth as a fraction (0.25 = 25%%)")
+    args = parser.parse_args()
+
+    results = []
+    for years in args.years:
+        for n_products in args.products:
+            print(f"Scale: {n_products:,} products x {years} year(s)")
+            np.random.seed(42)
+            results.extend(run_scale(n_products, years, args.stages, args.repeat, not args.no_memory))
+
+    payload = {'environment': environment(), 'results': results}
+    write_json(args.output, payload)
+    print(f"\n✓ Saved benchmark results to {args.output}")
+    if args.save_baseline:
+        write_json(args.baseline, payload)
+        print(f"✓ Saved baseline to {args.baseline}")
+
+    if args.compare:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)} stage(s) regressed by more than {args.threshold:.0%}")
+            raise SystemExit(1)
+        print(f"\nNo regressions beyond {args.threshold:.0%}")
@@ -0,0 +1,236 @@
+"""
+Aggregates Module
+
+Small materialized summaries of the master table, written by the pipeline so the
+dashboard never has to scan the daily product-level history:
+- daily_totals:      revenue, profit and units per day
+- daily_by_category: revenue, profit and units per day and category
+- product_totals:    revenue, profit and units per product
+- rolling_kpis:      7/28-day rolling revenue and units, 28-day profit margin
+
+Also chart downsampling (LTTB, min/max bucketing) so long series are thinned
+before they are sent to the browser.
+"""
+
+import numpy as np
+import pandas as pd
+
+import storage
+import demand_tensor
+import dimensions
+import query_engine
+
+AGGREGATES_PATH = "data/processed/aggregates"
+MASTER_TABLE_PATH = "data/processed/master_table"
+MEASURES = ['revenue', 'profit', 'quantity']
+
+# Default number of points a chart line is thinned to
+MAX_CHART_POINTS = 1000
+
+# Days per block when the demand tensor is reduced to category totals
+TENSOR_BLOCK_DAYS = 366
+
+def partial_aggregates(master_table, dim_product=None):
+    # Additive aggregates of one slice of the master table (a frame, or the stored
+    # table's path for engines that scan it); slices combine by summing.
+    # Rows are grouped by product_key, and names/categories are attached by key.
+    if dim_product is None:
+        dim_product = dimensions.load_dimension(dimensions.PRODUCT_DIM_PATH)
+    daily_totals = query_engine.group_sum(master_table, ['date'], MEASURES)
+    daily_by_category = query_engine.group_sum(master_table, ['date', 'category'], MEASURES, dim_product)
+    product_totals = query_engine.group_sum(master_table, ['product_key'], MEASURES)
+    product_totals = dimensions.attach(product_totals, ['product_id', 'product_name', 'category'], dim_product)
+    product_totals = product_totals[['product_id', 'product_name', 'category'] + MEASURES]
+    return {
+        'daily_totals': daily_totals,
+        'daily_by_category': daily_by_category,
+        'product_totals': product_totals
+    }
+
+def rolling_kpis(daily_totals):
+    daily = daily_totals.set_index('date').asfreq('D', fill_value=0)
+    kpis = pd.DataFrame({
+        'revenue_7d': daily['revenue'].rolling(7, min_periods=1).mean(),
+        'revenue_28d': daily['revenue'].rolling(28, min_periods=1).mean(),
+        'units_7d': daily['quantity'].rolling(7, min_periods=1).mean(),
+        'profit_margin_28d': (daily['profit'].rolling(28, min_periods=1).sum() /
+                              daily['revenue'].rolling(28, min_periods=1).sum())
+    }, index=daily.index)
+    return kpis.reset_index()
+
+def _sum_product_totals(product_totals):
+    # One row per product, largest revenue first
+    product_totals = product_totals.groupby('product_id', observed=True).agg(
+        product_name=('product_name', 'first'),
+        category=('category', 'first'),
+        revenue=('revenue', 'sum'),
+        profit=('profit', 'sum'),
+        quantity=('quantity', 'sum')
+    ).reset_index()
+    return product_totals.sort_values('revenue', ascending=False, ignore_index=True)
+
+def combine_aggregates(parts):
+    # Sum the partial aggregates of several slices and derive the rolling KPIs
+    def concat(name):
+        return pd.concat([part[name] for part in parts], ignore_index=True)
+
+    daily_totals = concat('daily_totals').groupby('date')[MEASURES].sum().reset_index()
+    daily_by_category = concat('daily_by_category').groupby(['date', 'category'], observed=True)[MEASURES].sum().reset_index()
+    return {
+        'daily_totals': daily_totals,
+        'daily_by_category': daily_by_category,
+        'product_totals': _sum_product_totals(concat('product_totals')),
+        'rolling_kpis': rolling_kpis(daily_totals)
+    }
+
+def build_aggregates(master_table, dim_product=None):
+    return combine_aggregates([partial_aggregates(master_table, dim_product)])
+
+def save_aggregates(aggregates):
+    for name, table in aggregates.items():
+        storage.save_table(table, f"{AGGREGATES_PATH}/{name}")
+
+def tensor_aggregates(tensor):
+    # Same tables as build_aggregates, as axis reductions over the demand tensor
+    dims = tensor['products']
+    categories = dims['category'].astype('category')
+    # (SKUs x categories) indicator: a block of days @ onehot gives per-category totals
+    onehot = np.zeros((len(dims), len(categories.cat.categories)))
+    onehot[np.arange(len(dims)), categories.cat.codes.to_numpy()] = 1
+
+    daily_totals = pd.DataFrame({'date': tensor['dates']})
+    product_totals = pd.DataFrame({
+        'product_id': dims['product_id'].astype(str),
+        'product_name': dims['product_name'],
+        'category': dims['category'].astype(str)
+    })
+    by_category = {}
+    for measure in MEASURES:
+        values = tensor[measure]
+        daily_totals[measure] = values.sum(axis=1, dtype=np.float64)
+        product_totals[measure] = values.sum(axis=0, dtype=np.float64)
+        by_category[measure] = np.concatenate([values[start:start + TENSOR_BLOCK_DAYS] @ onehot
+                                               for start in range(0, len(values), TENSOR_BLOCK_DAYS)])
+
+    daily_by_category = pd.DataFrame({
+        'date': np.repeat(tensor['dates'], len(categories.cat.categories)),
+        'category': np.tile(categories.cat.categories.astype(str), len(tensor['dates'])),
+        **{measure: totals.ravel() for measure, totals in by_category.items()}
+    })
+    return {
+        'daily_totals': daily_totals,
+        'daily_by_category': daily_by_category,
+        'product_totals': product_totals.sort_values('revenue', ascending=False, ignore_index=True),
+        'rolling_kpis': rolling_kpis(daily_totals)
+    }
+
+def refresh_aggregates(master_path=MASTER_TABLE_PATH):
+    # Rebuild from the stored master table (used after streamed and incremental
+    # cleaning): from the demand tensor when it is current, otherwise one month at
+    # a time, so memory use does not grow with the history
+    if master_path == MASTER_TABLE_PATH and demand_tensor.is_current():
+        aggregates = tensor_aggregates(demand_tensor.load_tensor(measures=MEASURES))
+        save_aggregates(aggregates)
+        return aggregates
+
+    columns = ['date', 'product_key'] + MEASURES
+    dim_product = dimensions.load_dimension(dimensions.PRODUCT_DIM_PATH)
+    start_date, end_date = storage.date_range(master_path)
+    parts = []
+    for month in pd.period_range(start_date, end_date, freq='M'):
+        chunk = storage.load_table(master_path, columns=columns,
+                                   start_date=month.start_time, end_date=month.end_time.normalize())
+        if len(chunk):
+            parts.append(partial_aggregates(chunk, dim_product))
+    aggregates = combine_aggregates(parts)
+    save_aggregates(aggregates)
+    return aggregates
+
+def update_aggregates(previous_rows, current_rows, dim_product=None):
+    """Apply an incremental master-table update to the stored aggregates.
+    previous_rows/current_rows are the master rows of the reprocessed days before and
+    after the update. Those days are whole, so their daily rows are replaced (only the
+    months they fall into are rewritten), and product totals move by the window's
+    delta (current minus previous). The rolling KPIs are re-derived from the daily totals."""
+    if not storage.table_exists(f"{AGGREGATES_PATH}/product_totals"):
+        return refresh_aggregates()
+    if dim_product is None:
+        dim_product = dimensions.load_dimension(dimensions.PRODUCT_DIM_PATH)
+    previous = partial_aggregates(previous_rows, dim_product)
+    current = partial_aggregates(current_rows, dim_product)
+
+    storage.upsert_table(current['daily_totals'], f"{AGGREGATES_PATH}/daily_totals", keys=['date'])
+    storage.upsert_table(current['daily_by_category'], f"{AGGREGATES_PATH}/daily_by_category", keys=['date'])
+
+    removed = previous['product_totals'].assign(**{m: -previous['product_totals'][m] for m in MEASURES})
+    product_totals = _sum_product_totals(pd.concat([load_aggregate('product_totals'), current['product_totals'], removed],
+                                                   ignore_index=True))
+    storage.save_table(product_totals, f"{AGGREGATES_PATH}/product_totals")
+
+    daily_totals = load_aggregate('daily_totals')
+    kpis = rolling_kpis(daily_totals)
+    storage.save_table(kpis, f"{AGGREGATES_PATH}/rolling_kpis")
+    return {
+        'daily_totals': daily_totals,
+        'daily_by_category': load_aggregate('daily_by_category'),
+        'product_totals': product_totals,
+        'rolling_kpis': kpis
+    }
+
+def load_aggregate(name, columns=None):
+    return storage.load_table(f"{AGGREGATES_PATH}/{name}", columns=columns)
+
+def lttb_indices(x, y, n_out):
+    """Largest-Triangle-Three-Buckets: indices of n_out points that keep the visual
+    shape of the line (peaks and dips survive, unlike plain striding)."""
+    n = len(y)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+
+    # First and last points are kept; the rest is split into n_out - 2 buckets
+    edges = np.linspace(1, n - 1, n_out - 1).astype(int)
+    selected = np.empty(n_out, dtype=int)
+    selected[0], selected[-1] = 0, n - 1
+    previous = 0
+    for i in range(n_out - 2):
+        start, end = edges[i], edges[i + 1]
+        # Average of the next bucket (the last point for the final bucket)
+        next_start, next_end = (edges[i + 1], edges[i + 2]) if i + 2 < len(edges) else (n - 1, n)
+        avg_x, avg_y = x[next_start:next_end].mean(), y[next_start:next_end].mean()
+        area = np.abs((x[previous] - avg_x) * (y[start:end] - y[previous]) -
+                      (x[previous] - x[start:end]) * (avg_y - y[previous]))
+        previous = start + int(area.argmax())
+        selected[i + 1] = previous
+    return selected
+
+def minmax_indices(y, n_out):
+    # Min and max of each of n_out / 2 equal buckets, in order
+    n = len(y)
+    if n_out >= n or n_out < 2:
+        return np.arange(n)
+    buckets = n_out // 2
+    size = int(np.ceil(n / buckets))
+    padded = np.full(buckets * size, np.nan)
+    padded[:n] = y
+    padded = padded.reshape(buckets, size)
+    offsets = np.arange(buckets) * size
+    valid = ~np.isnan(padded).all(axis=1)
+    low = offsets[valid] + np.nanargmin(padded[valid], axis=1)
+    high = offsets[valid] + np.nanargmax(padded[valid], axis=1)
+    return np.unique(np.concatenate([low, high]))
+
+def downsample(df, x, y, max_points=MAX_CHART_POINTS, method='lttb'):
+    """Thin df to at most max_points rows for plotting, choosing rows by column y."""
+    if len(df) <= max_points:
+        return df
+    values = df[y].to_numpy(dtype=float)
+    if method == 'minmax':
+        idx = minmax_indices(values, max_points)
+    else:
+        x_values = df[x]
+        if pd.api.types.is_datetime64_any_dtype(x_values):
+            x_values = x_values.astype('int64') / 86_400e9
+        idx = lttb_indices(x_values.to_numpy(dtype=float), values, max_points)
+    return df.iloc[idx]
@@ -0,0 +1,200 @@
+"""
+Backtesting Module
+
+Rolling-origin evaluation of the forecasting models. Instead of one 30-day
+holdout, every model is re-trained at many forecast origins (expanding window,
+or a fixed-length rolling window) and scored at every horizon:
+- Models are registered in MODELS; each one runs a whole block of origins, so it
+  can carry its state from one origin to the next instead of cold-fitting
+- Work is split into (series chunk x origin block) tasks across a process pool
+- Results: a long forecast table and MAPE/WAPE/RMSE/MAE/bias per origin, series and horizon
+"""
+
+import argparse
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+import storage
+from forecasting import (SEASONAL_PERIODS, load_data, load_product_data, train_exponential_smoothing,
+                         fit_holt_winters_batch, refit_holt_winters_batch, hw_filter, hw_forecast)
+
+# Defaults
+BACKTEST_INITIAL_DAYS = 180      # History before the first origin
+BACKTEST_STEP_DAYS = 7           # Days between origins
+BACKTEST_HORIZON = 30
+BACKTEST_REFIT_EVERY_DAYS = 28   # Kernel model: roll state forward between refits
+BACKTEST_SERIES_CHUNK = 500      # Series per task
+
+MODELS = {}
+
+def register_model(name):
+    # A model is fn(Y, origins, horizon, window) -> forecasts (len(origins), N, horizon),
+    # where Y is (N, T) and origin o means "trained on days < o"
+    def decorator(fn):
+        MODELS[name] = fn
+        return fn
+    return decorator
+
+def _train_slice(o, window):
+    return slice(0 if window is None else max(0, o - window), o)
+
+@register_model('holt_winters')
+def backtest_holt_winters(Y, origins, horizon, window=None):
+    # Vectorized kernel over all series. With an expanding window the state is rolled
+    # forward between adjacent origins and the parameters re-estimated (warm-started)
+    # every BACKTEST_REFIT_EVERY_DAYS; a rolling window needs a fit per origin.
+    forecasts = np.empty((len(origins), Y.shape[0], horizon))
+    model, fitted_at, previous = None, None, None
+    for k, o in enumerate(origins):
+        if window is not None:
+            model = fit_holt_winters_batch(Y[:, _train_slice(o, window)])
+        elif model is None:
+            model, fitted_at = fit_holt_winters_batch(Y[:, :o]), o
+        elif o - fitted_at >= BACKTEST_REFIT_EVERY_DAYS:
+            model, fitted_at = refit_holt_winters_batch(Y[:, :o], model['params'], model['initial']), o
+        else:
+            _, state = hw_filter(Y[:, previous:o], model['params'], model)
+            model = {**model, **state}
+        previous = o
+        forecasts[k] = hw_forecast(model, horizon)
+    return forecasts
+
+@register_model('holt_winters_statsmodels')
+def backtest_train_exponential_smoothing(Y, origins, horizon, window=None):
+    # forecasting.train_exponential_smoothing as used by the pipeline: one cold
+    # statsmodels fit per series and origin
+    forecasts = np.empty((len(origins), Y.shape[0], horizon))
+    for k, o in enumerate(origins):
+        train_slice = _train_slice(o, window)
+        dates = pd.date_range("2000-01-01", periods=o + horizon)
+        test_data = pd.DataFrame(index=dates[o:])
+        for i, y in enumerate(Y):
+            train_data = pd.DataFrame({'revenue': y[train_slice]}, index=dates[train_slice])
+            forecast, _, _ = train_exponential_smoothing(train_data, test_data, horizon=0)
+            forecasts[k, i] = np.asarray(forecast)
+    return forecasts
+
+@register_model('seasonal_naive')
+def backtest_seasonal_naive(Y, origins, horizon, window=None):
+    # Repeat the last observed week
+    h = np.arange(horizon)
+    forecasts = np.empty((len(origins), Y.shape[0], horizon))
+    for k, o in enumerate(origins):
+        forecasts[k] = Y[:, o - SEASONAL_PERIODS + h % SEASONAL_PERIODS]
+    return forecasts
+
+def make_origins(n_obs, initial=BACKTEST_INITIAL_DAYS, step=BACKTEST_STEP_DAYS):
+    # Origins (index of the first forecast day) that leave at least one actual to score
+    return np.arange(initial, n_obs, step)
+
+def _run_task(task):
+    model_name, Y, origins, horizon, window = task
+    return MODELS[model_name](Y, origins, horizon, window)
+
+def run_backtest(demand, model_names, origins, horizon=BACKTEST_HORIZON, window=None, workers=None,
+                 origin_blocks=None):
+    # demand: DataFrame (days x series). Returns the long table of forecasts vs actuals.
+    Y = demand.to_numpy(dtype=float).T
+    series_chunks = [np.arange(start, min(start + BACKTEST_SERIES_CHUNK, Y.shape[0]))
+                     for start in range(0, Y.shape[0], BACKTEST_SERIES_CHUNK)]
+    # Fewer origin blocks = more state reuse, more blocks = more parallelism
+    if origin_blocks is None:
+        origin_blocks = max(1, (workers or os.cpu_count()) // len(series_chunks))
+    blocks = [block for block in np.array_split(origins, min(origin_blocks, len(origins))) if len(block)]
+
+    work = [(name, chunk, block) for name in model_names for chunk in series_chunks for block in blocks]
+    tasks = [(name, Y[chunk], block, horizon, window) for name, chunk, block in work]
+    if workers == 1:
+        results = list(map(_run_task, tasks))
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(_run_task, tasks))
+
+    # Actuals for every (origin, horizon) pair; NaN past the end of the history
+    target = origins[:, None] + np.arange(horizon)[None, :]
+    padded = np.concatenate([Y, np.full((Y.shape[0], horizon), np.nan)], axis=1)
+    actuals = padded[:, target].transpose(1, 0, 2)                      # (origins, N, horizon)
+    origin_position = {o: k for k, o in enumerate(origins)}
+
+    frames = []
+    for (name, chunk, block), forecasts in zip(work, results):
+        shape = (len(block), len(chunk), horizon)
+        day = block[:, None, None] + np.arange(horizon)[None, None, :]
+        frames.append(pd.DataFrame({
+            'model': name,
+            'series_id': np.broadcast_to(demand.columns[chunk].to_numpy()[None, :, None], shape).ravel(),
+            'origin': np.broadcast_to(demand.index[block].to_numpy()[:, None, None], shape).ravel(),
+            'horizon': np.broadcast_to(np.arange(1, horizon + 1)[None, None, :], shape).ravel(),
+            'date': demand.index[0] + pd.to_timedelta(np.broadcast_to(day, shape).ravel(), unit='D'),
+            'actual': actuals[[origin_position[o] for o in block]][:, chunk].ravel(),
+            'forecast': forecasts.ravel()
+        }))
+    results_df = pd.concat(frames, ignore_index=True)
+    return results_df[results_df['actual'].notna()].reset_index(drop=True)
+
+def summarize(results_df, by):
+    # MAPE skips zero actuals (undefined); WAPE = sum|error| / sum|actual| stays
+    # defined for intermittent SKU demand
+    df = results_df.assign(
+        error=results_df['forecast'] - results_df['actual'],
+        abs_error=(results_df['forecast'] - results_df['actual']).abs(),
+        abs_actual=results_df['actual'].abs()
+    )
+    df['ape'] = (df['abs_error'] / df['abs_actual']).where(df['abs_actual'] > 0)
+    df['squared_error'] = df['error'] ** 2
+    metrics = df.groupby(by, observed=True).agg(
+        n=('error', 'size'),
+        mape=('ape', 'mean'),
+        abs_error=('abs_error', 'sum'),
+        abs_actual=('abs_actual', 'sum'),
+        mse=('squared_error', 'mean'),
+        mae=('abs_error', 'mean'),
+        bias=('error', 'mean')
+    ).reset_index()
+    metrics['wape'] = metrics['abs_error'] / metrics['abs_actual'].where(metrics['abs_actual'] > 0)
+    metrics['rmse'] = np.sqrt(metrics['mse'])
+    return metrics[by + ['n', 'mape', 'wape', 'rmse', 'mae', 'bias']]
+
+def metrics_table(results_df):
+    # One table with metrics per origin, per series and per horizon
+    tables = []
+    for level in ['origin', 'series_id', 'horizon']:
+        table = summarize(results_df, ['model', level]).rename(columns={level: 'key'})
+        table.insert(1, 'level', level)
+        table['key'] = table['key'].astype(str)
+        tables.append(table)
+    return pd.concat(tables, ignore_index=True)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rolling-origin backtest of the forecasting models")
+    parser.add_argument("--models", nargs='+', default=['holt_winters', 'seasonal_naive'], choices=sorted(MODELS))
+    parser.add_argument("--level", choices=['total', 'product'], default='total',
+                        help="Backtest total revenue or per-product demand")
+    parser.add_argument("--initial", type=int, default=BACKTEST_INITIAL_DAYS)
+    parser.add_argument("--step", type=int, default=BACKTEST_STEP_DAYS)
+    parser.add_argument("--horizon", type=int, default=BACKTEST_HORIZON)
+    parser.add_argument("--window", type=int, default=None, help="Rolling window length (default: expanding)")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: all cores)")
+    args = parser.parse_args()
+
+    print("Loading data for Backtesting...")
+    if args.level == 'total':
+        demand = load_data().rename(columns={'revenue': 'total_revenue'})
+    else:
+        demand = load_product_data()
+    origins = make_origins(len(demand), args.initial, args.step)
+    print(f"{demand.shape[1]} series x {len(origins)} origins x {args.horizon} days, models: {', '.join(args.models)}")
+
+    results_df = run_backtest(demand, args.models, origins, args.horizon, args.window, args.workers)
+    metrics_df = metrics_table(results_df)
+    storage.save_table(results_df, f"data/predictions/backtest_{args.level}")
+    storage.save_table(metrics_df, f"data/predictions/backtest_{args.level}_metrics", export_csv=True)
+
+    print("\n" + "=" * 50)
+    print("BACKTEST SUMMARY")
+    print("=" * 50)
+    print(summarize(results_df, ['model']).to_string(index=False))
+    print(f"\n✓ Saved backtest results to data/predictions/backtest_{args.level}_metrics.csv")
@@ -4,21 +4,35 @@ import plotly.express as px
 import plotly.graph_objects as go
 import os
 
+import storage
+import aggregates
+
 # Page Config
 st.set_page_config(page_title="Retail Forecasting Dashboard", layout="wide")
 
-@st.cache_data
-def load_data():
-    master_table = pd.read_csv("data/processed/master_table.csv", parse_dates=['date'])
-    forecasts = pd.read_csv("data/predictions/forecast_30days.csv", parse_dates=['date'])
-    recommendations = pd.read_csv("data/optimization/inventory_recommendations.csv")
-    return master_table, forecasts, recommendations
+# Loaded frames are shared by all sessions; with copy-on-write, anything a page
+# derives from them is a copy rather than a view that could write into the cache
+pd.set_option("mode.copy_on_write", True)
+
+@st.cache_resource(max_entries=32, show_spinner=False)
+def _load_shared(path, signature):
+    # One copy per process for all sessions. The file signature is part of the cache
+    # key, so a table rewritten by the pipeline is reloaded on the next rerun and
+    # the stale entry ages out.
+    return storage.load_table(path)
+
+def load_table(path):
+    # Pages load only the tables they show
+    signature = storage.table_signature(path)
+    if not signature:
+        st.error("Data files not found. Please run the data pipeline first.")
+        st.stop()
+    return _load_shared(path, signature)
 
-try:
-    master_table, forecasts, recommendations = load_data()
-except FileNotFoundError:
-    st.error("Data files not found. Please run the data pipeline first.")
-    st.stop()
+def load_aggregate(name):
+    # Pre-aggregated tables written by the pipeline, so page cost does not grow
+    # with the raw history
+    return load_table(f"{aggregates.AGGREGATES_PATH}/{name}")
 
 # Sidebar
 st.sidebar.title("🧭 Navigation")
@@ -27,10 +41,12 @@ page = st.sidebar.radio("Go to", ["Overview", "Sales Analytics", "Forecast", "In
 if page == "Overview":
     st.title("📊 Retail Business Overview")
     
+    daily_totals = load_aggregate('daily_totals')
+    
     # Key Metrics
-    total_revenue = master_table['revenue'].sum()
-    total_profit = master_table['profit'].sum()
-    total_sales_qty = master_table['quantity'].sum()
+    total_revenue = daily_totals['revenue'].sum()
+    total_profit = daily_totals['profit'].sum()
+    total_sales_qty = daily_totals['quantity'].sum()
     
     col1, col2, col3 = st.columns(3)
     col1.metric("Total Revenue", f"${total_revenue:,.2f}")
@@ -39,28 +55,46 @@ if page == "Overview":
     
     # Recent Trend
     st.subheader("Recent Sales Trend (Last 30 Days)")
-    recent_sales = master_table.groupby('date')['revenue'].sum().tail(30).reset_index()
+    recent_sales = daily_totals[['date', 'revenue']].tail(30)
     fig = px.line(recent_sales, x='date', y='revenue', title="Daily Revenue")
     st.plotly_chart(fig, use_container_width=True)
+    
+    # Full history, thinned to a fixed number of points before plotting
+    st.subheader("Revenue History")
+    history = daily_totals[['date', 'revenue']].merge(load_aggregate('rolling_kpis')[['date', 'revenue_28d']], on='date')
+    history = aggregates.downsample(history, 'date', 'revenue')
+    fig_history = px.line(history, x='date', y=['revenue', 'revenue_28d'], title="Daily Revenue and 28-Day Average")
+    st.plotly_chart(fig_history, use_container_width=True)
 
 elif page == "Sales Analytics":
     st.title("📈 Sales Analytics")
     
     # Top Products
-    top_products = master_table.groupby('product_name')['revenue'].sum().sort_values(ascending=False).head(10).reset_index()
+    product_totals = load_aggregate('product_totals')
+    top_products = product_totals.nlargest(10, 'revenue')[['product_name', 'revenue']]
     fig_top = px.bar(top_products, x='revenue', y='product_name', orientation='h', title="Top 10 Products by Revenue")
     st.plotly_chart(fig_top, use_container_width=True)
     
     # Category Performance
-    cat_perf = master_table.groupby('category')['revenue'].sum().reset_index()
+    cat_perf = product_totals.groupby('category', observed=True)['revenue'].sum().reset_index()
     fig_cat = px.pie(cat_perf, values='revenue', names='category', title="Revenue by Category")
     st.plotly_chart(fig_cat, use_container_width=True)
+    
+    # Category trend, each line thinned on its own
+    daily_by_category = load_aggregate('daily_by_category')
+    max_points = aggregates.MAX_CHART_POINTS // max(1, daily_by_category['category'].nunique())
+    cat_trend = pd.concat([aggregates.downsample(group, 'date', 'revenue', max_points)
+                           for _, group in daily_by_category.groupby('category', observed=True)])
+    fig_trend = px.line(cat_trend, x='date', y='revenue', color='category', title="Daily Revenue by Category")
+    st.plotly_chart(fig_trend, use_container_width=True)
 
 elif page == "Forecast":
     st.title("🔮 Demand Forecast (Next 30 Days)")
     
+    forecasts = load_table("data/predictions/forecast_30days")
+    
     # Historical + Forecast
-    historical = master_table.groupby('date')['revenue'].sum().reset_index()
+    historical = load_aggregate('daily_totals')[['date', 'revenue']].copy()
     historical['Type'] = 'Historical'
     
     forecast_plot = forecasts.copy()
@@ -73,10 +107,32 @@ elif page == "Forecast":
     st.plotly_chart(fig, use_container_width=True)
     
     st.dataframe(forecasts.head(10))
+    
+    # Per-category forecasts from the hierarchical mode (src/hierarchical.py), if it has been run
+    hierarchy_path = "data/predictions/hierarchical_forecast"
+    if storage.table_signature(hierarchy_path):
+        st.subheader("Forecast by Category")
+        hierarchy = load_table(hierarchy_path)
+        category_rows = hierarchy[hierarchy['level'] == 'category']
+        category = st.selectbox("Category", sorted(category_rows['node'].unique()))
+        
+        daily_by_category = load_aggregate('daily_by_category')
+        category_history = daily_by_category[daily_by_category['category'] == category][['date', 'revenue']].tail(90)
+        category_history['Type'] = 'Historical'
+        category_forecast = category_rows[category_rows['node'] == category][['date', 'mint']]
+        category_forecast = category_forecast.rename(columns={'mint': 'revenue'})
+        category_forecast['Type'] = 'Forecast'
+        
+        fig_category = px.line(pd.concat([category_history, category_forecast]), x='date', y='revenue', color='Type',
+                               title=f"Sales Forecast: {category}")
+        st.plotly_chart(fig_category, use_container_width=True)
+        st.caption("Product, category and total forecasts are reconciled (MinT), so they add up across levels.")
 
 elif page == "Inventory Optimization":
     st.title("📦 Inventory Optimization")
     
+    recommendations = load_table("data/optimization/inventory_recommendations")
+    
     # Risk Summary
     risk_counts = recommendations['risk_status'].value_counts().reset_index()
     risk_counts.columns = ['Status', 'Count']
@@ -91,6 +147,9 @@ elif page == "Inventory Optimization":
     
     st.subheader("🟠 Overstock Alerts - Run Promotions")
     overstock_list = recommendations[recommendations['risk_status'] == 'Overstock - Reduce']
+    # Demand rates are not in the recommendations table; they come with the saved product metrics
+    product_metrics = load_table("data/optimization/product_metrics")[['product_id', 'avg_daily_sales']]
+    overstock_list = overstock_list.merge(product_metrics, on='product_id', how='left')
     st.dataframe(overstock_list[['product_name', 'category', 'stock_on_hand', 'avg_daily_sales']])
 
 st.sidebar.info("Built with Streamlit & Python")
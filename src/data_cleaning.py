@@ -1,92 +1,268 @@
 import pandas as pd
 import numpy as np
 import os
+import json
+import argparse
+
+import storage
+from instrumentation import instrument
+import aggregates
+import demand_tensor
+import feature_store
+import dimensions
+import query_engine
 
 # Paths
 RAW_DATA_PATH = "data/raw"
 PROCESSED_DATA_PATH = "data/processed"
 os.makedirs(PROCESSED_DATA_PATH, exist_ok=True)
 
+# Streaming mode: raw history is cleaned one period at a time (pandas period alias)
+STREAM_CHUNK_FREQ = 'M'
+
+# Incremental mode: last raw date processed, and how many days before it are reprocessed
+WATERMARK_FILE = f"{PROCESSED_DATA_PATH}/_watermark.json"
+LATE_ARRIVAL_DAYS = 3
+
+@instrument("Loading data...")
 def load_data():
-    print("Loading data...")
-    sales = pd.read_csv(f"{RAW_DATA_PATH}/sales.csv")
-    inventory = pd.read_csv(f"{RAW_DATA_PATH}/inventory.csv")
-    products = pd.read_csv(f"{RAW_DATA_PATH}/products.csv")
-    suppliers = pd.read_csv(f"{RAW_DATA_PATH}/suppliers.csv")
+    sales = storage.load_table(f"{RAW_DATA_PATH}/sales")
+    inventory = storage.load_table(f"{RAW_DATA_PATH}/inventory")
+    products = storage.load_table(f"{RAW_DATA_PATH}/products")
+    suppliers = storage.load_table(f"{RAW_DATA_PATH}/suppliers")
     return sales, inventory, products, suppliers
 
-def clean_data(sales, inventory, products, suppliers):
-    print("Cleaning and merging data...")
-    
+def with_product_keys(df, dim_product, label):
+    # Replace product_id with its surrogate key; rows for products missing from the
+    # dimension cannot be keyed and are dropped
+    keys = dimensions.product_keys(df['product_id'], dim_product)
+    unknown = keys < 0
+    if unknown.any():
+        print(f"  Dropping {unknown.sum():,} {label} rows with unknown product_ids")
+    keyed = df.drop(columns='product_id')
+    keyed.insert(df.columns.get_loc('product_id'), 'product_key', keys)
+    return keyed[~unknown] if unknown.any() else keyed
+
+@instrument("Cleaning and keying data...")
+def clean_data(sales, inventory, products, suppliers, calendar=None, dim_product=None):
     # Date conversion
     sales['date'] = pd.to_datetime(sales['date'])
     inventory['date'] = pd.to_datetime(inventory['date'])
     
-    # Merge Sales with Product Info
-    sales_merged = sales.merge(products, on='product_id', how='left')
-    
-    # Merge with Supplier Info
-    sales_merged = sales_merged.merge(suppliers, on='supplier_id', how='left')
+    # Star schema: the fact rows keep the int32 product_key and numeric measures only;
+    # product and supplier attributes stay in the (small) product dimension
+    if dim_product is None:
+        dim_product = dimensions.product_dimension(products, dimensions.supplier_dimension(suppliers))
+    sales_merged = with_product_keys(sales.drop(columns='transaction_id', errors='ignore'), dim_product, 'sales')
     
-    # Feature Engineering
-    sales_merged['year'] = sales_merged['date'].dt.year
-    sales_merged['month'] = sales_merged['date'].dt.month
-    sales_merged['week'] = sales_merged['date'].dt.isocalendar().week
-    sales_merged['day_of_week'] = sales_merged['date'].dt.dayofweek
-    sales_merged['is_weekend'] = sales_merged['day_of_week'].apply(lambda x: 1 if x >= 5 else 0)
+    # Feature Engineering: calendar columns are looked up in the date dimension
+    # (one row per day) instead of being derived row by row
+    if calendar is None:
+        dates = sales_merged['date'] if len(sales_merged) else inventory['date']
+        calendar = feature_store.date_dimension(dates.min(), dates.max())
+    sales_merged = feature_store.attach_calendar(sales_merged, calendar)
     
-    sales_merged['revenue'] = sales_merged['quantity'] * sales_merged['selling_price']
-    sales_merged['profit'] = sales_merged['revenue'] - (sales_merged['quantity'] * sales_merged['cost_price'])
+    # Prices are looked up by key (array indexing) instead of merged in
+    keys = sales_merged['product_key'].to_numpy()
+    selling_price = dim_product['selling_price'].to_numpy()[keys]
+    cost_price = dim_product['cost_price'].to_numpy()[keys]
+    sales_merged['revenue'] = sales_merged['quantity'] * selling_price
+    sales_merged['profit'] = sales_merged['revenue'] - (sales_merged['quantity'] * cost_price)
     
     # Sort by date
     sales_merged = sales_merged.sort_values(by='date').reset_index(drop=True)
     
     return sales_merged
 
+@instrument("Creating daily aggregations...")
 def aggregate_data(sales_merged):
-    print("Creating daily aggregations...")
     # Daily Sales per Product
-    daily_sales = sales_merged.groupby(['date', 'product_id']).agg({
-        'quantity': 'sum',
-        'revenue': 'sum',
-        'profit': 'sum'
-    }).reset_index()
+    daily_sales = query_engine.group_sum(sales_merged, ['date', 'product_key'], ['quantity', 'revenue', 'profit'])
     
     return daily_sales
 
-if __name__ == "__main__":
-    sales, inventory, products, suppliers = load_data()
-    
-    # Clean Sales Data
-    cleaned_sales = clean_data(sales, inventory, products, suppliers)
-    
-    # Save cleaned transaction data
-    cleaned_sales.to_csv(f"{PROCESSED_DATA_PATH}/sales_cleaned.csv", index=False)
-    
-    # Aggregate to Daily Level (Master Table for Forecasting)
-    daily_sales = aggregate_data(cleaned_sales)
-    
+@instrument()
+def build_master_table(daily_sales, inventory, dim_product):
     # Merge Daily Sales with Inventory Snapshot
-    # Note: Inventory snapshot is daily, so we can merge directly
-    inventory['date'] = pd.to_datetime(inventory['date'])
-    master_table = daily_sales.merge(inventory, on=['date', 'product_id'], how='outer')
+    # Note: Inventory snapshot is daily, so we can merge directly (on the int keys)
+    inventory = with_product_keys(inventory.assign(date=pd.to_datetime(inventory['date'])), dim_product, 'inventory')
+    master_table = daily_sales.merge(inventory, on=['date', 'product_key'], how='outer')
     
     # Fill missing values for sales (days with no sales = 0 sales)
     # Be careful: No sales could mean no demand OR stockout. 
     # For now, we fill sales with 0, but we will deal with stockouts in analysis.
-    master_table['quantity'].fillna(0, inplace=True)
-    master_table['revenue'].fillna(0, inplace=True)
-    master_table['profit'].fillna(0, inplace=True)
+    master_table['quantity'] = master_table['quantity'].fillna(0)
+    master_table['revenue'] = master_table['revenue'].fillna(0)
+    master_table['profit'] = master_table['profit'].fillna(0)
     
     # Fill missing stock (if any) with 0? Or ffill?
     # Assuming inventory snapshot is comprehensive, missing means 0 or missing data.
     # Let's assume 0 stock for now if missing in inventory table but present in sales (rare)
-    master_table['stock_on_hand'].fillna(0, inplace=True) 
+    master_table['stock_on_hand'] = master_table['stock_on_hand'].fillna(0)
+    
+    # Product details are not merged back in: consumers attach them by key (dimensions.attach)
+    return master_table
 
-    # Re-merge product details to master table
-    master_table = master_table.merge(products, on='product_id', how='left')
+def clean_data_streaming(dim_product, chunk_freq=STREAM_CHUNK_FREQ):
+    # Bounded-memory variant of the batch pipeline: sales and inventory are read one
+    # date-ordered chunk at a time (date pushdown in storage), joined against the small
+    # in-memory products/suppliers dimensions, aggregated and appended to the outputs.
+    # Peak memory is set by the chunk size, not by the length of the history.
+    sales_start, sales_end = storage.date_range(f"{RAW_DATA_PATH}/sales")
+    inventory_start, inventory_end = storage.date_range(f"{RAW_DATA_PATH}/inventory")
+    periods = pd.period_range(min(sales_start, inventory_start), max(sales_end, inventory_end), freq=chunk_freq)
+    calendar = feature_store.date_dimension(periods[0].start_time, periods[-1].end_time)
+    
+    total_rows = 0
+    for i, period in enumerate(periods):
+        start_date, end_date = period.start_time, period.end_time
+        sales = storage.load_table(f"{RAW_DATA_PATH}/sales", start_date=start_date, end_date=end_date)
+        inventory = storage.load_table(f"{RAW_DATA_PATH}/inventory", start_date=start_date, end_date=end_date)
+        
+        cleaned_sales = clean_data(sales, inventory, None, None, calendar=calendar, dim_product=dim_product)
+        master_chunk = build_master_table(aggregate_data(cleaned_sales), inventory, dim_product)
+        
+        # First chunk replaces any previous output, later chunks are appended
+        write = storage.save_table if i == 0 else storage.append_table
+        write(cleaned_sales, f"{PROCESSED_DATA_PATH}/sales_cleaned")
+        write(master_chunk, f"{PROCESSED_DATA_PATH}/master_table")
+        
+        total_rows += len(master_chunk)
+        print(f"  ...{period}: {len(sales):,} transactions, {len(master_chunk):,} master rows")
+    
+    return total_rows
+
+def read_watermark():
+    if not os.path.exists(WATERMARK_FILE):
+        return None
+    with open(WATERMARK_FILE) as f:
+        return pd.Timestamp(json.load(f)['max_date'])
+
+def write_watermark(max_date):
+    with open(WATERMARK_FILE, 'w') as f:
+        json.dump({'max_date': pd.Timestamp(max_date).strftime("%Y-%m-%d")}, f)
+
+def raw_max_date():
+    return max(storage.date_range(f"{RAW_DATA_PATH}/sales")[1], storage.date_range(f"{RAW_DATA_PATH}/inventory")[1])
+
+def clean_data_incremental(dim_product, late_days=LATE_ARRIVAL_DAYS):
+    # Process only raw rows after the watermark, plus a late-arrival window before it.
+    # Every (date, product_id) in that window is recomputed from raw and merged into the
+    # existing outputs; month partitions outside the window are not touched. The dashboard
+    # aggregates are adjusted by the window's delta instead of being rebuilt.
+    watermark = read_watermark()
+    start_date = watermark + pd.Timedelta(days=1 - late_days)
+    
+    sales = storage.load_table(f"{RAW_DATA_PATH}/sales", start_date=start_date)
+    inventory = storage.load_table(f"{RAW_DATA_PATH}/inventory", start_date=start_date)
+    if len(sales) == 0 and len(inventory) == 0:
+        return 0, 0
+    
+    cleaned_sales = clean_data(sales, inventory, None, None, dim_product=dim_product)
+    master_rows = build_master_table(aggregate_data(cleaned_sales), inventory, dim_product)
+    
+    # Every raw transaction of a reprocessed day is in the window, so cleaned sales are
+    # replaced by day (the fact rows carry no transaction id)
+    storage.upsert_table(cleaned_sales, f"{PROCESSED_DATA_PATH}/sales_cleaned", keys=['date'])
+    # The window's master rows before and after the upsert give the aggregates' delta
+    master_path = f"{PROCESSED_DATA_PATH}/master_table"
+    master_columns = ['date', 'product_key'] + aggregates.MEASURES
+    previous_rows = storage.load_table(master_path, columns=master_columns, start_date=start_date)
+    storage.upsert_table(master_rows, master_path, keys=['date', 'product_key'])
+    aggregates.update_aggregates(previous_rows, storage.load_table(master_path, columns=master_columns,
+                                                                   start_date=start_date), dim_product)
+    # Either side may have no rows in the window (NaT max), so NaT is skipped
+    write_watermark(pd.Series([sales['date'].max(), inventory['date'].max()]).max())
+    
+    return len(sales), len(master_rows)
+
+def update_feature_store(since=None):
+    # Date dimension over the master table's range, and the per-SKU window features
+    # (recomputed only from the first day whose inputs changed; `since` is passed on
+    # to feature_store.update_features)
+    storage.save_table(feature_store.date_dimension(*storage.date_range(f"{PROCESSED_DATA_PATH}/master_table")),
+                       feature_store.DATE_DIM_PATH)
+    mode = feature_store.update_features(since=since)
+    print(f"Feature store: {mode} update")
+
+def run_full_build(sales, inventory, products, suppliers, export_csv=False):
+    # Product/supplier dimensions with stable surrogate keys
+    dim_product = dimensions.update_dimensions(products, suppliers)
+    
+    # Clean Sales Data
+    cleaned_sales = clean_data(sales, inventory, products, suppliers, dim_product=dim_product)
+    
+    # Save cleaned transaction data
+    storage.save_table(cleaned_sales, f"{PROCESSED_DATA_PATH}/sales_cleaned", export_csv=export_csv)
+    
+    # Aggregate to Daily Level (Master Table for Forecasting)
+    daily_sales = aggregate_data(cleaned_sales)
+    master_table = build_master_table(daily_sales, inventory, dim_product)
     
     print(f"Master Table Shape: {master_table.shape}")
-    master_table.to_csv(f"{PROCESSED_DATA_PATH}/master_table.csv", index=False)
+    storage.save_table(master_table, f"{PROCESSED_DATA_PATH}/master_table", export_csv=export_csv)
+    
+    # Dense (day x SKU) matrices for the analytics stages, and the features built on them
+    demand_tensor.tensor_from_master(master_table, dim_product)
+    update_feature_store()
+    
+    # Materialized summaries for the dashboard
+    aggregates.save_aggregates(aggregates.build_aggregates(master_table, dim_product))
+    return master_table
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Clean raw data and build the master table")
+    parser.add_argument("--export-csv", action="store_true", help="Also write CSV copies of the processed tables")
+    parser.add_argument("--stream", action="store_true",
+                        help="Process the raw history in date-ordered chunks to bound memory use")
+    parser.add_argument("--chunk-freq", default=STREAM_CHUNK_FREQ,
+                        help="Chunk length for --stream as a pandas period alias (e.g. W, M, Q)")
+    parser.add_argument("--incremental", action="store_true",
+                        help="Only process raw rows after the last run's watermark (full build if none)")
+    parser.add_argument("--late-days", type=int, default=LATE_ARRIVAL_DAYS,
+                        help="Days before the watermark to reprocess for late-arriving rows")
+    args = parser.parse_args()
+    
+    # Incremental runs extend a keyed build (the dimensions fix the product keys)
+    incremental = (args.incremental and read_watermark() is not None and
+                   storage.table_exists(f"{PROCESSED_DATA_PATH}/master_table") and
+                   storage.table_exists(dimensions.PRODUCT_DIM_PATH))
+    if args.incremental and not incremental:
+        print("No watermark or master table found - running a full build.")
+    
+    if incremental:
+        dim_product = dimensions.update_dimensions(storage.load_table(f"{RAW_DATA_PATH}/products"),
+                                                   storage.load_table(f"{RAW_DATA_PATH}/suppliers"))
+        print(f"Incremental update from watermark {read_watermark().date()} (late window: {args.late_days} days)")
+        window_start = read_watermark() + pd.Timedelta(days=1 - args.late_days)
+        # Stored digests before the window can only be trusted if the features matched
+        # the tensor, and the tensor the master table, before this run
+        features_current = feature_store.is_current()
+        sales_rows, master_rows = clean_data_incremental(dim_product, late_days=args.late_days)
+        print(f"Reprocessed {sales_rows:,} transactions into {master_rows:,} master rows")
+        if args.export_csv:
+            storage.export_csv(f"{PROCESSED_DATA_PATH}/sales_cleaned")
+            storage.export_csv(f"{PROCESSED_DATA_PATH}/master_table")
+        # The tensor is extended in place; it is only rebuilt if the SKU set changed
+        tensor_mode = demand_tensor.update_tensor(window_start, dim_product=dim_product)
+        print(f"Demand tensor: {tensor_mode} update")
+        update_feature_store(since=window_start if features_current and tensor_mode == 'incremental' else None)
+    elif args.stream:
+        dim_product = dimensions.update_dimensions(storage.load_table(f"{RAW_DATA_PATH}/products"),
+                                                   storage.load_table(f"{RAW_DATA_PATH}/suppliers"))
+        total_rows = clean_data_streaming(dim_product, chunk_freq=args.chunk_freq)
+        print(f"Master Table Rows: {total_rows:,}")
+        if args.export_csv:
+            storage.export_csv(f"{PROCESSED_DATA_PATH}/sales_cleaned")
+            storage.export_csv(f"{PROCESSED_DATA_PATH}/master_table")
+        demand_tensor.build_tensor(dim_product=dim_product)
+        update_feature_store()
+        aggregates.refresh_aggregates()
+    else:
+        sales, inventory, products, suppliers = load_data()
+        run_full_build(sales, inventory, products, suppliers, export_csv=args.export_csv)
+    
+    if not incremental:
+        write_watermark(raw_max_date())
     
     print("Data cleaning complete! Files saved in data/processed/")
@@ -3,7 +3,12 @@ import numpy as np
 from faker import Faker
 import random
 from datetime import datetime, timedelta
+import argparse
 import os
+import shutil
+from concurrent.futures import ProcessPoolExecutor
+
+import storage
 
 # Initialize Faker
 fake = Faker()
@@ -18,10 +23,27 @@ START_DATE = datetime(2023, 1, 1)
 END_DATE = datetime(2023, 12, 31)
 DAYS = (END_DATE - START_DATE).days + 1
 
+# Vectorized generation settings (used with --vectorized)
+SALES_CHUNK_SIZE = 1_000_000    # Approximate number of transactions written per chunk
+DAILY_TRANSACTIONS = (20, 50)   # Base range of transactions per day before weekend/Q4 uplift
+
+# Inventory trajectories
+INVENTORY_REVIEW_DAYS = 7       # Stock is reviewed and reordered up to target once per period
+INVENTORY_SAFETY_Z = 1.0        # Safety factor of the order-up-to target
+MISSED_REVIEW_RATE = 0.05       # Share of reviews where no order is placed (causes stockouts)
+DEMAND_LOOKBACK_DAYS = 28       # Trailing window the order-up-to target is sized from
+INVENTORY_SHARD_SKUS = 5000     # SKUs per worker task
+
 # Output paths
 RAW_DATA_PATH = "data/raw"
 os.makedirs(RAW_DATA_PATH, exist_ok=True)
 
+def generation_days(start_date, end_date):
+    # Days from start_date to end_date inclusive; checked before anything is generated
+    if end_date < start_date:
+        raise ValueError(f"End date {end_date:%Y-%m-%d} is before start date {start_date:%Y-%m-%d}")
+    return (end_date - start_date).days + 1
+
 def generate_suppliers(n=10):
     suppliers = []
     for i in range(n):
@@ -85,48 +107,248 @@ def generate_sales(products_df, start_date, days):
             
     return pd.DataFrame(sales_data)
 
-def generate_inventory(products_df, start_date, days):
-    # This is a simplified inventory snapshot generation
-    # Ideally, inventory = prev_inventory - sales + restock
-    # Here we simulate random stock levels to detect stockouts/overstock
+def _uuid4_strings(n):
+    # Build UUID4 strings from random bytes without a per-row Python call:
+    # set the version/variant bits, map nibbles to hex digits and insert the dashes
+    raw = np.random.randint(0, 256, size=(n, 16)).astype(np.uint8)
+    raw[:, 6] = (raw[:, 6] & 0x0F) | 0x40
+    raw[:, 8] = (raw[:, 8] & 0x3F) | 0x80
+    nibbles = np.empty((n, 32), dtype=np.uint8)
+    nibbles[:, 0::2] = raw >> 4
+    nibbles[:, 1::2] = raw & 0x0F
+    hex_digits = np.frombuffer(b"0123456789abcdef", dtype="S1")
+    chars = np.insert(hex_digits[nibbles], [8, 12, 16, 20], b"-", axis=1)
+    return np.ascontiguousarray(chars).view("S36").ravel().astype(str)
+
+def generate_sales_vectorized(products_df, start_date, days, output_path,
+                              chunk_size=SALES_CHUNK_SIZE, daily_transactions=DAILY_TRANSACTIONS):
+    # Same weekend/Q4 seasonality as generate_sales, but all draws are NumPy arrays
+    # and rows are streamed to the `output_path` table in chunks instead of held in memory.
+    # Returns the (days x SKUs) matrix of units sold, which generate_inventory consumes.
+    if days < 1:
+        raise ValueError(f"At least one day of sales is needed, got days={days}")
+    product_ids = products_df['product_id'].to_numpy()
+    prices = products_df['selling_price'].to_numpy()
+    dates = pd.date_range(start_date, periods=days, freq='D')
     
-    inventory_data = []
-    product_ids = products_df['product_id'].tolist()
+    # Daily transaction counts (higher on weekends, higher in Q4)
+    low, high = daily_transactions
+    num_transactions = np.random.randint(low, high + 1, size=days)
+    num_transactions = np.where(dates.weekday >= 5, (num_transactions * 1.3).astype(int), num_transactions)
+    seasonality_factor = np.where(dates.month >= 10, 1.5, 1.0)
+    num_transactions = (num_transactions * seasonality_factor).astype(np.int64)
     
-    for day in range(days):
-        current_date = start_date + timedelta(days=day)
+    # Group consecutive days into blocks of roughly `chunk_size` transactions
+    cumulative = np.cumsum(num_transactions)
+    block_ends = np.searchsorted(cumulative, np.arange(chunk_size, cumulative[-1], chunk_size), side='right')
+    block_ends = np.unique(np.append(np.maximum(block_ends, 1), days))
+    
+    sales_quantity = np.zeros((days, len(product_ids)), dtype=np.int32)
+    rows_written = 0
+    block_start = 0
+    for block_end in block_ends:
+        counts = num_transactions[block_start:block_end]
+        n = int(counts.sum())
+        day_index = np.repeat(np.arange(block_start, block_end), counts)
+        product_index = np.random.randint(0, len(product_ids), size=n)
+        quantity = np.random.randint(1, 6, size=n)
         
-        for product_id in product_ids:
-            # Simulate random stock levels
-            # Occasional stockouts (0 stock)
-            if random.random() < 0.05:
-                stock_on_hand = 0
-            else:
-                stock_on_hand = random.randint(0, 100)
-            
-            inventory_data.append({
-                "date": current_date.strftime("%Y-%m-%d"),
-                "product_id": product_id,
-                "stock_on_hand": stock_on_hand
-            })
-            
-    return pd.DataFrame(inventory_data)
+        chunk = pd.DataFrame({
+            "transaction_id": _uuid4_strings(n),
+            "date": dates[day_index],
+            "product_id": product_ids[product_index],
+            "quantity": quantity,
+            "total_amount": np.round(quantity * prices[product_index], 2)
+        })
+        block_cells = (block_end - block_start) * len(product_ids)
+        sales_quantity[block_start:block_end] += np.bincount(
+            (day_index - block_start) * len(product_ids) + product_index, weights=quantity, minlength=block_cells
+        ).reshape(-1, len(product_ids)).astype(np.int32)
+        
+        if rows_written == 0:
+            storage.save_table(chunk, output_path)
+        else:
+            storage.append_table(chunk, output_path)
+        
+        rows_written += n
+        block_start = block_end
+        print(f"  ...{rows_written:,} transactions written (through {dates[block_end - 1].date()})")
+    
+    return sales_quantity
+
+def daily_quantity(sales_df, products_df, start_date, days):
+    # (days x SKUs) matrix of units sold, columns in products_df order
+    n_products = len(products_df)
+    day_index = (pd.to_datetime(sales_df['date']) - pd.Timestamp(start_date)).dt.days.to_numpy()
+    product_index = pd.Index(products_df['product_id']).get_indexer(sales_df['product_id'])
+    flat = np.bincount(day_index * n_products + product_index, weights=sales_df['quantity'],
+                       minlength=days * n_products)
+    return flat.reshape(days, n_products).astype(np.int32)
+
+def _simulate_stock(task):
+    # Weekly order-up-to policy for a shard of SKUs. Each review sizes the target from
+    # trailing demand and orders the gap between the target and the inventory position;
+    # orders arrive lead_time days later.
+    # Between reviews there are no decisions, so the stock path is a cumulative sum
+    # reflected at zero (unmet demand is lost):
+    #   X_t = S_0 + cumsum(arrivals - sales),  S_t = X_t - min(0, min_{k<=t} X_k)
+    # Returns (stock, units sold): sold_t = S_{t-1} + arrivals_t - S_t, i.e. demand
+    # capped at the units available that day.
+    sales, lead_time, review_days, seed = task
+    rng = np.random.default_rng(seed)
+    days, n = sales.shape
+    sku = np.arange(n)
+    
+    cover = review_days + lead_time
+    # Running sums give the trailing mean/std at any review in O(SKUs)
+    cumulative = np.zeros((days + 1, n))
+    cumulative[1:] = np.cumsum(sales, axis=0)
+    cumulative_sq = np.zeros((days + 1, n))
+    cumulative_sq[1:] = np.cumsum(sales.astype(np.float64) ** 2, axis=0)
+    
+    def target_at(day):
+        # The first review has no history yet and looks at the first window instead
+        low, high = (max(0, day - DEMAND_LOOKBACK_DAYS), day) if day > 0 else (0, min(DEMAND_LOOKBACK_DAYS, days))
+        mean = (cumulative[high] - cumulative[low]) / (high - low)
+        var = np.maximum((cumulative_sq[high] - cumulative_sq[low]) / (high - low) - mean ** 2, 0)
+        return np.ceil(mean * cover + INVENTORY_SAFETY_Z * np.sqrt(var * cover)).astype(np.int64)
+    
+    arrivals = np.zeros((days + lead_time.max() + 1, n), dtype=np.int64)
+    stock = np.empty((days, n), dtype=np.int32)
+    sold = np.empty((days, n), dtype=np.int32)
+    level = target_at(0)
+    on_order = np.zeros(n, dtype=np.int64)
+    
+    for start in range(0, days, review_days):
+        end = min(start + review_days, days)
+        target = target_at(start)
+        order = np.maximum(target - level - on_order, 0)
+        order[rng.random(n) < MISSED_REVIEW_RATE] = 0
+        arrivals[start + lead_time, sku] += order
+        on_order += order
+        
+        path = level + np.cumsum(arrivals[start:end] - sales[start:end], axis=0)
+        stock[start:end] = path - np.minimum(np.minimum.accumulate(path, axis=0), 0)
+        previous = np.vstack([level[None, :], stock[start:end - 1]])
+        sold[start:end] = previous + arrivals[start:end] - stock[start:end]
+        on_order -= arrivals[start:end].sum(axis=0)
+        level = stock[end - 1].astype(np.int64)
+    return stock, sold
+
+def generate_inventory(products_df, suppliers_df, start_date, days, sales_quantity,
+                       review_days=INVENTORY_REVIEW_DAYS, workers=None):
+    # Daily stock_on_hand that follows the generated sales: stock = previous stock -
+    # sales + restock arrivals, using each product's supplier lead time.
+    # sales_quantity is the (days x SKUs) demand matrix in products_df order. Returns
+    # (inventory_df, units_sold): units_sold is the demand that could be served from
+    # stock, for cap_sales.
+    lead_time = products_df[['supplier_id']].merge(suppliers_df, on='supplier_id', how='left')['lead_time_days']
+    lead_time = lead_time.to_numpy(dtype=np.int64)
+    n_products = len(products_df)
+    
+    # SKUs are independent, so large catalogs are split into shards across processes
+    shards = [slice(start, min(start + INVENTORY_SHARD_SKUS, n_products))
+              for start in range(0, n_products, INVENTORY_SHARD_SKUS)]
+    seeds = np.random.SeedSequence(np.random.randint(2**31)).spawn(len(shards))
+    tasks = [(sales_quantity[:, shard], lead_time[shard], review_days, seed) for shard, seed in zip(shards, seeds)]
+    if workers == 1 or len(tasks) == 1:
+        results = list(map(_simulate_stock, tasks))
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(_simulate_stock, tasks))
+    stock = np.concatenate([stock for stock, _ in results], axis=1)
+    units_sold = np.concatenate([sold for _, sold in results], axis=1)
+    
+    inventory_df = pd.DataFrame({
+        "date": np.repeat(pd.date_range(start_date, periods=days, freq='D').to_numpy(), n_products),
+        "product_id": pd.Categorical.from_codes(np.tile(np.arange(n_products), days),
+                                                categories=products_df['product_id']),
+        "stock_on_hand": stock.ravel()
+    })
+    return inventory_df, units_sold
+
+def cap_sales(sales_df, units_sold, products_df, start_date):
+    # Drop the demand that was lost to stockouts: the transactions of a (day, SKU) are
+    # served in row order until its units_sold run out, so later ones shrink or vanish
+    # and no sales are recorded on days without stock
+    day_index = (pd.to_datetime(sales_df['date']) - pd.Timestamp(start_date)).dt.days.to_numpy()
+    product_index = pd.Index(products_df['product_id']).get_indexer(sales_df['product_id'])
+    quantity = sales_df['quantity'].to_numpy()
+    cell = day_index * units_sold.shape[1] + product_index
+    served_before = pd.Series(quantity).groupby(cell).cumsum().to_numpy() - quantity
+    kept = np.clip(units_sold.ravel()[cell] - served_before, 0, quantity)
+    if (kept == quantity).all():
+        return sales_df
+    
+    prices = products_df['selling_price'].to_numpy()[product_index]
+    capped = sales_df.assign(quantity=kept,
+                             total_amount=np.where(kept == quantity, sales_df['total_amount'], np.round(kept * prices, 2)))
+    return capped[kept > 0].reset_index(drop=True)
+
+def cap_sales_table(path, units_sold, products_df, start_date):
+    # cap_sales for a sales table already streamed to disk: rewritten one month at a
+    # time into a temporary table that replaces it
+    tmp_path = f"{path}.tmp"
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    first_date, last_date = storage.date_range(path)
+    for month in pd.period_range(first_date, last_date, freq='M'):
+        chunk = storage.load_table(path, start_date=month.start_time, end_date=month.end_time.normalize())
+        storage.append_table(cap_sales(chunk, units_sold, products_df, start_date), tmp_path)
+    shutil.rmtree(path)
+    os.rename(tmp_path, path)
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Generate synthetic retail data into data/raw/")
+    parser.add_argument("--num-products", type=int, default=NUM_PRODUCTS)
+    parser.add_argument("--start-date", type=datetime.fromisoformat, default=START_DATE, help="YYYY-MM-DD")
+    parser.add_argument("--end-date", type=datetime.fromisoformat, default=END_DATE, help="YYYY-MM-DD")
+    parser.add_argument("--vectorized", action="store_true",
+                        help="Use the NumPy sales generator and stream chunks to disk (for large runs)")
+    parser.add_argument("--chunk-size", type=int, default=SALES_CHUNK_SIZE,
+                        help="Approximate transactions per written chunk (vectorized mode)")
+    parser.add_argument("--daily-transactions", type=int, nargs=2, default=DAILY_TRANSACTIONS,
+                        metavar=("MIN", "MAX"), help="Base daily transaction range (vectorized mode)")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="Worker processes for inventory generation on large catalogs (default: all cores)")
+    parser.add_argument("--export-csv", action="store_true", help="Also write CSV copies of the raw tables")
+    return parser.parse_args()
 
 if __name__ == "__main__":
+    args = parse_args()
+    NUM_PRODUCTS = args.num_products
+    START_DATE, END_DATE = args.start_date, args.end_date
+    DAYS = generation_days(START_DATE, END_DATE)
+    
     print("Generating Suppliers...")
     suppliers_df = generate_suppliers(NUM_SUPPLIERS)
-    suppliers_df.to_csv(f"{RAW_DATA_PATH}/suppliers.csv", index=False)
+    storage.save_table(suppliers_df, f"{RAW_DATA_PATH}/suppliers", export_csv=args.export_csv)
     
     print("Generating Products...")
     products_df = generate_products(NUM_PRODUCTS, suppliers_df['supplier_id'].tolist())
-    products_df.to_csv(f"{RAW_DATA_PATH}/products.csv", index=False)
+    storage.save_table(products_df, f"{RAW_DATA_PATH}/products", export_csv=args.export_csv)
     
     print("Generating Sales Transactions...")
-    sales_df = generate_sales(products_df, START_DATE, DAYS)
-    sales_df.to_csv(f"{RAW_DATA_PATH}/sales.csv", index=False)
+    if args.vectorized:
+        sales_quantity = generate_sales_vectorized(products_df, START_DATE, DAYS, f"{RAW_DATA_PATH}/sales",
+                                                   chunk_size=args.chunk_size, daily_transactions=args.daily_transactions)
+    else:
+        sales_df = generate_sales(products_df, START_DATE, DAYS)
+        sales_quantity = daily_quantity(sales_df, products_df, START_DATE, DAYS)
     
     print("Generating Inventory Snapshots...")
-    inventory_df = generate_inventory(products_df, START_DATE, DAYS)
-    inventory_df.to_csv(f"{RAW_DATA_PATH}/inventory.csv", index=False)
+    inventory_df, units_sold = generate_inventory(products_df, suppliers_df, START_DATE, DAYS, sales_quantity,
+                                                  workers=args.workers)
+    storage.save_table(inventory_df, f"{RAW_DATA_PATH}/inventory", export_csv=args.export_csv)
+    
+    # Sales are what was in stock: demand on stockout days is lost, not recorded
+    lost = int(sales_quantity.sum() - units_sold.sum())
+    print(f"Capping sales at available stock ({lost:,} units of demand lost to stockouts)...")
+    if args.vectorized:
+        cap_sales_table(f"{RAW_DATA_PATH}/sales", units_sold, products_df, START_DATE)
+        if args.export_csv:
+            storage.export_csv(f"{RAW_DATA_PATH}/sales")
+    else:
+        sales_df = cap_sales(sales_df, units_sold, products_df, START_DATE)
+        storage.save_table(sales_df, f"{RAW_DATA_PATH}/sales", export_csv=args.export_csv)
     
     print("Data generation complete! Files saved in data/raw/")
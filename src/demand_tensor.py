@@ -0,0 +1,226 @@
+"""
+Demand Tensor Module
+
+Dense (day x SKU) view of the master table, shared by the analytics stages:
+- One memory-mapped .npy matrix per measure (quantity, revenue, profit, stock_on_hand),
+  int32/float32, row = day since start_date, column = SKU code
+- A small dimension table (products/) maps SKU codes to product_key, product_id and
+  attributes; columns are the active products of the product dimension, sorted by product_id
+- meta.json records the date range and the master_table files the tensor was built from,
+  so readers can tell whether it is current
+- Incremental runs (update_tensor) extend the matrices in place: new days are appended
+  and only the reprocessed days are rewritten
+
+Readers open the matrices with mmap and slice them without copying; per-day and
+per-SKU totals become axis reductions instead of groupbys. Sum float32 measures
+with dtype=np.float64.
+"""
+
+import io
+import json
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+
+import storage
+import dimensions
+
+TENSOR_PATH = "data/processed/demand_tensor"
+MASTER_TABLE_PATH = "data/processed/master_table"
+MEASURES = {
+    'quantity': np.int32,
+    'revenue': np.float32,
+    'profit': np.float32,
+    'stock_on_hand': np.int32
+}
+DIMENSION_COLUMNS = ['product_key', 'product_id', 'product_name', 'category', 'cost_price', 'selling_price', 'supplier_id']
+
+def _fill(arrays, chunk, start_date, key_to_sku):
+    day = (chunk['date'] - start_date).dt.days.to_numpy()
+    keys = chunk['product_key'].to_numpy()
+    known = (keys >= 0) & (keys < len(key_to_sku))
+    sku = np.full(len(keys), -1)
+    sku[known] = key_to_sku[keys[known]]
+    # Rows of retired or unknown products have no column (-1 would index the last SKU)
+    rows = sku >= 0
+    for measure, array in arrays.items():
+        array[day[rows], sku[rows]] = chunk[measure].fillna(0).to_numpy()[rows]
+
+def _columns(dim_product):
+    # Active products sorted by product_id, and the product_key -> column lookup
+    dims = dim_product.loc[dim_product['active'] == 1, DIMENSION_COLUMNS].copy()
+    dims['product_id'] = dims['product_id'].astype(str)
+    dims = dims.sort_values('product_id', ignore_index=True)
+    key_to_sku = np.full(len(dim_product), -1)
+    key_to_sku[dims['product_key'].to_numpy()] = np.arange(len(dims))
+    return dims, key_to_sku
+
+def _write_meta(path, start_date, days, master_path):
+    # Written then renamed, so readers never see a partial file
+    with open(f"{path}/meta.json.tmp", 'w') as f:
+        json.dump({
+            'start_date': start_date.strftime("%Y-%m-%d"),
+            'days': days,
+            'measures': list(MEASURES),
+            'source_signature': [list(entry) for entry in storage.table_signature(master_path)]
+        }, f)
+    os.replace(f"{path}/meta.json.tmp", f"{path}/meta.json")
+
+def write_tensor(chunks, dim_product, start_date, end_date, path=TENSOR_PATH, master_path=MASTER_TABLE_PATH):
+    """Write the tensor from an iterable of master-table chunks (any row order).
+
+    Written to a temporary directory and swapped in, so readers that still have
+    the old files mapped keep a consistent view."""
+    start_date, end_date = pd.Timestamp(start_date), pd.Timestamp(end_date)
+    dims, key_to_sku = _columns(dim_product)
+    days = (end_date - start_date).days + 1
+
+    tmp_path = f"{path}.tmp"
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    os.makedirs(tmp_path)
+    # open_memmap creates zero-filled files: days/SKUs without rows stay 0
+    arrays = {measure: np.lib.format.open_memmap(f"{tmp_path}/{measure}.npy", mode='w+', dtype=dtype,
+                                                 shape=(days, len(dims)))
+              for measure, dtype in MEASURES.items()}
+    for chunk in chunks:
+        _fill(arrays, chunk, start_date, key_to_sku)
+    for array in arrays.values():
+        array.flush()
+    del arrays
+
+    storage.save_table(dims, f"{tmp_path}/products")
+    _write_meta(tmp_path, start_date, days, master_path)
+
+    old_path = f"{path}.old"
+    if os.path.isdir(path):
+        shutil.rmtree(old_path, ignore_errors=True)
+        os.rename(path, old_path)
+    os.rename(tmp_path, path)
+    shutil.rmtree(old_path, ignore_errors=True)
+
+def build_tensor(master_path=MASTER_TABLE_PATH, dim_product=None, path=TENSOR_PATH):
+    # From the stored master table, one month at a time (memory stays at one month of rows)
+    if dim_product is None:
+        dim_product = dimensions.load_dimension(dimensions.PRODUCT_DIM_PATH)
+    start_date, end_date = storage.date_range(master_path)
+    columns = ['date', 'product_key'] + list(MEASURES)
+
+    def chunks():
+        for month in pd.period_range(start_date, end_date, freq='M'):
+            yield storage.load_table(master_path, columns=columns, start_date=month.start_time,
+                                     end_date=month.end_time.normalize())
+
+    write_tensor(chunks(), dim_product, start_date, end_date, path, master_path)
+
+def grow_matrix(file_name, days):
+    # Extend a .npy matrix to `days` rows in place: numpy pads the header so the first
+    # axis can grow, and the extended file reads back as zeros. False if the new header
+    # does not fit.
+    with open(file_name, 'r+b') as f:
+        version = np.lib.format.read_magic(f)
+        read_header, write_header = {
+            (1, 0): (np.lib.format.read_array_header_1_0, np.lib.format.write_array_header_1_0),
+            (2, 0): (np.lib.format.read_array_header_2_0, np.lib.format.write_array_header_2_0)
+        }[version]
+        shape, fortran_order, dtype = read_header(f)
+        header_length = f.tell()
+        header = io.BytesIO()
+        write_header(header, {'descr': np.lib.format.dtype_to_descr(dtype), 'fortran_order': fortran_order,
+                              'shape': (days,) + shape[1:]})
+        if fortran_order or len(header.getvalue()) != header_length:
+            return False
+        f.seek(0)
+        f.write(header.getvalue())
+        f.truncate(header_length + days * int(np.prod(shape[1:])) * dtype.itemsize)
+    return True
+
+def update_tensor(start_date, dim_product=None, path=TENSOR_PATH, master_path=MASTER_TABLE_PATH):
+    """Bring the tensor in line with a master table whose rows changed from start_date on
+    (incremental cleaning). The matrices are updated in place: new days are appended and
+    only days >= start_date are rewritten. A new SKU set, a start before the tensor's
+    range or a missing tensor rebuilds everything. Returns 'incremental' or 'full'."""
+    if dim_product is None:
+        dim_product = dimensions.load_dimension(dimensions.PRODUCT_DIM_PATH)
+    dims, key_to_sku = _columns(dim_product)
+    meta_file = f"{path}/meta.json"
+    meta = None
+    if os.path.exists(meta_file):
+        with open(meta_file) as f:
+            meta = json.load(f)
+    tensor_start = pd.Timestamp(meta['start_date']) if meta is not None else None
+    start_date = pd.Timestamp(start_date)
+
+    compatible = (meta is not None and meta['measures'] == list(MEASURES) and start_date >= tensor_start and
+                  storage.load_table(f"{path}/products", columns=['product_key', 'product_id'])
+                  .astype({'product_id': str}).equals(dims[['product_key', 'product_id']]))
+    days = (storage.date_range(master_path)[1] - tensor_start).days + 1 if compatible else 0
+    if not compatible or (days > meta['days'] and
+                          not all([grow_matrix(f"{path}/{measure}.npy", days) for measure in MEASURES])):
+        build_tensor(master_path, dim_product, path)
+        return 'full'
+    days = max(days, meta['days'])
+
+    # Reprocessed days are cleared first: a (day, SKU) without a master row is 0, as in a full build
+    first_day = (start_date - tensor_start).days
+    arrays = {measure: np.load(f"{path}/{measure}.npy", mmap_mode='r+') for measure in MEASURES}
+    for array in arrays.values():
+        array[first_day:] = 0
+    _fill(arrays, storage.load_table(master_path, columns=['date', 'product_key'] + list(MEASURES),
+                                     start_date=start_date), tensor_start, key_to_sku)
+    for array in arrays.values():
+        array.flush()
+    del arrays
+
+    storage.save_table(dims, f"{path}/products")
+    _write_meta(path, tensor_start, days, master_path)
+    return 'incremental'
+
+def tensor_from_master(master_table, dim_product, path=TENSOR_PATH, master_path=MASTER_TABLE_PATH):
+    # From an in-memory master table (full builds); call after the master table is saved
+    write_tensor([master_table], dim_product, master_table['date'].min(), master_table['date'].max(), path, master_path)
+
+def is_current(path=TENSOR_PATH, master_path=MASTER_TABLE_PATH):
+    # True when the tensor was built from the master table files currently on disk
+    meta_file = f"{path}/meta.json"
+    if not os.path.exists(meta_file):
+        return False
+    with open(meta_file) as f:
+        meta = json.load(f)
+    return meta['source_signature'] == [list(entry) for entry in storage.table_signature(master_path)]
+
+def load_tensor(path=TENSOR_PATH, measures=None, mmap_mode='r'):
+    """{'dates': DatetimeIndex, 'products': dimension table, <measure>: (days, SKUs) array}.
+    Arrays are read-only memory maps unless mmap_mode=None."""
+    with open(f"{path}/meta.json") as f:
+        meta = json.load(f)
+    tensor = {
+        'dates': pd.date_range(meta['start_date'], periods=meta['days'], freq='D', name='date'),
+        'products': storage.load_table(f"{path}/products")
+    }
+    for measure in measures or meta['measures']:
+        tensor[measure] = np.load(f"{path}/{measure}.npy", mmap_mode=mmap_mode)
+    return tensor
+
+def is_tensor(data):
+    return isinstance(data, dict) and 'dates' in data and 'products' in data
+
+def day_slice(tensor, start_date=None, end_date=None):
+    dates = tensor['dates']
+    start = 0 if start_date is None else dates.searchsorted(pd.Timestamp(start_date))
+    end = len(dates) if end_date is None else dates.searchsorted(pd.Timestamp(end_date), side='right')
+    return slice(start, end)
+
+def frame(tensor, measure, start_date=None, end_date=None):
+    # (days x product_id) DataFrame over the mapped array, without copying
+    rows = day_slice(tensor, start_date, end_date)
+    columns = pd.Index(tensor['products']['product_id'].astype(str), name='product_id')
+    return pd.DataFrame(tensor[measure][rows], index=tensor['dates'][rows], columns=columns, copy=False)
+
+def daily_totals(tensor, measure):
+    return pd.Series(tensor[measure].sum(axis=1, dtype=np.float64), index=tensor['dates'], name=measure)
+
+def product_totals(tensor, measure):
+    return pd.Series(tensor[measure].sum(axis=0, dtype=np.float64),
+                     index=tensor['products']['product_id'].astype(str), name=measure)
@@ -0,0 +1,87 @@
+"""
+Dimensions Module
+
+Star-schema dimensions for the processed tables:
+- dim_supplier: one row per supplier_key
+- dim_product:  one row per product_key, with the product attributes and its
+  supplier's attributes (supplier_key, supplier_id, supplier_name, lead_time_days)
+- Keys are dense int32 row numbers, assigned once and kept stable across runs: the
+  stored dimension fixes the order, ids seen for the first time are appended (sorted),
+  and ids that disappear from the raw tables keep their key (active = 0, attributes empty)
+
+Fact tables (sales_cleaned, master_table) carry only product_key, the date and numeric
+measures. Natural ids and attributes are attached by key when a table is presented
+(`attach`): since a key is a row number, that is array indexing, not a hash merge.
+"""
+
+import numpy as np
+import pandas as pd
+
+import storage
+
+PRODUCT_DIM_PATH = "data/processed/dim_product"
+SUPPLIER_DIM_PATH = "data/processed/dim_supplier"
+KEY_DTYPE = np.int32
+
+def _key_order(natural_ids, previous=None, id_column=None):
+    # Previous key order, then ids seen for the first time in sorted order
+    known = [] if previous is None else list(previous[id_column].astype(str))
+    new = sorted(set(pd.Series(natural_ids).dropna().astype(str)) - set(known))
+    return pd.Index(known + new, name=id_column)
+
+def keys_for(natural_ids, order):
+    """int32 keys of natural ids (-1 where an id has no key). Categoricals are mapped
+    per category and expanded with their codes, so rows are never hashed."""
+    if isinstance(natural_ids.dtype, pd.CategoricalDtype):
+        category_keys = np.append(order.get_indexer(natural_ids.cat.categories.astype(str)), -1)
+        return category_keys[natural_ids.cat.codes.to_numpy()].astype(KEY_DTYPE)    # Code -1 (NaN) -> -1
+    return order.get_indexer(natural_ids.astype(str)).astype(KEY_DTYPE)
+
+def product_keys(product_ids, dim_product):
+    return keys_for(product_ids, pd.Index(dim_product['product_id'].astype(str)))
+
+def supplier_dimension(suppliers, previous=None):
+    order = _key_order(suppliers['supplier_id'], previous, 'supplier_id')
+    current = suppliers.assign(supplier_id=suppliers['supplier_id'].astype(str)).set_index('supplier_id')
+    dim_supplier = current.reindex(order).reset_index()
+    dim_supplier.insert(0, 'supplier_key', np.arange(len(order), dtype=KEY_DTYPE))
+    dim_supplier['active'] = order.isin(current.index).astype(np.int8)
+    return dim_supplier
+
+def product_dimension(products, dim_supplier, previous=None):
+    """Product rows in key order, with their supplier's attributes joined once here
+    (dimension-sized) instead of on every fact row."""
+    order = _key_order(products['product_id'], previous, 'product_id')
+    current = products.assign(product_id=products['product_id'].astype(str)).set_index('product_id')
+    dim_product = current.reindex(order).reset_index()
+    dim_product.insert(0, 'product_key', np.arange(len(order), dtype=KEY_DTYPE))
+    dim_product['active'] = order.isin(current.index).astype(np.int8)
+
+    dim_product['supplier_key'] = keys_for(dim_product['supplier_id'], pd.Index(dim_supplier['supplier_id'].astype(str)))
+    # Left merge keeps the key order; products without a known supplier get empty attributes
+    dim_product = dim_product.merge(dim_supplier.drop(columns=['supplier_id', 'active']), on='supplier_key', how='left')
+    return storage.prepare(dim_product)
+
+def load_dimension(path):
+    return storage.load_table(path) if storage.table_exists(path) else None
+
+def update_dimensions(products, suppliers):
+    # Build both dimensions on top of the stored key order and save them
+    dim_supplier = supplier_dimension(suppliers, load_dimension(SUPPLIER_DIM_PATH))
+    dim_product = product_dimension(products, dim_supplier, load_dimension(PRODUCT_DIM_PATH))
+    storage.save_table(dim_supplier, SUPPLIER_DIM_PATH)
+    storage.save_table(dim_product, PRODUCT_DIM_PATH)
+    return dim_product
+
+def attach(df, columns, dim_product=None):
+    """Copy of df (shallow) with product attributes looked up by product_key."""
+    if dim_product is None:
+        dim_product = load_dimension(PRODUCT_DIM_PATH)
+    keys = df['product_key'].to_numpy()
+    return df.assign(**{col: dim_product[col].array.take(keys) for col in columns})
+
+def product_ids(keys, dim_product=None):
+    # Natural product_ids (as strings) of an array of keys, e.g. a pivot's columns
+    if dim_product is None:
+        dim_product = load_dimension(PRODUCT_DIM_PATH)
+    return pd.Index(dim_product['product_id'].astype(str).to_numpy()[np.asarray(keys)], name='product_id')
@@ -1,75 +1,244 @@
-import pandas as pd
+"""
+EDA Module
+
+Exploratory figures for the sales history, written to reports/figures/:
+- Overview: daily and weekly revenue, top 10 products, monthly seasonality
+- Small multiples: daily revenue per category, daily units for the top-N SKUs
+  (paged, SKUS_PER_PAGE panels per figure)
+- index.html linking every figure
+
+All aggregates are computed in one pass up front (axis reductions over the demand
+tensor when it is current, query-engine groupbys over the master table otherwise), so each
+figure only receives a small frame. Figures render in a process pool with the
+headless Agg backend.
+"""
+
+import argparse
+import html
+import math
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import matplotlib
+matplotlib.use("Agg")
+import matplotlib.dates as mdates
 import matplotlib.pyplot as plt
+from matplotlib.ticker import MaxNLocator
+import pandas as pd
 import seaborn as sns
-import os
+
+import storage
+import aggregates
+import demand_tensor
+import dimensions
+import query_engine
+from instrumentation import instrument
+
+FIGURES_PATH = "reports/figures"
+TOP_N_SKUS = 48         # SKUs that get their own small-multiple panel
+SKUS_PER_PAGE = 16
+GRID_COLUMNS = 4
+ROLLING_DAYS = 28
 
 # Create directories for reports
-os.makedirs("reports/figures", exist_ok=True)
+os.makedirs(FIGURES_PATH, exist_ok=True)
 
+@instrument("Loading data for EDA...")
 def load_processed_data():
-    return pd.read_csv("data/processed/master_table.csv", parse_dates=['date'])
+    # The figures only need totals, which the tensor gives without a groupby
+    if demand_tensor.is_current():
+        return demand_tensor.load_tensor(measures=aggregates.MEASURES)
+    if query_engine.scans_tables():
+        # The engine aggregates the stored partitions directly
+        return aggregates.MASTER_TABLE_PATH
+    return storage.load_table("data/processed/master_table",
+                              columns=['date', 'product_key'] + aggregates.MEASURES)
+
+@instrument("Computing EDA aggregates...")
+def eda_aggregates(data, top_n=TOP_N_SKUS):
+    # Everything the figures plot, from one pass over the history
+    if demand_tensor.is_tensor(data):
+        summary = aggregates.tensor_aggregates(data)
+        top = summary['product_totals'].head(top_n)
+        columns = pd.Index(data['products']['product_id'].astype(str))
+        top_daily = pd.DataFrame(data['quantity'][:, columns.get_indexer(top['product_id'])],
+                                 index=data['dates'], columns=top['product_id'].to_numpy())
+    else:
+        dim_product = dimensions.load_dimension(dimensions.PRODUCT_DIM_PATH)
+        summary = aggregates.build_aggregates(data, dim_product)
+        top = summary['product_totals'].head(top_n)
+        top_keys = dimensions.product_keys(top['product_id'], dim_product)
+        rows = query_engine.group_sum(data, ['date', 'product_key'], ['quantity'], isin={'product_key': top_keys})
+        rows['product_id'] = dimensions.product_ids(rows['product_key'], dim_product)
+        top_daily = rows.pivot(index='date', columns='product_id', values='quantity').asfreq('D').fillna(0)
+        top_daily = top_daily.reindex(columns=top['product_id'].astype(str), fill_value=0)
+
+    daily = summary['daily_totals'].set_index('date')['revenue'].asfreq('D', fill_value=0)
+    return {
+        'daily_revenue': daily,
+        'category_revenue': summary['daily_by_category'].pivot(index='date', columns='category', values='revenue')
+                                                        .asfreq('D').fillna(0),
+        'product_revenue': summary['product_totals'].groupby('product_name')['revenue'].sum(),
+        'top_daily': top_daily,
+        'top_names': dict(zip(top['product_id'].astype(str), top['product_name']))
+    }
 
-def plot_sales_trends(df):
+# ---------------------------------------------------------------------------
+# Renderers: fn(payload, path), run in the pool workers. Instrumented per figure
+# (records only: progress lines from the workers would interleave)
+# ---------------------------------------------------------------------------
+
+@instrument()
+def plot_sales_trends(daily_sales, path):
     plt.figure(figsize=(12, 6))
-    daily_sales = df.groupby('date')['revenue'].sum()
     daily_sales.plot()
     plt.title('Total Daily Sales Revenue')
     plt.ylabel('Revenue ($)')
     plt.xlabel('Date')
-    plt.savefig('reports/figures/daily_sales_trend.png')
+    plt.savefig(path)
     plt.close()
-    
-    # Weekly Trend
+
+@instrument()
+def plot_weekly_sales(daily_sales, path):
     plt.figure(figsize=(12, 6))
-    weekly_sales = df.set_index('date').resample('W')['revenue'].sum()
-    weekly_sales.plot(kind='bar')
+    weekly_sales = daily_sales.resample('W').sum()
+    ax = weekly_sales.plot(kind='bar')
+    # One label per ~4 weeks keeps multi-year histories readable
+    step = max(1, len(weekly_sales) // 52 * 4)
+    ax.set_xticks(range(0, len(weekly_sales), step))
+    ax.set_xticklabels(weekly_sales.index[::step].strftime('%Y-%m-%d'))
     plt.title('Weekly Sales Revenue')
     plt.ylabel('Revenue ($)')
     plt.xlabel('Week')
     plt.xticks(rotation=45)
     plt.tight_layout()
-    plt.savefig('reports/figures/weekly_sales_trend.png')
+    plt.savefig(path)
+    plt.close()
+
+@instrument()
+def plot_top_products(product_revenue, path):
+    top_products = product_revenue.sort_values(ascending=False).head(10)
+    plt.figure(figsize=(10, 6))
+    top_products.sort_values().plot(kind='barh', color='skyblue')
+    plt.title('Top 10 Products by Revenue')
+    plt.xlabel('Total Revenue ($)')
+    plt.tight_layout()
+    plt.savefig(path)
+    plt.close()
+
+@instrument()
+def plot_seasonality(daily_sales, path):
+    # Distribution of daily revenue within each calendar month
+    df = pd.DataFrame({'month': daily_sales.index.month, 'revenue': daily_sales.to_numpy()})
+    plt.figure(figsize=(10, 6))
+    sns.boxplot(data=df, x='month', y='revenue')
+    plt.title('Monthly Sales Distribution (Seasonality)')
+    plt.xlabel('Month')
+    plt.ylabel('Daily Revenue ($)')
+    plt.savefig(path)
     plt.close()
 
-def plot_top_products(df):
-    try:
-        top_products = df.groupby('product_name')['revenue'].sum().sort_values(ascending=False).head(10)
-        
-        plt.figure(figsize=(10, 6))
-        # Use simple pandas plotting to avoid seaborn complexity for now
-        top_products.sort_values().plot(kind='barh', color='skyblue')
-        plt.title('Top 10 Products by Revenue')
-        plt.xlabel('Total Revenue ($)')
-        plt.tight_layout()
-        plt.savefig('reports/figures/top_10_products.png')
-        plt.close()
-    except Exception as e:
-        print(f"Error plotting top products: {e}")
-
-def plot_seasonality(df):
-    try:
-        plt.figure(figsize=(10, 6))
-        # Use pandas boxplot or seaborn
-        sns.boxplot(data=df, x='month', y='revenue')
-        plt.title('Monthly Sales Distribution (Seasonality)')
-        plt.xlabel('Month')
-        plt.ylabel('Revenue')
-        plt.savefig('reports/figures/monthly_seasonality.png')
-        plt.close()
-    except Exception as e:
-        print(f"Error plotting seasonality: {e}")
+@instrument()
+def plot_small_multiples(payload, path):
+    # One panel per column of payload['series'] (date index), with its rolling mean.
+    # Fixed margins and few ticks: tight_layout and tick placement dominate the
+    # render time of a many-panel figure.
+    series, titles = payload['series'], payload['titles']
+    rows = math.ceil(series.shape[1] / GRID_COLUMNS)
+    fig, axes = plt.subplots(rows, GRID_COLUMNS, figsize=(4 * GRID_COLUMNS, 2.6 * rows), sharex=True, squeeze=False)
+    for ax, column in zip(axes.flat, series.columns):
+        values = series[column]
+        ax.plot(series.index, values.to_numpy(), linewidth=0.6, color='lightsteelblue')
+        ax.plot(series.index, values.rolling(ROLLING_DAYS, min_periods=1).mean().to_numpy(), linewidth=1.2, color='navy')
+        ax.set_title(titles.get(column, column), fontsize=9)
+        ax.tick_params(labelsize=7)
+        ax.yaxis.set_major_locator(MaxNLocator(4))
+    for ax in axes.flat[series.shape[1]:]:
+        ax.set_visible(False)
+    locator = mdates.AutoDateLocator(maxticks=5)
+    axes[0, 0].xaxis.set_major_locator(locator)
+    axes[0, 0].xaxis.set_major_formatter(mdates.ConciseDateFormatter(locator))
+    fig.suptitle(payload['title'])
+    fig.subplots_adjust(left=0.04, right=0.99, bottom=0.4 / rows, top=1 - 0.5 / rows, hspace=0.4, wspace=0.2)
+    fig.savefig(path, dpi=80)
+    plt.close(fig)
+
+def _render(task):
+    fn, payload, path = task
+    fn(payload, path)
+    return path
+
+# ---------------------------------------------------------------------------
+
+def figure_tasks(summary, figures_path=FIGURES_PATH, per_page=SKUS_PER_PAGE):
+    # [(section, title, renderer, payload, path)]
+    def path(name):
+        return os.path.join(figures_path, name)
+
+    daily = summary['daily_revenue']
+    tasks = [
+        ('Overview', 'Total daily revenue', plot_sales_trends, daily, path('daily_sales_trend.png')),
+        ('Overview', 'Weekly revenue', plot_weekly_sales, daily, path('weekly_sales_trend.png')),
+        ('Overview', 'Top 10 products by revenue', plot_top_products, summary['product_revenue'],
+         path('top_10_products.png')),
+        ('Overview', 'Monthly seasonality', plot_seasonality, daily, path('monthly_seasonality.png')),
+        ('Categories', 'Daily revenue by category', plot_small_multiples,
+         {'series': summary['category_revenue'], 'titles': {}, 'title': f'Daily revenue by category ({ROLLING_DAYS}-day mean)'},
+         path('category_small_multiples.png'))
+    ]
+    top_daily = summary['top_daily']
+    pages = math.ceil(top_daily.shape[1] / per_page)
+    for page in range(pages):
+        series = top_daily.iloc[:, page * per_page:(page + 1) * per_page]
+        first, last = page * per_page + 1, page * per_page + series.shape[1]
+        title = f'Top SKUs {first}-{last} by revenue: daily units'
+        tasks.append(('Top SKUs', title, plot_small_multiples,
+                      {'series': series, 'titles': summary['top_names'], 'title': title},
+                      path(f'top_skus_{page + 1:02d}.png')))
+    return tasks
+
+@instrument("Rendering EDA figures...")
+def render_figures(tasks, workers=None):
+    jobs = [(fn, payload, path) for _, _, fn, payload, path in tasks]
+    if workers == 1 or len(jobs) == 1:
+        return list(map(_render, jobs))
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(_render, jobs))
+
+def write_index(tasks, figures_path=FIGURES_PATH):
+    sections = {}
+    for section, title, _, _, path in tasks:
+        sections.setdefault(section, []).append((title, os.path.basename(path)))
+
+    lines = ["<!DOCTYPE html>", "<html><head><meta charset='utf-8'><title>Sales EDA</title>",
+             "<style>body{font-family:sans-serif;margin:2em} img{max-width:100%;border:1px solid #ddd}</style>",
+             "</head><body>", "<h1>Sales EDA</h1>"]
+    for section, figures in sections.items():
+        lines.append(f"<h2>{html.escape(section)}</h2>")
+        for title, file_name in figures:
+            lines.append(f"<h3>{html.escape(title)}</h3>")
+            lines.append(f"<a href='{file_name}'><img src='{file_name}' alt='{html.escape(title)}'></a>")
+    lines.append("</body></html>")
+
+    index_path = os.path.join(figures_path, "index.html")
+    with open(index_path, 'w') as f:
+        f.write("\n".join(lines))
+    return index_path
+
+def run_eda(df, workers=None, top_n=TOP_N_SKUS, per_page=SKUS_PER_PAGE):
+    summary = eda_aggregates(df, top_n)
+    tasks = figure_tasks(summary, per_page=per_page)
+    render_figures(tasks, workers)
+    index_path = write_index(tasks)
+
+    print(f"EDA Visualizations saved to {FIGURES_PATH}/ ({len(tasks)} figures, index: {index_path})")
 
 if __name__ == "__main__":
-    print("Loading data for EDA...")
+    parser = argparse.ArgumentParser(description="Render the EDA figures")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: all cores)")
+    parser.add_argument("--top-n", type=int, default=TOP_N_SKUS, help="SKUs with their own small-multiple panel")
+    parser.add_argument("--per-page", type=int, default=SKUS_PER_PAGE, help="Panels per top-SKU figure")
+    args = parser.parse_args()
+
     df = load_processed_data()
-    
-    print("Generating Sales Trend Plots...")
-    plot_sales_trends(df)
-    
-    print("Generating Top Products Plot...")
-    plot_top_products(df)
-    
-    print("Generating Seasonality Plot...")
-    plot_seasonality(df)
-    
-    print("EDA Visualizations saved to reports/figures/")
+    run_eda(df, args.workers, args.top_n, args.per_page)
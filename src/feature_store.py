@@ -0,0 +1,263 @@
+"""
+Feature Store Module
+
+Features shared by cleaning, forecasting and inventory, built once per run instead
+of being recomputed by each stage:
+- Date dimension (date_dim table): calendar fields and US federal holiday flags,
+  one row per day. Row tables get their calendar columns by position lookup
+  (day offset from the first date), not by per-row datetime accessors.
+- Per-SKU window features, (day x SKU) float64 matrices aligned with the demand
+  tensor (same rows and columns), stored as memory-mapped .npy files:
+  rolling_mean_<w> / rolling_std_<w> of daily quantity for each w in ROLLING_WINDOWS,
+  and days_since_stockout (NaN until the first stockout). Rolling windows use the
+  days available at the start of the history (like min_periods=1).
+
+All window features come from cumulative sums along the day axis, computed for
+every SKU at once in blocks of days. The store records a digest of every input day,
+so an update only recomputes from the first day that changed or was added (plus the
+window context before it); a new SKU set or start date rebuilds everything. Updates
+work on the stored files in place, like the demand tensor's: the matrices grow by the
+new days and only the recomputed days are written. After an incremental tensor update
+only the days from its window on are hashed again.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+from pandas.tseries.holiday import USFederalHolidayCalendar
+
+import storage
+import demand_tensor
+
+FEATURES_PATH = "data/processed/features"
+DATE_DIM_PATH = "data/processed/date_dim"
+ROLLING_WINDOWS = [7, 28, 90]
+FEATURE_DTYPE = np.float64   # Rolling means/stds are rounded up into order quantities downstream
+BLOCK_DAYS = 64             # Days computed together (bounds the float64 work buffers)
+
+def feature_names():
+    names = [f"rolling_{stat}_{w}" for w in ROLLING_WINDOWS for stat in ('mean', 'std')]
+    return names + ['days_since_stockout']
+
+# ---------------------------------------------------------------------------
+# Date dimension
+# ---------------------------------------------------------------------------
+
+def date_dimension(start_date, end_date):
+    dates = pd.date_range(pd.Timestamp(start_date).normalize(), pd.Timestamp(end_date).normalize(), freq='D', name='date')
+    # Holidays are looked up one year past the range so days_to_holiday is defined at the end
+    holidays = USFederalHolidayCalendar().holidays(dates[0], dates[-1] + pd.DateOffset(years=1), return_name=True)
+    next_holiday = holidays.index[np.minimum(holidays.index.searchsorted(dates), len(holidays) - 1)]
+
+    day_of_week = dates.dayofweek.to_numpy()
+    return pd.DataFrame({
+        'date': dates,
+        'year': dates.year.astype(np.int16),
+        'quarter': dates.quarter.astype(np.int8),
+        'month': dates.month.astype(np.int8),
+        'week': dates.isocalendar().week.to_numpy().astype(np.int8),
+        'day_of_week': day_of_week.astype(np.int8),
+        'day_of_year': dates.dayofyear.astype(np.int16),
+        'is_weekend': (day_of_week >= 5).astype(np.int8),
+        'is_month_end': dates.is_month_end.astype(np.int8),
+        'is_holiday': dates.isin(holidays.index).astype(np.int8),
+        'holiday_name': holidays.reindex(dates).to_numpy(),
+        'days_to_holiday': (next_holiday - dates).days.astype(np.int16)
+    })
+
+def attach_calendar(df, calendar, columns=('year', 'month', 'week', 'day_of_week', 'is_weekend')):
+    # Join date-dimension columns onto a row table by position: row i of the
+    # dimension is calendar['date'][0] + i days
+    offsets = (df['date'] - calendar['date'].iloc[0]).dt.days.to_numpy()
+    if len(offsets) and (offsets.min() < 0 or offsets.max() >= len(calendar)):
+        raise ValueError("Rows fall outside the date dimension's range")
+    for col in columns:
+        df[col] = calendar[col].to_numpy()[offsets]
+    return df
+
+def load_date_dimension(start_date=None, end_date=None):
+    if storage.table_exists(DATE_DIM_PATH):
+        return storage.load_table(DATE_DIM_PATH, start_date=start_date, end_date=end_date)
+    return date_dimension(start_date, end_date)
+
+# ---------------------------------------------------------------------------
+# Window features
+# ---------------------------------------------------------------------------
+
+def day_digests(tensor, start=0):
+    # One 64-bit digest per day over the inputs of the window features, for days [start, end)
+    digests = np.empty(len(tensor['dates']) - start, dtype=np.uint64)
+    quantity, stock = tensor['quantity'], tensor['stock_on_hand']
+    for i, day in enumerate(range(start, len(tensor['dates']))):
+        digest = hashlib.blake2b(quantity[day].tobytes(), digest_size=8)
+        digest.update(stock[day].tobytes())
+        digests[i] = int.from_bytes(digest.digest(), 'little')
+    return digests
+
+def _window_block(quantity, stock, start, end, last_stockout):
+    """Features for days [start, end) of the (day x SKU) inputs. last_stockout (SKUs,)
+    is the last stockout day before `start` (-1 if none) and is advanced in place."""
+    context = max(0, start - max(ROLLING_WINDOWS) + 1)
+    q = np.asarray(quantity[context:end], dtype=np.float64)
+    zeros = np.zeros((1, q.shape[1]))
+    c1 = np.concatenate([zeros, np.cumsum(q, axis=0)])
+    c2 = np.concatenate([zeros, np.cumsum(q * q, axis=0)])
+
+    local = np.arange(start, end) - context          # Row of each output day in q
+    features = {}
+    for w in ROLLING_WINDOWS:
+        lo = np.maximum(local - w + 1, 0)
+        n = (local - lo + 1)[:, None].astype(np.float64)
+        s1, s2 = c1[local + 1] - c1[lo], c2[local + 1] - c2[lo]
+        features[f"rolling_mean_{w}"] = s1 / n
+        with np.errstate(divide='ignore', invalid='ignore'):
+            var = np.maximum(s2 - s1 * s1 / n, 0) / (n - 1)
+        features[f"rolling_std_{w}"] = np.where(n > 1, np.sqrt(var), np.nan)
+
+    days = np.arange(start, end)[:, None]
+    stockout_day = np.where(np.asarray(stock[start:end]) <= 0, days, -1)
+    last = np.maximum.accumulate(np.vstack([last_stockout[None, :], stockout_day]), axis=0)[1:]
+    last_stockout[:] = last[-1]
+    features['days_since_stockout'] = np.where(last >= 0, days - last, np.nan)
+    return features
+
+def _fill_features(arrays, tensor, first_day, last_stockout):
+    # Compute days [first_day, end) into the feature matrices, one block of days at a time
+    days = tensor['quantity'].shape[0]
+    for start in range(first_day, days, BLOCK_DAYS):
+        end = min(start + BLOCK_DAYS, days)
+        for name, values in _window_block(tensor['quantity'], tensor['stock_on_hand'], start, end, last_stockout).items():
+            arrays[name][start:end] = values
+    for array in arrays.values():
+        array.flush()
+
+def _write_state(path, tensor, digests, signature):
+    # Digests, then meta, each written then renamed: until meta moves, readers and the
+    # next update still see the previous tensor signature
+    with open(f"{path}/day_digests.npy.tmp", 'wb') as f:
+        np.save(f, digests)
+    os.replace(f"{path}/day_digests.npy.tmp", f"{path}/day_digests.npy")
+    with open(f"{path}/meta.json.tmp", 'w') as f:
+        json.dump({
+            'start_date': tensor['dates'][0].strftime("%Y-%m-%d"),
+            'days': len(tensor['dates']),
+            'product_ids': list(tensor['products']['product_id'].astype(str)),
+            'features': feature_names(),
+            'tensor_signature': signature
+        }, f)
+    os.replace(f"{path}/meta.json.tmp", f"{path}/meta.json")
+
+def _write_features(tensor, path, digests, signature):
+    # Full build into a temporary directory, swapped in when complete
+    days, n_skus = tensor['quantity'].shape
+    tmp_path = f"{path}.tmp"
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    os.makedirs(tmp_path)
+    arrays = {name: np.lib.format.open_memmap(f"{tmp_path}/{name}.npy", mode='w+', dtype=FEATURE_DTYPE,
+                                              shape=(days, n_skus))
+              for name in feature_names()}
+    _fill_features(arrays, tensor, 0, np.full(n_skus, -1, dtype=np.int64))
+    del arrays
+    _write_state(tmp_path, tensor, digests, signature)
+
+    old_path = f"{path}.old"
+    if os.path.isdir(path):
+        shutil.rmtree(old_path, ignore_errors=True)
+        os.rename(path, old_path)
+    os.rename(tmp_path, path)
+    shutil.rmtree(old_path, ignore_errors=True)
+
+def _extend_features(tensor, path, digests, signature, first_day):
+    # In place: the matrices grow to the tensor's days and days >= first_day are
+    # recomputed. False if a matrix cannot grow in place (the caller rebuilds).
+    days = tensor['quantity'].shape[0]
+    if not all([demand_tensor.grow_matrix(f"{path}/{name}.npy", days) for name in feature_names()]):
+        return False
+    arrays = {name: np.load(f"{path}/{name}.npy", mmap_mode='r+') for name in feature_names()}
+    # The stockout carry resumes from the last day kept
+    last_stockout = np.full(arrays['days_since_stockout'].shape[1], -1, dtype=np.int64)
+    if first_day > 0:
+        previous = arrays['days_since_stockout'][first_day - 1]
+        last_stockout = np.where(np.isnan(previous), -1, first_day - 1 - np.nan_to_num(previous)).astype(np.int64)
+    _fill_features(arrays, tensor, first_day, last_stockout)
+    del arrays
+    _write_state(path, tensor, digests, signature)
+    return True
+
+def _tensor_signature(tensor_path=demand_tensor.TENSOR_PATH):
+    with open(f"{tensor_path}/meta.json") as f:
+        return json.load(f)['source_signature']
+
+def _read_meta(path):
+    meta_file = f"{path}/meta.json"
+    if not os.path.exists(meta_file):
+        return None
+    with open(meta_file) as f:
+        return json.load(f)
+
+def build_features(tensor, path=FEATURES_PATH, signature=None):
+    # Full build from an in-memory or mapped tensor (signature: the tensor's source signature, if any)
+    _write_features(tensor, path, day_digests(tensor), signature)
+    return load_features(path)
+
+def update_features(path=FEATURES_PATH, since=None):
+    """Bring the window features in line with the current demand tensor. Returns
+    'cached', 'incremental' or 'full' (how much was recomputed).
+
+    since: first date whose inputs may have changed since the store was written (the
+    window of an incremental tensor update); earlier days keep their stored digests
+    instead of being hashed again."""
+    tensor = demand_tensor.load_tensor(measures=['quantity', 'stock_on_hand'])
+    meta, signature = _read_meta(path), _tensor_signature()
+    if meta is not None and meta['tensor_signature'] == signature:
+        return 'cached'
+
+    compatible = (meta is not None and meta['features'] == feature_names() and
+                  meta['start_date'] == tensor['dates'][0].strftime("%Y-%m-%d") and
+                  meta['product_ids'] == list(tensor['products']['product_id'].astype(str)))
+    if not compatible:
+        _write_features(tensor, path, day_digests(tensor), signature)
+        return 'full'
+
+    previous = np.load(f"{path}/day_digests.npy")
+    trusted = 0 if since is None else min(int(tensor['dates'].searchsorted(pd.Timestamp(since))), len(previous))
+    digests = np.concatenate([previous[:trusted], day_digests(tensor, trusted)])
+    if len(digests) < len(previous):
+        # The tensor lost days (rebuilt from a shorter master table): the files cannot shrink in place
+        _write_features(tensor, path, digests, signature)
+        return 'full'
+    changed = np.flatnonzero(previous != digests[:len(previous)])
+    first_day = int(changed[0]) if len(changed) else len(previous)
+    if first_day == len(digests):
+        # Same days, same values (e.g. the tensor was rebuilt from an unchanged master
+        # table): only the recorded signature moves
+        _write_state(path, tensor, digests, signature)
+        return 'cached'
+    if not _extend_features(tensor, path, digests, signature, first_day):
+        _write_features(tensor, path, digests, signature)
+        return 'full'
+    return 'incremental'
+
+def is_current(path=FEATURES_PATH):
+    meta = _read_meta(path)
+    return meta is not None and demand_tensor.is_current() and meta['tensor_signature'] == _tensor_signature()
+
+def load_features(path=FEATURES_PATH, names=None, mmap_mode='r'):
+    """{'dates', 'product_ids', <feature>: (days, SKUs) memory map}, aligned with the demand tensor."""
+    meta = _read_meta(path)
+    features = {
+        'dates': pd.date_range(meta['start_date'], periods=meta['days'], freq='D', name='date'),
+        'product_ids': pd.Index(meta['product_ids'], name='product_id')
+    }
+    for name in names or meta['features']:
+        features[name] = np.load(f"{path}/{name}.npy", mmap_mode=mmap_mode)
+    return features
+
+def latest(features, names):
+    # Feature values on the last day, one row per SKU
+    return pd.DataFrame({'product_id': features['product_ids'],
+                         **{name: np.asarray(features[name][-1], dtype=np.float64) for name in names}})
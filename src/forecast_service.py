@@ -0,0 +1,390 @@
+"""
+Forecast Service
+
+Local HTTP API (asyncio, standard library only) over the latest pipeline outputs,
+held in memory:
+- GET  /health               artifact versions, request and batching counters
+- GET  /skus                 product_ids known to the service
+- GET  /skus/<product_id>    recommendation row + demand forecast (?horizon=30)
+- POST /skus                 bulk: {"product_ids": [...], "horizon": 30}
+- POST /risk                 re-score stock levels: {"items": [{"product_id": ..., "stock_on_hand": ...}]}
+                             (or a single {"product_id", "stock_on_hand"} object)
+
+Forecasts come from the per-product models in the model registry (any horizon),
+or from data/predictions/product_forecasts when no registry exists. Risk requests
+that arrive together are micro-batched: they queue for up to --batch-window-ms and
+are scored in one vectorized call of the inventory_optimization risk rules.
+
+The artifacts are polled every --reload-interval seconds. When their files change
+(and have stopped changing), a new snapshot is loaded off the event loop and swapped
+in; requests in flight finish on the snapshot they started with.
+
+    python src/forecast_service.py --port 8765
+    curl localhost:8765/skus/PROD_0001?horizon=14
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import time
+from urllib.parse import urlsplit, parse_qs
+
+import numpy as np
+import pandas as pd
+
+import storage
+import model_registry
+from forecasting import FORECAST_HORIZON, PRODUCT_REGISTRY, hw_forecast
+from inventory_optimization import PRODUCT_METRICS_PATH, classify_risks
+
+RECOMMENDATIONS_PATH = "data/optimization/inventory_recommendations"
+PRODUCT_FORECASTS_PATH = "data/predictions/product_forecasts"
+REGISTRY_FILE = f"{model_registry.REGISTRY_PATH}/{PRODUCT_REGISTRY}.json"
+
+HOST = "127.0.0.1"
+PORT = 8765
+RELOAD_INTERVAL = 5.0       # Seconds between artifact checks
+BATCH_WINDOW_MS = 1.0       # How long a risk request waits for others to batch with
+MAX_BATCH = 1024            # Risk requests scored together at most
+MAX_HORIZON = 365
+MAX_BODY_BYTES = 1 << 20
+
+STATUS_TEXT = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+               413: "Payload Too Large", 500: "Internal Server Error"}
+
+# ---------------------------------------------------------------------------
+# Artifacts
+# ---------------------------------------------------------------------------
+
+def artifact_signature():
+    registry = os.stat(REGISTRY_FILE) if os.path.exists(REGISTRY_FILE) else None
+    return (storage.table_signature(RECOMMENDATIONS_PATH), storage.table_signature(PRODUCT_METRICS_PATH),
+            storage.table_signature(PRODUCT_FORECASTS_PATH),
+            None if registry is None else (registry.st_size, registry.st_mtime_ns))
+
+def _registry_forecaster(product_ids):
+    # Stored model state per product: forecasts for any horizon are one array expression
+    registry = model_registry.load_registry(PRODUCT_REGISTRY)
+    entries = [registry.get(product_id) for product_id in product_ids]
+    if not any(entries):
+        return None
+    m = len(next(e for e in entries if e)['season'])
+    missing = {'level': np.nan, 'trend': np.nan, 'season': [np.nan] * m, 'start_date': '1970-01-01', 'n_obs': 0}
+    entries = [e or missing for e in entries]
+    first_dates = (pd.to_datetime([e['start_date'] for e in entries]) +
+                   pd.to_timedelta([e['n_obs'] for e in entries], unit='D'))
+    return {
+        'source': 'registry',
+        'model': {'level': np.array([e['level'] for e in entries], dtype=float),
+                  'trend': np.array([e['trend'] for e in entries], dtype=float),
+                  'season': np.array([e['season'] for e in entries], dtype=float)},
+        'first_date': first_dates.to_numpy()
+    }
+
+def _table_forecaster(product_ids):
+    # Precomputed forecasts (fixed horizon)
+    if not storage.table_exists(PRODUCT_FORECASTS_PATH):
+        return None
+    table = storage.load_table(PRODUCT_FORECASTS_PATH)
+    table['product_id'] = table['product_id'].astype(str)
+    values = table.pivot(index='product_id', columns='date', values='forecasted_quantity').reindex(product_ids)
+    return {
+        'source': 'product_forecasts',
+        'values': values.to_numpy(dtype=float),
+        'first_date': np.full(len(product_ids), values.columns.min().to_datetime64())
+    }
+
+def load_snapshot():
+    """Everything the handlers read, as arrays aligned to one product index."""
+    signature = artifact_signature()
+    recommendations = storage.load_table(RECOMMENDATIONS_PATH)
+    recommendations['product_id'] = recommendations['product_id'].astype(str)
+    recommendations = recommendations.sort_values('product_id', ignore_index=True)
+    product_ids = pd.Index(recommendations['product_id'])
+
+    if storage.table_exists(PRODUCT_METRICS_PATH):
+        metrics = storage.load_table(PRODUCT_METRICS_PATH, columns=['product_id', 'avg_daily_sales', 'reorder_point'])
+        metrics['product_id'] = metrics['product_id'].astype(str)
+        metrics = metrics.set_index('product_id').reindex(product_ids)
+        avg_daily_sales, reorder_point = metrics['avg_daily_sales'].to_numpy(), metrics['reorder_point'].to_numpy()
+    else:
+        # Older runs: no demand rates, so only the reorder-point rule can be applied
+        avg_daily_sales = np.full(len(product_ids), np.nan)
+        reorder_point = recommendations['reorder_point'].to_numpy(dtype=float)
+
+    return {
+        'signature': signature,
+        'loaded_at': time.strftime("%Y-%m-%dT%H:%M:%S"),
+        'product_ids': product_ids,
+        'positions': {product_id: i for i, product_id in enumerate(product_ids)},
+        'date_labels': {},
+        # Serialized once here, so point queries are a dict lookup
+        'records': json.loads(recommendations.to_json(orient='records')),
+        'reorder_point': reorder_point.astype(float),
+        'avg_daily_sales': avg_daily_sales.astype(float),
+        'forecaster': _registry_forecaster(list(product_ids)) or _table_forecaster(list(product_ids))
+    }
+
+def forecast_rows(snapshot, idx, horizon):
+    # (dates per row, values (len(idx), horizon)) clipped at zero like forecast_products
+    forecaster = snapshot['forecaster']
+    if forecaster is None:
+        return None, None
+    if forecaster['source'] == 'registry':
+        model = {key: value[idx] for key, value in forecaster['model'].items()}
+        values = hw_forecast(model, horizon)
+    else:
+        values = forecaster['values'][idx, :horizon]
+    return forecaster['first_date'][idx], np.clip(values, 0, None)
+
+def sku_payload(snapshot, idx, horizon):
+    first_dates, values = forecast_rows(snapshot, idx, horizon)
+    # Products fitted together share their forecast dates: formatted once per snapshot
+    date_labels = snapshot['date_labels']
+    results = []
+    for j, i in enumerate(idx):
+        item = dict(snapshot['records'][i])
+        if values is not None:
+            key = (first_dates[j], values.shape[1])
+            if key not in date_labels:
+                date_labels[key] = list(pd.date_range(first_dates[j], periods=values.shape[1]).strftime("%Y-%m-%d"))
+            dates = date_labels[key]
+            item['forecast'] = [{'date': d, 'forecasted_quantity': None if np.isnan(v) else round(float(v), 4)}
+                                for d, v in zip(dates, values[j])]
+        results.append(item)
+    return results
+
+def score_risks(snapshot, requests):
+    """Score the items of many /risk requests in one vectorized call; one result list per request."""
+    product_ids = [str(item['product_id']) for items in requests for item in items]
+    stock = np.array([float(item['stock_on_hand']) for items in requests for item in items])
+    positions = snapshot['positions']
+    idx = np.array([positions.get(product_id, -1) for product_id in product_ids], dtype=np.int64)
+    known = idx >= 0
+    safe_idx = np.where(known, idx, 0)
+    risk_status, dsi = classify_risks(stock, np.where(known, snapshot['reorder_point'][safe_idx], np.nan),
+                                      np.where(known, snapshot['avg_daily_sales'][safe_idx], np.nan))
+
+    results, position = [], 0
+    for items in requests:
+        rows = []
+        for k in range(position, position + len(items)):
+            if not known[k]:
+                rows.append({'product_id': product_ids[k], 'error': 'unknown product_id'})
+                continue
+            rows.append({
+                'product_id': product_ids[k],
+                'stock_on_hand': stock[k],
+                'reorder_point': float(snapshot['reorder_point'][idx[k]]),
+                'dsi': None if not np.isfinite(dsi[k]) else round(float(dsi[k]), 2),
+                'risk_status': risk_status[k]
+            })
+        results.append(rows)
+        position += len(items)
+    return results
+
+# ---------------------------------------------------------------------------
+# Micro-batching and reload
+# ---------------------------------------------------------------------------
+
+async def risk_batcher(state):
+    queue = state['risk_queue']
+    while True:
+        batch = [await queue.get()]
+        # Let concurrent requests join, then take everything that is queued
+        await asyncio.sleep(state['batch_window'])
+        while not queue.empty() and len(batch) < state['max_batch']:
+            batch.append(queue.get_nowait())
+
+        futures = [future for _, future in batch]
+        try:
+            results = score_risks(state['snapshot'], [items for items, _ in batch])
+        except Exception as e:
+            for future in futures:
+                if not future.done():
+                    future.set_exception(e)
+            continue
+        for future, result in zip(futures, results):
+            if not future.done():
+                future.set_result(result)
+        state['stats']['risk_batches'] += 1
+        state['stats']['risk_requests'] += len(batch)
+
+async def watch_artifacts(state):
+    # Reload once the artifacts changed and look the same on two checks in a row,
+    # so a table that is still being written is not picked up half-way
+    pending = None
+    while True:
+        await asyncio.sleep(state['reload_interval'])
+        signature = artifact_signature()
+        if signature == state['snapshot']['signature']:
+            pending = None
+            continue
+        if signature != pending:
+            pending = signature
+            continue
+        try:
+            snapshot = await asyncio.to_thread(load_snapshot)
+        except Exception as e:
+            print(f"Reload failed, still serving artifacts from {state['snapshot']['loaded_at']}: {e}")
+            continue
+        state['snapshot'] = snapshot
+        state['stats']['reloads'] += 1
+        pending = None
+        print(f"Reloaded artifacts: {len(snapshot['product_ids'])} products")
+
+# ---------------------------------------------------------------------------
+# HTTP
+# ---------------------------------------------------------------------------
+
+def _horizon(value):
+    horizon = int(value)
+    if not 1 <= horizon <= MAX_HORIZON:
+        raise ValueError(f"horizon must be between 1 and {MAX_HORIZON}")
+    return horizon
+
+async def dispatch(state, method, target, body):
+    # -> (status, payload)
+    url = urlsplit(target)
+    query = {key: values[-1] for key, values in parse_qs(url.query).items()}
+    parts = [p for p in url.path.split('/') if p]
+    snapshot = state['snapshot']
+
+    if parts == ['health'] and method == 'GET':
+        stats = state['stats']
+        return 200, {
+            'status': 'ok',
+            'loaded_at': snapshot['loaded_at'],
+            'products': len(snapshot['product_ids']),
+            'forecast_source': None if snapshot['forecaster'] is None else snapshot['forecaster']['source'],
+            **stats,
+            'mean_risk_batch': round(stats['risk_requests'] / stats['risk_batches'], 2) if stats['risk_batches'] else None
+        }
+
+    if parts and parts[0] == 'skus':
+        if len(parts) == 1 and method == 'GET':
+            return 200, {'product_ids': list(snapshot['product_ids'])}
+        if len(parts) == 2 and method == 'GET':
+            i = snapshot['positions'].get(parts[1], -1)
+            if i < 0:
+                return 404, {'error': f"unknown product_id {parts[1]}"}
+            return 200, sku_payload(snapshot, np.array([i]), _horizon(query.get('horizon', FORECAST_HORIZON)))[0]
+        if len(parts) == 1 and method == 'POST':
+            request = json.loads(body or b'{}')
+            product_ids = request.get('product_ids')
+            if product_ids is None:
+                idx = np.arange(len(snapshot['product_ids']))
+            else:
+                idx = np.array([snapshot['positions'].get(str(p), -1) for p in product_ids], dtype=np.int64)
+            unknown = [str(product_ids[k]) for k in np.flatnonzero(idx < 0)] if product_ids is not None else []
+            results = sku_payload(snapshot, idx[idx >= 0], _horizon(request.get('horizon', FORECAST_HORIZON)))
+            return 200, {'results': results, 'unknown': unknown}
+        return 405, {'error': f"{method} not allowed on {url.path}"}
+
+    if parts == ['risk']:
+        if method != 'POST':
+            return 405, {'error': f"{method} not allowed on {url.path}"}
+        request = json.loads(body or b'{}')
+        items = request['items'] if 'items' in request else [request]
+        for item in items:
+            if 'product_id' not in item or 'stock_on_hand' not in item:
+                raise ValueError("each item needs product_id and stock_on_hand")
+            float(item['stock_on_hand'])
+        future = asyncio.get_running_loop().create_future()
+        await state['risk_queue'].put((items, future))
+        results = await future
+        return 200, {'results': results} if 'items' in request else results[0]
+
+    return 404, {'error': f"no route for {url.path}"}
+
+def http_response(status, payload, keep_alive):
+    body = json.dumps(payload).encode()
+    head = (f"HTTP/1.1 {status} {STATUS_TEXT.get(status, '')}\r\n"
+            "Content-Type: application/json\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n")
+    return head.encode() + body
+
+async def handle_connection(reader, writer, state):
+    # HTTP/1.1 with keep-alive: one request at a time per connection
+    try:
+        while True:
+            try:
+                head = await reader.readuntil(b"\r\n\r\n")
+            except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+                break
+            request_line, *header_lines = head.decode('latin-1').rstrip("\r\n").split("\r\n")
+            try:
+                method, target, version = request_line.split(" ", 2)
+            except ValueError:
+                writer.write(http_response(400, {'error': 'malformed request line'}, False))
+                break
+            headers = {}
+            for line in header_lines:
+                name, _, value = line.partition(":")
+                headers[name.strip().lower()] = value.strip()
+            keep_alive = version == "HTTP/1.1" and headers.get('connection', '').lower() != 'close'
+
+            length = int(headers.get('content-length') or 0)
+            if length > MAX_BODY_BYTES:
+                writer.write(http_response(413, {'error': 'request body too large'}, False))
+                break
+            body = await reader.readexactly(length) if length else b''
+
+            state['stats']['requests'] += 1
+            try:
+                status, payload = await dispatch(state, method, target, body)
+            except (ValueError, KeyError, TypeError) as e:
+                # Includes JSON decoding errors (a ValueError)
+                status, payload = 400, {'error': f"bad request: {e}"}
+            except Exception as e:
+                status, payload = 500, {'error': str(e)}
+            writer.write(http_response(status, payload, keep_alive))
+            await writer.drain()
+            if not keep_alive:
+                break
+    except ConnectionError:
+        pass
+    finally:
+        writer.close()
+
+async def serve(host=HOST, port=PORT, reload_interval=RELOAD_INTERVAL, batch_window_ms=BATCH_WINDOW_MS,
+                max_batch=MAX_BATCH):
+    if not storage.table_exists(RECOMMENDATIONS_PATH):
+        raise SystemExit("No inventory recommendations found. Please run the data pipeline first.")
+    state = {
+        'snapshot': load_snapshot(),
+        'risk_queue': asyncio.Queue(),
+        'batch_window': batch_window_ms / 1000,
+        'max_batch': max_batch,
+        'reload_interval': reload_interval,
+        'stats': {'requests': 0, 'risk_requests': 0, 'risk_batches': 0, 'reloads': 0}
+    }
+    background = [asyncio.create_task(risk_batcher(state)), asyncio.create_task(watch_artifacts(state))]
+    server = await asyncio.start_server(lambda r, w: handle_connection(r, w, state), host, port)
+    snapshot = state['snapshot']
+    print(f"Serving {len(snapshot['product_ids'])} products on http://{host}:{port} "
+          f"(forecasts: {snapshot['forecaster']['source'] if snapshot['forecaster'] else 'none'})")
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        for task in background:
+            task.cancel()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve forecasts and reorder decisions over HTTP")
+    parser.add_argument("--host", default=HOST)
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--reload-interval", type=float, default=RELOAD_INTERVAL,
+                        help="Seconds between checks for new pipeline outputs")
+    parser.add_argument("--batch-window-ms", type=float, default=BATCH_WINDOW_MS,
+                        help="How long a risk request waits for others to be scored with")
+    parser.add_argument("--max-batch", type=int, default=MAX_BATCH)
+    args = parser.parse_args()
+
+    try:
+        asyncio.run(serve(args.host, args.port, args.reload_interval, args.batch_window_ms, args.max_batch))
+    except KeyboardInterrupt:
+        pass
@@ -2,29 +2,258 @@ import pandas as pd
 import numpy as np
 import matplotlib.pyplot as plt
 from statsmodels.tsa.holtwinters import ExponentialSmoothing
+from statsmodels.tools.sm_exceptions import ConvergenceWarning
 from sklearn.metrics import mean_absolute_percentage_error, mean_squared_error
 import os
+import argparse
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+
+import storage
+import demand_tensor
+import dimensions
+import feature_store
+from instrumentation import instrument
 
 # Create directories for reports
 os.makedirs("data/predictions", exist_ok=True)
 os.makedirs("reports/figures", exist_ok=True)
 
-def load_data():
-    df = pd.read_csv("data/processed/master_table.csv", parse_dates=['date'])
+# Per-product batch forecasting
+FORECAST_HORIZON = 30
+SEASONAL_PERIODS = 7
+
+# Model registry names (see model_registry.py)
+TOTAL_REGISTRY = 'total_revenue'
+PRODUCT_REGISTRY = 'product_quantity'
+
+# Feature store columns added to the per-product diagnostics (values on the last day)
+PRODUCT_CONTEXT_FEATURES = ['rolling_mean_28', 'rolling_std_28', 'days_since_stockout']
+
+def daily_revenue(master_table):
     # Aggregate to total daily sales for simplicity in this demo
-    daily_sales = df.groupby('date')['revenue'].sum().reset_index()
+    daily_sales = master_table.groupby('date')['revenue'].sum().reset_index()
     daily_sales = daily_sales.set_index('date').asfreq('D').fillna(0)
     return daily_sales
 
-def train_prophet(df):
-    # Optional: Implement Prophet if libraries allow. 
-    # For now, sticking to statsmodels for robustness.
-    pass
+@instrument("Loading data...")
+def load_data():
+    if demand_tensor.is_current():
+        # Row sums of the mapped revenue matrix instead of a groupby over the history
+        tensor = demand_tensor.load_tensor(measures=['revenue'])
+        return demand_tensor.daily_totals(tensor, 'revenue').to_frame()
+    return daily_revenue(storage.load_table("data/processed/master_table", columns=['date', 'revenue']))
+
+@instrument()
+def load_product_data():
+    # Daily demand matrix: one column per product_id, one row per calendar day
+    if demand_tensor.is_current():
+        # Already this shape on disk: a view over the mapped quantity matrix
+        return demand_tensor.frame(demand_tensor.load_tensor(measures=['quantity']), 'quantity')
+    df = storage.load_table("data/processed/master_table", columns=['date', 'product_key', 'quantity'])
+    demand = df.pivot_table(index='date', columns='product_key', values='quantity', aggfunc='sum')
+    demand = demand.asfreq('D').fillna(0)
+    demand.columns = dimensions.product_ids(demand.columns)
+    return demand
+
+# ---------------------------------------------------------------------------
+# Vectorized Holt-Winters kernel (additive trend, additive season)
+#
+# Runs the statsmodels recursions (same smoothing parameters) for a whole matrix
+# of series at once. A fitted "model" is a dict of arrays with one row per series:
+#   params  (N, 3)  smoothing_level, smoothing_trend, smoothing_seasonal
+#   level   (N,)    trend (N,)
+#   season  (N, m)  season[:, 0] is the seasonal term for the next day
+#   initial         the state before the first day (same keys as above)
+# ---------------------------------------------------------------------------
+
+# Parameter grid for the batched search (denser near 0, where noisy daily SKU series land)
+HW_ALPHA_GRID = [0.0, 0.01, 0.03, 0.1, 0.2, 0.4, 0.7]
+HW_BETA_GRID = [0.0, 0.01, 0.05, 0.2]
+HW_GAMMA_GRID = [0.0, 0.01, 0.05, 0.15, 0.4]
+HW_BLOCK_SIZE = 250     # Series scored together (bounds the error buffer held in memory)
+HW_CHECK_TOLERANCE = 0.05
+HW_REFINE_STEPS = [0.02, 0.01, 0.005]   # Pattern-search steps for warm-started refits
+HW_SEARCH_STEPS = [0.05, 0.02, 0.01, 0.005, 0.002]  # Pattern search from each series' grid winner
+HW_SEARCH_ROUNDS = 10   # Moves per step size before the step is halved anyway
+
+def hw_filter(Y, params, state, on_error=None):
+    # Run the recursions over the days (columns) of Y (N, T). params (..., N, 3) and the
+    # state arrays may carry extra leading axes, e.g. (G, N) to score G parameter
+    # candidates against one copy of the data. Error-correction form:
+    #   e = y - (l + b + s),  l += b + alpha*e,  b += alpha*beta*e,  s += gamma*e
+    # Returns the sum of squared one-step errors and the state after the last day.
+    alpha = params[..., 0]
+    alpha_beta = params[..., 0] * params[..., 1]
+    gamma = params[..., 2]
+    level, trend = state['level'].copy(), state['trend'].copy()
+    season = np.moveaxis(state['season'], -1, 0).copy()
+    m = season.shape[0]
+    sse = np.zeros(level.shape)
+    
+    Y_by_day = np.ascontiguousarray(Y.T)
+    for t, y in enumerate(Y_by_day):
+        s_prev = season[t % m]
+        level += trend
+        error = y - level - s_prev
+        sse += error * error
+        level += alpha * error
+        trend += alpha_beta * error
+        s_prev += gamma * error
+        if on_error is not None:
+            on_error(t, error)
+    
+    # Rotate so that season[..., 0] belongs to the next day
+    season = np.roll(np.moveaxis(season, 0, -1), -(len(Y_by_day) % m), axis=-1)
+    return sse, {'level': level, 'trend': trend, 'season': season}
+
+def _zero_state(shape, m):
+    return {'level': np.zeros(shape), 'trend': np.zeros(shape), 'season': np.zeros(shape + (m,))}
+
+def _unit_responses(params, n_obs, m):
+    # For fixed parameters the one-step errors are affine in the initial state
+    # x0 = (level, trend, season): e = e0 + J @ x0, where e0 is the error with x0 = 0
+    # and J (which does not depend on the data) is the response to each unit state.
+    # Returns J with shape (G, T, m + 2) for parameter rows params (G, 3).
+    k = m + 2
+    units = np.repeat(np.eye(k)[:, :, None], len(params), axis=2)     # (k, k, G)
+    state = {'level': units[:, 0], 'trend': units[:, 1], 'season': units[:, 2:].transpose(0, 2, 1)}
+    J = np.empty((n_obs, k, len(params)))
+    
+    def collect(t, error):
+        J[t] = error
+    
+    hw_filter(np.zeros((len(params), n_obs)), params[None], state, on_error=collect)
+    return np.ascontiguousarray(J.transpose(2, 0, 1))
+
+def _ridge(JtJ):
+    # A small ridge keeps the level/season split identifiable when the recursions
+    # cannot tell them apart (e.g. gamma = 0)
+    k = JtJ.shape[-1]
+    return JtJ + (1e-8 * (np.trace(JtJ, axis1=-2, axis2=-1) / k + 1.0))[..., None, None] * np.eye(k)
+
+def hw_fit_initial_state(Y, params, m=SEASONAL_PERIODS):
+    # SSE-optimal initial state for each series at its own parameters (the equivalent
+    # of statsmodels' "estimated" initialization): x0 = -(J'J)^-1 J'e0, in blocks of
+    # HW_BLOCK_SIZE series (J holds T x (m + 2) values per series)
+    n, T = Y.shape
+    x0 = np.empty((n, m + 2))
+    for start in range(0, n, HW_BLOCK_SIZE):
+        block = slice(start, start + HW_BLOCK_SIZE)
+        J = _unit_responses(params[block], T, m)
+        e0 = np.empty((T, len(J)))
+        
+        def collect(t, error):
+            e0[t] = error
+        
+        hw_filter(Y[block], params[block], _zero_state((len(J),), m), on_error=collect)
+        Jte = np.einsum('ntk,tn->nk', J, e0)
+        x0[block] = -np.linalg.solve(_ridge(np.matmul(J.transpose(0, 2, 1), J)), Jte[:, :, None])[:, :, 0]
+    return {'level': x0[:, 0], 'trend': x0[:, 1], 'season': x0[:, 2:]}
+
+def hw_search(Y, params, initial, steps=HW_SEARCH_STEPS, rounds=HW_SEARCH_ROUNDS):
+    # Pattern search from each series' starting parameters, scored by the filter SSE
+    # from a fixed initial state: try +-step on each parameter and keep the best move
+    # while one improves (up to `rounds` moves), then shrink the step. Only the series
+    # still moving are re-scored.
+    params = np.array(params, dtype=float)
+    moves = np.vstack([np.eye(3), -np.eye(3)])
+    best_sse = hw_filter(Y, params, initial)[0]
+    for step in steps:
+        active = np.arange(len(params))
+        for _ in range(rounds):
+            candidates = np.clip(params[active][None] + step * moves[:, None, :], 0.0, 1.0)    # (6, A, 3)
+            state = {key: np.broadcast_to(value[active], (len(moves),) + value[active].shape)
+                     for key, value in initial.items()}
+            sse = hw_filter(Y[active], candidates, state)[0]
+            improved = sse.min(axis=0) < best_sse[active]
+            params[active[improved]] = candidates[sse.argmin(axis=0), np.arange(len(active))][improved]
+            best_sse[active[improved]] = sse.min(axis=0)[improved]
+            active = active[improved]
+            if len(active) == 0:
+                break
+    return params
+
+def hw_grid_sse(Y, grid, m=SEASONAL_PERIODS, J=None):
+    # SSE of every series (N) at every grid point (G), each with its optimal initial
+    # state, from a single filter pass: min |e0 + J x|^2 = |e0|^2 - e0'J (J'J)^-1 J'e0
+    n, T = Y.shape
+    if J is None:
+        J = _unit_responses(grid, T, m)
+    E = np.empty((T, len(grid), n))
+    
+    def collect(t, error):
+        E[t] = error
+    
+    sse0, _ = hw_filter(Y, grid[:, None, :], _zero_state((len(grid), n), m), on_error=collect)
+    Jte = np.matmul(E.transpose(1, 2, 0), J)                                    # (G, N, k)
+    JtJ_inv = np.linalg.inv(_ridge(np.matmul(J.transpose(0, 2, 1), J)))         # (G, k, k)
+    sse = sse0 - np.einsum('gnk,gnk->gn', np.matmul(Jte, JtJ_inv), Jte)
+    return sse.T
+
+def hw_forecast(model, steps):
+    h = np.arange(1, steps + 1)
+    m = model['season'].shape[1]
+    return model['level'][:, None] + h * model['trend'][:, None] + model['season'][:, (h - 1) % m]
 
-def train_exponential_smoothing(train_data, test_data, horizon):
+def fit_holt_winters_batch(Y, m=SEASONAL_PERIODS):
+    # Batched estimation for a matrix of series (N, T): score all series against the
+    # whole parameter grid (blocks of HW_BLOCK_SIZE series), refine each series' best
+    # point with a pattern search from that point's optimal initial state, then solve
+    # the initial state again and run the final filter. 10k series x 365 days fit in
+    # about 10s (grid 6s, search 3s, initial states 1s).
+    Y = np.asarray(Y, dtype=float)
+    grid = np.array([(a, b, g) for a in HW_ALPHA_GRID for b in HW_BETA_GRID for g in HW_GAMMA_GRID])
+    J = _unit_responses(grid, Y.shape[1], m)
+    
+    winners = np.empty((Y.shape[0], 3))
+    for start in range(0, Y.shape[0], HW_BLOCK_SIZE):
+        block = Y[start:start + HW_BLOCK_SIZE]
+        winners[start:start + len(block)] = grid[hw_grid_sse(block, grid, m, J).argmin(axis=1)]
+    params = hw_search(Y, winners, hw_fit_initial_state(Y, winners, m))
+    
+    initial = hw_fit_initial_state(Y, params, m)
+    sse, state = hw_filter(Y, params, initial)
+    return {'params': params, 'sse': sse, 'n_obs': Y.shape[1], 'initial': initial, **state}
+
+def refit_holt_winters_batch(Y, params, initial, m=SEASONAL_PERIODS):
+    # Warm-started refit: a short pattern search around each series' previous
+    # parameters (starting from its previous initial state) instead of the full grid
+    Y = np.asarray(Y, dtype=float)
+    params = hw_search(Y, params, initial, HW_REFINE_STEPS, rounds=1)
+    
+    initial = hw_fit_initial_state(Y, params, m)
+    sse, state = hw_filter(Y, params, initial)
+    return {'params': params, 'sse': sse, 'n_obs': Y.shape[1], 'initial': initial, **state}
+
+def train_prophet(train_data, test_data, horizon):
+    # Same inputs and outputs as train_exponential_smoothing. Prophet is imported
+    # only when used, so the other models run without it installed.
+    from prophet import Prophet
+    
+    model = Prophet(weekly_seasonality=True, yearly_seasonality=len(train_data) >= 2 * 365, daily_seasonality=False)
+    model.fit(pd.DataFrame({'ds': train_data.index, 'y': train_data['revenue'].to_numpy()}))
+    future = pd.DataFrame({'ds': pd.date_range(start=train_data.index.max() + pd.Timedelta(days=1),
+                                               periods=len(test_data) + horizon)})
+    future_forecast = pd.Series(model.predict(future)['yhat'].to_numpy(), index=future['ds'])
+    forecast = future_forecast.iloc[:len(test_data)]
+    
+    return forecast, future_forecast, model
+
+@instrument()
+def train_exponential_smoothing(train_data, test_data, horizon, backend='statsmodels'):
     # Triple Exponential Smoothing (Holt-Winters)
     # Additive trend, Additive seasonality (assuming 7-day or yearly?)
     # Valid seasons: 7 (weekly)
+    # backend='numpy' uses the vectorized kernel above instead of statsmodels
+    
+    if backend == 'numpy':
+        model = fit_holt_winters_batch(train_data['revenue'].to_numpy()[None, :])
+        steps = hw_forecast(model, len(test_data) + horizon)[0]
+        index = pd.date_range(start=train_data.index.max() + pd.Timedelta(days=1), periods=len(steps))
+        forecast = pd.Series(steps[:len(test_data)], index=index[:len(test_data)])
+        future_forecast = pd.Series(steps, index=index)
+        return forecast, future_forecast, model
     
     model = ExponentialSmoothing(
         train_data['revenue'],
@@ -38,18 +267,128 @@ def train_exponential_smoothing(train_data, test_data, horizon):
     
     return forecast, future_forecast, model
 
+def fit_statsmodels(series, start_params=None):
+    # statsmodels Holt-Winters fit of one series (the setup used for total revenue),
+    # with the fit diagnostics. start_params (alpha, beta, gamma, level0, trend0,
+    # season0...) warm-starts the optimizer. Exceptions propagate to the caller.
+    with warnings.catch_warnings(record=True) as caught:
+        warnings.simplefilter("always")
+        model = ExponentialSmoothing(series, trend='add', seasonal='add', seasonal_periods=SEASONAL_PERIODS)
+        if start_params is None:
+            model = model.fit()
+        else:
+            model = model.fit(start_params=start_params, use_brute=False)
+    
+    retvals = getattr(model, 'mle_retvals', None)
+    return model, {
+        'converged': bool(getattr(retvals, 'success', True)) and not any(
+            issubclass(w.category, ConvergenceWarning) for w in caught),
+        'sse': model.sse,
+        'aic': model.aic,
+        'alpha': model.params['smoothing_level'],
+        'beta': model.params['smoothing_trend'],
+        'gamma': model.params['smoothing_seasonal'],
+        'message': "; ".join(sorted({str(w.message) for w in caught}))
+    }
+
+def fit_product_forecast(task):
+    # Fit the Holt-Winters setup used for total revenue on one product's demand.
+    # Failures are reported in the diagnostics instead of raised, so one bad SKU
+    # cannot abort a batch run.
+    product_id, series, horizon = task
+    diagnostics = {'product_id': product_id, 'n_obs': len(series), 'status': 'ok', 'converged': True,
+                   'sse': np.nan, 'aic': np.nan, 'alpha': np.nan, 'beta': np.nan, 'gamma': np.nan, 'message': ''}
+    try:
+        model, fit = fit_statsmodels(series)
+        forecast = model.forecast(steps=horizon)
+        diagnostics.update(fit)
+    except Exception as e:
+        forecast = None
+        diagnostics.update({'status': 'failed', 'converged': False, 'message': str(e)})
+    
+    return forecast, diagnostics
+
+def _model_results(demand, model, horizon, messages=None):
+    # Kernel-layout model for all products -> same (forecast, diagnostics) pairs as
+    # fit_product_forecast. model['fits'] holds each series' status, converged flag,
+    # aic and fit message.
+    forecasts = hw_forecast(model, horizon)
+    results = []
+    for i, product_id in enumerate(demand.columns):
+        alpha, beta, gamma = model['params'][i]
+        fit = model['fits'][i]
+        message = "; ".join(m for m in [messages[i] if messages is not None else '', fit['message']] if m)
+        results.append((forecasts[i] if fit['status'] == 'ok' else None, {
+            'product_id': product_id, 'n_obs': model['n_obs'], 'status': fit['status'], 'converged': fit['converged'],
+            'sse': model['sse'][i], 'aic': fit['aic'], 'alpha': alpha, 'beta': beta, 'gamma': gamma,
+            'message': message
+        }))
+    return results
+
+def kernel_fits(sse):
+    # Fit diagnostics of kernel fits: the kernel does not raise on bad data, missing
+    # values show up as a NaN SSE
+    return [{'status': 'ok', 'converged': True, 'aic': np.nan, 'message': ''} if np.isfinite(value) else
+            {'status': 'failed', 'converged': False, 'aic': np.nan, 'message': 'non-finite SSE (missing values?)'}
+            for value in sse]
+
+def fit_products_numpy(demand, horizon):
+    # All products in one call to the vectorized kernel
+    model = fit_holt_winters_batch(demand.to_numpy().T)
+    return _model_results(demand, {**model, 'fits': kernel_fits(model['sse'])}, horizon)
+
+def forecast_products(demand, horizon=FORECAST_HORIZON, workers=None, chunksize=8, backend='statsmodels',
+                      use_registry=False):
+    # Fit every product column of `demand`: statsmodels across a process pool, or the
+    # vectorized kernel on the whole matrix at once. With use_registry, models kept
+    # from earlier runs are reused or rolled forward instead of refitted.
+    if use_registry:
+        import model_registry   # Imported here: model_registry imports this module
+        model, status = model_registry.fit_with_registry(PRODUCT_REGISTRY, list(demand.columns), demand.to_numpy().T,
+                                                         demand.index.min(), backend=backend, workers=workers,
+                                                         chunksize=chunksize)
+        results = _model_results(demand, model, horizon, messages=[f"registry: {s}" for s in status])
+    elif backend == 'numpy':
+        results = fit_products_numpy(demand, horizon)
+    else:
+        tasks = [(product_id, demand[product_id], horizon) for product_id in demand.columns]
+        if workers == 1:
+            results = list(map(fit_product_forecast, tasks))
+        else:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                results = list(executor.map(fit_product_forecast, tasks, chunksize=chunksize))
+    
+    future_dates = pd.date_range(start=demand.index.max() + pd.Timedelta(days=1), periods=horizon)
+    forecasts = []
+    for forecast, diagnostics in results:
+        if forecast is not None:
+            forecasts.append(pd.DataFrame({
+                'date': future_dates,
+                'product_id': diagnostics['product_id'],
+                # Negative demand is not meaningful for replenishment
+                'forecasted_quantity': np.clip(np.asarray(forecast), 0, None)
+            }))
+    
+    forecast_df = pd.concat(forecasts, ignore_index=True) if forecasts else \
+        pd.DataFrame(columns=['date', 'product_id', 'forecasted_quantity'])
+    diagnostics_df = pd.DataFrame([diagnostics for _, diagnostics in results])
+    return forecast_df, diagnostics_df
+
 def evaluate_model(actual, forecast, model_name):
     mape = mean_absolute_percentage_error(actual, forecast)
     rmse = np.sqrt(mean_squared_error(actual, forecast))
     print(f"Model: {model_name} | MAPE: {mape:.2%} | RMSE: {rmse:.2f}")
     return mape, rmse
 
-if __name__ == "__main__":
+def run_total_forecast(backend='statsmodels', use_registry=True, daily_sales=None):
+    import model_registry   # Imported here: model_registry imports this module
+    
     print("-" * 50)
     print("Starting Sales Forecasting Pipeline...")
     print("-" * 50)
-    print("Loading data...")
-    df = load_data()
+    if daily_sales is None:
+        daily_sales = load_data()
+    df = daily_sales
     
     # Split Train/Test (Last 30 days for testing)
     test_days = 30
@@ -61,7 +400,14 @@ if __name__ == "__main__":
     
     # Train Model
     print("Training Exponential Smoothing Model...")
-    forecast_test, forecast_future, model = train_exponential_smoothing(train_data, test_data, horizon=30)
+    if use_registry:
+        model, status = model_registry.fit_with_registry(
+            TOTAL_REGISTRY, ['holdout'], train_data['revenue'].to_numpy()[None, :], train_data.index.min(), backend=backend
+        )
+        forecast_test = pd.Series(hw_forecast(model, len(test_data))[0], index=test_data.index)
+        print(f"Holdout model: {status[0]}")
+    else:
+        forecast_test, forecast_future, model = train_exponential_smoothing(train_data, test_data, horizon=30, backend=backend)
     
     # Evaluate
     evaluate_model(test_data['revenue'], forecast_test, "Exponential Smoothing")
@@ -79,13 +425,22 @@ if __name__ == "__main__":
     # Let's simplify: forecast from END of ALL data.
     
     # Re-train on ALL data for final forecast
-    final_model = ExponentialSmoothing(
-        df['revenue'],
-        trend='add',
-        seasonal='add',
-        seasonal_periods=7
-    ).fit()
-    final_forecast_30 = final_model.forecast(steps=30)
+    if use_registry:
+        final_model, status = model_registry.fit_with_registry(
+            TOTAL_REGISTRY, ['full'], df['revenue'].to_numpy()[None, :], df.index.min(), backend=backend
+        )
+        final_forecast_30 = hw_forecast(final_model, 30)[0]
+        print(f"Final model: {status[0]}")
+    elif backend == 'numpy':
+        final_forecast_30 = hw_forecast(fit_holt_winters_batch(df['revenue'].to_numpy()[None, :]), 30)[0]
+    else:
+        final_model = ExponentialSmoothing(
+            df['revenue'],
+            trend='add',
+            seasonal='add',
+            seasonal_periods=7
+        ).fit()
+        final_forecast_30 = final_model.forecast(steps=30)
     
     plt.plot(future_dates, final_forecast_30, label='Future Forecast (30 Days)', color='orange')
     
@@ -99,6 +454,91 @@ if __name__ == "__main__":
         'date': future_dates,
         'forecasted_revenue': final_forecast_30
     })
-    forecast_df.to_csv("data/predictions/forecast_30days.csv", index=False)
+    storage.save_table(forecast_df, "data/predictions/forecast_30days", export_csv=True)
     
     print("Forecasting complete. Results saved.")
+    return forecast_df
+
+def run_product_forecasts(workers=None, chunksize=8, backend='statsmodels', use_registry=True):
+    print("Loading per-product demand...")
+    demand = load_product_data()
+    print(f"Fitting {demand.shape[1]} products on {demand.shape[0]} days (backend={backend})...")
+    
+    forecast_df, diagnostics_df = forecast_products(demand, FORECAST_HORIZON, workers=workers, chunksize=chunksize,
+                                                    backend=backend, use_registry=use_registry)
+    if feature_store.is_current():
+        # Recent demand level and stockout context at the forecast origin, next to each fit
+        context = feature_store.latest(feature_store.load_features(names=PRODUCT_CONTEXT_FEATURES),
+                                       PRODUCT_CONTEXT_FEATURES)
+        diagnostics_df = diagnostics_df.merge(context, on='product_id', how='left')
+    storage.save_table(forecast_df, "data/predictions/product_forecasts")
+    storage.save_table(diagnostics_df, "data/predictions/product_forecast_diagnostics", export_csv=True)
+    
+    failed = diagnostics_df[diagnostics_df['status'] != 'ok']
+    print(f"Fitted {len(diagnostics_df) - len(failed)} products "
+          f"({(~diagnostics_df['converged']).sum()} with convergence warnings, {len(failed)} failed).")
+    print("Per-product forecasting complete. Results saved.")
+
+def check_numpy_backend(tolerance=HW_CHECK_TOLERANCE):
+    # Compare the vectorized kernel with statsmodels on the master_table data: the mean
+    # absolute gap between the two 30-day forecasts, relative to the series' mean level.
+    # Every series (total revenue and each product) must be within tolerance. The
+    # in-sample SSE comparison is reported for information only: where the forecasts
+    # drift apart it shows which backend found the better fit (near alpha = 0 the SSE
+    # is flat and statsmodels' optimizer can stop early).
+    daily_sales = load_data()
+    demand = load_product_data()
+    
+    kernel_model = fit_holt_winters_batch(daily_sales['revenue'].to_numpy()[None, :])
+    kernel_total = hw_forecast(kernel_model, FORECAST_HORIZON)[0]
+    statsmodels_total, _ = fit_product_forecast(('total', daily_sales['revenue'], FORECAST_HORIZON))
+    total_gap = np.abs(kernel_total - np.asarray(statsmodels_total)).mean() / daily_sales['revenue'].mean()
+    
+    kernel_results = fit_products_numpy(demand, FORECAST_HORIZON)
+    product_gaps, better_fits, failed = [], [], []
+    for product_id, (kernel_forecast, kernel_diagnostics) in zip(demand.columns, kernel_results):
+        statsmodels_forecast, diagnostics = fit_product_forecast((product_id, demand[product_id], FORECAST_HORIZON))
+        if diagnostics['status'] != 'ok':
+            continue
+        gap = np.abs(kernel_forecast - np.asarray(statsmodels_forecast)).mean() / max(demand[product_id].mean(), 1e-9)
+        product_gaps.append(gap)
+        better_fits.append(kernel_diagnostics['sse'] <= diagnostics['sse'])
+        if gap > tolerance:
+            failed.append(f"{product_id} ({gap:.2%})")
+    product_gaps, better_fits = np.array(product_gaps), np.array(better_fits, dtype=bool)
+    over = product_gaps > tolerance
+    
+    print(f"Total revenue: relative gap {total_gap:.2%}")
+    print(f"Products: median gap {np.median(product_gaps):.2%}, 90th percentile {np.percentile(product_gaps, 90):.2%}, "
+          f"worst {product_gaps.max():.2%}")
+    if failed:
+        print(f"Over tolerance: {', '.join(failed)}")
+        print(f"(for information: the kernel's in-sample SSE is lower than statsmodels' "
+              f"for {(over & better_fits).sum()} of these {over.sum()})")
+    passed = total_gap <= tolerance and not failed
+    print(f"Backend check {'passed' if passed else 'FAILED'} (tolerance {tolerance:.0%})")
+    return passed
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Forecast daily sales")
+    parser.add_argument("--per-product", action="store_true",
+                        help="Forecast demand for every product_id instead of total revenue")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: all cores)")
+    parser.add_argument("--chunksize", type=int, default=8, help="Products sent to a worker per task")
+    parser.add_argument("--backend", choices=['statsmodels', 'numpy'], default='statsmodels',
+                        help="Holt-Winters implementation (numpy = vectorized multi-series kernel)")
+    parser.add_argument("--check-backend", action="store_true",
+                        help="Compare the numpy kernel against statsmodels on master_table and exit")
+    parser.add_argument("--check-tolerance", type=float, default=HW_CHECK_TOLERANCE,
+                        help="Largest forecast gap allowed by --check-backend, relative to the series' mean")
+    parser.add_argument("--no-registry", action="store_true",
+                        help="Always fit from scratch instead of reusing models from earlier runs")
+    args = parser.parse_args()
+    
+    if args.check_backend:
+        raise SystemExit(0 if check_numpy_backend(args.check_tolerance) else 1)
+    elif args.per_product:
+        run_product_forecasts(workers=args.workers, chunksize=args.chunksize, backend=args.backend,
+                              use_registry=not args.no_registry)
+    else:
+        run_total_forecast(backend=args.backend, use_registry=not args.no_registry)
@@ -0,0 +1,150 @@
+"""
+Instrumentation Module
+
+Per-call metrics for the pipeline's hot functions, switched on by environment variable:
+- SALES_INSTRUMENT=1        append one JSON line per instrumented call: wall time, CPU
+                            time, peak memory above the starting point (tracemalloc),
+                            input/output row counts
+- SALES_INSTRUMENT_LOG      where the lines go (default logs/instrumentation.jsonl)
+- SALES_INSTRUMENT_MEMORY=0 skip memory tracking (tracemalloc slows Python-heavy code)
+- SALES_PROFILE_DIR=<dir>   also dump a cProfile file per outermost instrumented call
+                            (view with `python -m pstats`, snakeviz or flameprof)
+
+With everything off, `instrument` returns the function itself (or a wrapper that
+only prints its progress message), so there is no measurement overhead.
+"""
+
+import cProfile
+import functools
+import json
+import os
+import time
+import tracemalloc
+
+import pandas as pd
+
+ENABLED = os.environ.get("SALES_INSTRUMENT", "").lower() not in ("", "0", "false", "no")
+LOG_PATH = os.environ.get("SALES_INSTRUMENT_LOG", "logs/instrumentation.jsonl")
+TRACK_MEMORY = os.environ.get("SALES_INSTRUMENT_MEMORY", "1").lower() not in ("0", "false", "no")
+PROFILE_DIR = os.environ.get("SALES_PROFILE_DIR")
+
+# Peak memory seen so far by each active instrumented call (innermost last)
+_memory_stack = []
+_owns_tracing = False
+_depth = 0
+_profile_count = 0
+
+def count_rows(value):
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        return len(value)
+    if isinstance(value, (tuple, list)):
+        counts = [count_rows(v) for v in value]
+        counts = [c for c in counts if c is not None]
+        return sum(counts) if counts else None
+    if isinstance(value, dict):
+        return count_rows(list(value.values()))
+    return None
+
+def _stage_name(fn):
+    module = fn.__module__
+    if module == "__main__":
+        module = os.path.splitext(os.path.basename(fn.__globals__.get("__file__", module)))[0]
+    return f"{module}.{fn.__qualname__}"
+
+def write_record(record):
+    # One write per line on an O_APPEND descriptor, so lines from pool workers do not interleave
+    directory = os.path.dirname(LOG_PATH)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    fd = os.open(LOG_PATH, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+    try:
+        os.write(fd, (json.dumps(record) + "\n").encode())
+    finally:
+        os.close(fd)
+
+def _memory_enter():
+    global _owns_tracing
+    if not tracemalloc.is_tracing():
+        tracemalloc.start()
+        _owns_tracing = True
+    current, peak = tracemalloc.get_traced_memory()
+    if _memory_stack:
+        _memory_stack[-1] = max(_memory_stack[-1], peak)
+    tracemalloc.reset_peak()
+    _memory_stack.append(current)
+    return current
+
+def _memory_exit(start):
+    global _owns_tracing
+    peak = max(_memory_stack.pop(), tracemalloc.get_traced_memory()[1])
+    if _memory_stack:
+        # The enclosing call saw this peak too
+        _memory_stack[-1] = max(_memory_stack[-1], peak)
+    elif _owns_tracing:
+        tracemalloc.stop()
+        _owns_tracing = False
+    return (peak - start) / 2**20
+
+def _profile_path(stage):
+    global _profile_count
+    _profile_count += 1
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    return os.path.join(PROFILE_DIR, f"{stage}-{os.getpid()}-{_profile_count}.prof")
+
+def instrument(message=None):
+    """Decorator for a pipeline stage. `message` is printed as the progress line
+    when the function is called, replacing the old print at the top of its body."""
+    def decorator(fn):
+        if not ENABLED and not PROFILE_DIR:
+            if message is None:
+                return fn
+
+            @functools.wraps(fn)
+            def progress_only(*args, **kwargs):
+                print(message)
+                return fn(*args, **kwargs)
+            return progress_only
+
+        stage = _stage_name(fn)
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            global _depth
+            if message is not None:
+                print(message)
+            # Profilers do not nest: only the outermost instrumented call is profiled
+            profiler = cProfile.Profile() if PROFILE_DIR and _depth == 0 else None
+            _depth += 1
+            memory_start = _memory_enter() if ENABLED and TRACK_MEMORY else None
+            wall_start, cpu_start = time.perf_counter(), time.process_time()
+            status = "ok"
+            result = None
+            try:
+                if profiler is not None:
+                    result = profiler.runcall(fn, *args, **kwargs)
+                else:
+                    result = fn(*args, **kwargs)
+                return result
+            except Exception:
+                status = "error"
+                raise
+            finally:
+                _depth -= 1
+                wall, cpu = time.perf_counter() - wall_start, time.process_time() - cpu_start
+                memory_mb = _memory_exit(memory_start) if memory_start is not None else None
+                if profiler is not None:
+                    profiler.dump_stats(_profile_path(stage))
+                if ENABLED:
+                    write_record({
+                        "ts": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                        "stage": stage,
+                        "status": status,
+                        "wall_s": round(wall, 6),
+                        "cpu_s": round(cpu, 6),
+                        "peak_mem_mb": None if memory_mb is None else round(memory_mb, 3),
+                        "rows_in": count_rows(list(args) + list(kwargs.values())),
+                        "rows_out": count_rows(result),
+                        "pid": os.getpid()
+                    })
+        return wrapper
+    return decorator
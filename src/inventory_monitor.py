@@ -0,0 +1,277 @@
+"""
+Inventory Monitor
+
+Streaming counterpart of identify_risks: consumes sales and stock events as they
+happen and raises reorder/overstock alerts without waiting for the nightly batch.
+- Events are JSON objects, one per line, read from a file that is tailed (e.g. a
+  log shipped by the point-of-sale system) or from an asyncio.Queue (in-process):
+    {"type": "sale",  "date": "2024-06-01", "product_id": "PROD_0001", "quantity": 3}
+    {"type": "stock", "date": "2024-06-01", "product_id": "PROD_0001", "stock_on_hand": 40}
+- Per SKU, the last DEMAND_WINDOW_DAYS daily quantities sit in a ring buffer, with
+  running sums of quantity and quantity^2. A sale updates one bucket and both sums;
+  a new day evicts the oldest bucket. Every event is O(1) (amortized over the days
+  it advances), and rolling mean/variance are read from the sums. Quantities are
+  whole units, so the sums stay exact.
+- Only the touched SKU is re-evaluated: its reorder point (same formulas as
+  calculate_inventory_metrics) and its risk status (classify_risks). A sale also
+  draws down the known stock until the next stock snapshot replaces it.
+- An alert is emitted when a SKU's status changes to low stock or overstock. Alerts
+  are appended to ALERTS_PATH (flushed per alert) and printed, with the time from
+  reading the event to the alert.
+
+The starting state (window, stock, policy inputs, statuses) is taken from the
+latest pipeline outputs, so the monitor picks up where the batch run ended.
+
+    python src/inventory_monitor.py --events data/stream/events.jsonl
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+import storage
+import demand_tensor
+from inventory_optimization import (DEMAND_WINDOW_DAYS, RISK_HEALTHY, Z_SCORE, load_data,
+                                    calculate_inventory_metrics, identify_risks, reorder_policy,
+                                    classify_risks)
+from inventory_simulation import demand_history
+
+ALERTS_PATH = "data/optimization/inventory_alerts.jsonl"
+EVENTS_PATH = "data/stream/events.jsonl"
+POLL_INTERVAL = 0.005       # Seconds between reads when the tailed file has no new lines
+
+# ---------------------------------------------------------------------------
+# State
+# ---------------------------------------------------------------------------
+
+def _day(date):
+    # Days since the epoch: ring positions and window arithmetic use plain ints
+    return int(np.datetime64(str(date)[:10], 'D').astype(np.int64))
+
+def _latest_date(master_table):
+    if demand_tensor.is_tensor(master_table):
+        return master_table['dates'][-1]
+    if isinstance(master_table, str):
+        return storage.date_range(master_table)[1]
+    return master_table['date'].max()
+
+def initial_state(window_days=DEMAND_WINDOW_DAYS, z_score=Z_SCORE):
+    """Per-SKU arrays seeded from the latest outputs: the demand window, stock and
+    risk status on the last day, and the lead times of the reorder policy."""
+    master_table, products = load_data()
+    product_metrics = calculate_inventory_metrics(master_table, products, z_score=z_score)
+    risk_analysis = identify_risks(master_table, product_metrics)
+    # SKUs without a supplier lead time have no reorder policy: they are not monitored
+    # and their events are counted as skipped
+    missing = risk_analysis['lead_time_days'].isna()
+    if missing.any():
+        print(f"Not monitoring {missing.sum()} products without a supplier lead time")
+        risk_analysis = risk_analysis[~missing].reset_index(drop=True)
+    product_ids = pd.Index(risk_analysis['product_id'].astype(str))
+    history = demand_history(master_table, product_ids)[:, -window_days:]
+
+    # Column j of the history is day last_day - (n_days - 1 - j); ring slot = day % window
+    last_day = _day(_latest_date(master_table))
+    n_days = history.shape[1]
+    ring = np.zeros((len(product_ids), window_days))
+    ring[:, (last_day - np.arange(n_days)[::-1]) % window_days] = history
+
+    return {
+        'product_ids': product_ids,
+        'positions': {product_id: i for i, product_id in enumerate(product_ids)},
+        'window_days': window_days,
+        'z_score': z_score,
+        'lead_time_days': risk_analysis['lead_time_days'].to_numpy(dtype=float),
+        'ring': ring,
+        'day': np.full(len(product_ids), last_day, dtype=np.int64),
+        'n_days': np.full(len(product_ids), n_days, dtype=np.int64),
+        'sum': history.sum(axis=1),
+        'sum_sq': (history * history).sum(axis=1),
+        'stock': risk_analysis['stock_on_hand'].to_numpy(dtype=float),
+        'stock_day': np.full(len(product_ids), last_day, dtype=np.int64),
+        'reorder_point': risk_analysis['reorder_point'].to_numpy(dtype=float),
+        'risk_status': risk_analysis['risk_status'].to_numpy(dtype=object),
+        'stats': {'events': 0, 'skipped': 0, 'alerts': 0},
+        'latencies': []             # ms from reading an event to its alert
+    }
+
+def advance(state, i, day):
+    # Move SKU i's window forward to `day`, evicting the days that fall out of it
+    window = state['window_days']
+    ring = state['ring'][i]
+    for d in range(state['day'][i] + 1, min(day, state['day'][i] + window) + 1):
+        old = ring[d % window]
+        state['sum'][i] -= old
+        state['sum_sq'][i] -= old * old
+        ring[d % window] = 0.0
+    state['n_days'][i] = min(window, state['n_days'][i] + day - state['day'][i])
+    state['day'][i] = day
+
+def add_sale(state, i, day, quantity):
+    # Adds to the day's bucket; sales older than the window only draw down stock
+    if day > state['day'][i]:
+        advance(state, i, day)
+    if day > state['day'][i] - state['window_days']:
+        slot = day % state['window_days']
+        old = state['ring'][i, slot]
+        state['ring'][i, slot] = old + quantity
+        state['sum'][i] += quantity
+        state['sum_sq'][i] += (old + quantity) ** 2 - old * old
+    if day >= state['stock_day'][i]:
+        state['stock'][i] = max(state['stock'][i] - quantity, 0.0)
+
+def set_stock(state, i, day, stock_on_hand):
+    # A snapshot replaces the running stock unless a later one was already seen
+    if day > state['day'][i]:
+        advance(state, i, day)
+    if day >= state['stock_day'][i]:
+        state['stock'][i] = stock_on_hand
+        state['stock_day'][i] = day
+
+def window_stats(state, i):
+    # Mean and sample std of daily demand over the window, from the running sums
+    n = state['n_days'][i]
+    mean = state['sum'][i] / n
+    if n < 2:
+        return mean, np.nan
+    var = max(state['sum_sq'][i] - state['sum'][i] * mean, 0.0) / (n - 1)
+    return mean, np.sqrt(var)
+
+def evaluate(state, i):
+    """Re-evaluate SKU i: returns (risk_status, dsi, avg_daily_sales)."""
+    mean, std = window_stats(state, i)
+    _, reorder_point = reorder_policy(mean, std, state['lead_time_days'][i], state['z_score'])
+    risk_status, dsi = classify_risks(np.array([state['stock'][i]]), np.array([reorder_point]), np.array([mean]))
+    state['reorder_point'][i] = reorder_point
+    return risk_status[0], dsi[0], mean
+
+def handle_event(state, event, received_at):
+    """Apply one event and re-evaluate its SKU; returns an alert dict when the SKU's
+    status changes to a risk, else None. Malformed or unknown events are counted and skipped."""
+    try:
+        i = state['positions'][str(event['product_id'])]
+        day = _day(event['date'])
+        if event['type'] == 'sale':
+            add_sale(state, i, day, float(event['quantity']))
+        elif event['type'] == 'stock':
+            set_stock(state, i, day, float(event['stock_on_hand']))
+        else:
+            raise ValueError(f"unknown event type {event['type']!r}")
+    except (KeyError, ValueError, TypeError):
+        state['stats']['skipped'] += 1
+        return None
+    state['stats']['events'] += 1
+
+    risk_status, dsi, avg_daily_sales = evaluate(state, i)
+    previous = state['risk_status'][i]
+    state['risk_status'][i] = risk_status
+    if risk_status == previous or risk_status == RISK_HEALTHY:
+        return None
+    state['stats']['alerts'] += 1
+    return {
+        'product_id': state['product_ids'][i],
+        'date': str(event['date'])[:10],
+        'risk_status': risk_status,
+        'previous_status': previous,
+        'stock_on_hand': float(state['stock'][i]),
+        'reorder_point': float(state['reorder_point'][i]),
+        'avg_daily_sales': round(float(avg_daily_sales), 4),
+        'dsi': None if not np.isfinite(dsi) else round(float(dsi), 2),
+        'latency_ms': round((time.perf_counter() - received_at) * 1000, 3)
+    }
+
+# ---------------------------------------------------------------------------
+# Event sources: async iterators of (event, perf_counter time it was received)
+# ---------------------------------------------------------------------------
+
+async def tail_events(path, from_start=False, exit_at_eof=False, poll_interval=POLL_INTERVAL):
+    # Follows the file like `tail -f`: a partial last line waits for its newline,
+    # and a truncated (rotated) file is read again from the top
+    while not os.path.exists(path):
+        if exit_at_eof:
+            return
+        await asyncio.sleep(poll_interval)
+    with open(path) as f:
+        if not from_start:
+            f.seek(0, os.SEEK_END)
+        partial = ""
+        while True:
+            line = f.readline()
+            if not line:
+                if exit_at_eof:
+                    return
+                if os.path.getsize(path) < f.tell():
+                    f.seek(0)
+                    partial = ""
+                await asyncio.sleep(poll_interval)
+                continue
+            received_at = time.perf_counter()
+            partial += line
+            if not partial.endswith("\n"):
+                continue
+            line, partial = partial, ""
+            if not line.strip():
+                continue
+            try:
+                yield json.loads(line), received_at
+            except ValueError:
+                yield {}, received_at          # Counted as skipped
+
+async def queue_events(queue):
+    # In-process stand-in for a message queue; None ends the stream
+    while True:
+        event = await queue.get()
+        if event is None:
+            return
+        yield event, time.perf_counter()
+
+async def run_monitor(state, events, alerts_path=ALERTS_PATH, verbose=True):
+    # Consume events until the source ends
+    if os.path.dirname(alerts_path):
+        os.makedirs(os.path.dirname(alerts_path), exist_ok=True)
+    with open(alerts_path, 'a') as alerts_file:
+        async for event, received_at in events:
+            alert = handle_event(state, event, received_at)
+            if alert is None:
+                continue
+            alerts_file.write(json.dumps(alert) + "\n")
+            alerts_file.flush()
+            state['latencies'].append(alert['latency_ms'])
+            if verbose:
+                print(f"[{alert['date']}] {alert['product_id']}: {alert['risk_status']} "
+                      f"(stock {alert['stock_on_hand']:g}, ROP {alert['reorder_point']:g}, {alert['latency_ms']:.2f} ms)")
+
+def print_summary(state):
+    stats, latencies = state['stats'], state['latencies']
+    print(f"\nProcessed {stats['events']:,} events ({stats['skipped']:,} skipped), {stats['alerts']:,} alerts")
+    if latencies:
+        p50, p99 = np.percentile(latencies, [50, 99])
+        print(f"Alert latency: p50 {p50:.3f} ms, p99 {p99:.3f} ms")
+    print(pd.Series(state['risk_status']).value_counts().to_string())
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Stream sales/stock events and raise inventory alerts")
+    parser.add_argument("--events", default=EVENTS_PATH, help="JSON-lines event file to tail")
+    parser.add_argument("--alerts", default=ALERTS_PATH, help="JSON-lines file alerts are appended to")
+    parser.add_argument("--from-start", action="store_true", help="Read the event file from the beginning")
+    parser.add_argument("--exit-at-eof", action="store_true",
+                        help="Stop at the end of the event file instead of waiting for more (replays)")
+    parser.add_argument("--quiet", action="store_true", help="Do not print each alert")
+    args = parser.parse_args()
+
+    print("Loading latest inventory state...")
+    state = initial_state()
+    print(f"Monitoring {len(state['product_ids'])} products, {state['window_days']}-day demand window; "
+          f"events from {args.events}")
+
+    try:
+        asyncio.run(run_monitor(state, tail_events(args.events, args.from_start, args.exit_at_eof),
+                                args.alerts, verbose=not args.quiet))
+    except KeyboardInterrupt:
+        pass
+    print_summary(state)
@@ -5,6 +5,8 @@ This module calculates optimal inventory parameters for each product:
 - Safety Stock: Buffer stock to maintain service level
 - Reorder Point (ROP): Inventory level triggering new orders
 - Economic Order Quantity (EOQ): Cost-minimizing order size
+- What-if scenarios: the same policy over a grid of service levels, order costs,
+  holding rates and lead times, evaluated for every SKU in one vectorized pass
 
 Uses historical sales data to identify stockout risks and overstock situations.
 """
@@ -12,46 +14,111 @@ Uses historical sales data to identify stockout risks and overstock situations.
 import pandas as pd
 import numpy as np
 import os
+import argparse
+from itertools import product
+from statistics import NormalDist
+
+import storage
+import demand_tensor
+import dimensions
+import feature_store
+import query_engine
+from instrumentation import instrument
 
 # Create directory for output
 os.makedirs("data/optimization", exist_ok=True)
 
+MASTER_TABLE_PATH = "data/processed/master_table"
+PRODUCT_METRICS_PATH = "data/optimization/product_metrics"
+
+# Window of recent history used for demand statistics
+DEMAND_WINDOW_DAYS = 90
+
+# Policy assumptions
+SERVICE_LEVEL = 0.95
+Z_SCORE = 1.65              # z of SERVICE_LEVEL as used by the batch policy (scenarios use the exact 1.645)
+ORDER_COST = 50.0           # Fixed cost per order ($)
+HOLDING_COST_PCT = 0.20     # Yearly holding cost as a share of unit cost
+
+# Risk rules
+OVERSTOCK_DSI_DAYS = 90
+RISK_LOW_STOCK = 'Low Stock - Reorder Now'
+RISK_OVERSTOCK = 'Overstock - Reduce'
+RISK_HEALTHY = 'Healthy'
+
+@instrument("Loading data for Optimization...")
 def load_data():
-    master_table = pd.read_csv("data/processed/master_table.csv", parse_dates=['date'])
-    products = pd.read_csv("data/raw/products.csv")
-    suppliers = pd.read_csv("data/raw/suppliers.csv")
-    
+    products = attach_lead_times(storage.load_table("data/raw/products"), storage.load_table("data/raw/suppliers"))
+    if demand_tensor.is_current():
+        # The metrics only read the last rows of the mapped matrices
+        return demand_tensor.load_tensor(measures=['quantity', 'stock_on_hand']), products
+    if query_engine.scans_tables():
+        # The engine reads the window straight from the stored partitions
+        return MASTER_TABLE_PATH, products
+    # Only the recent window and the columns the metrics need are read from disk
+    _, latest_date = storage.date_range(MASTER_TABLE_PATH)
+    master_table = storage.load_table(
+        MASTER_TABLE_PATH,
+        columns=['date', 'product_key', 'quantity', 'stock_on_hand'],
+        start_date=latest_date - pd.Timedelta(days=DEMAND_WINDOW_DAYS - 1)
+    )
+    return master_table, products
+
+def attach_lead_times(products, suppliers):
     # Merge supplier info to products if not already there
     if 'lead_time_days' not in products.columns:
         products = products.merge(suppliers[['supplier_id', 'lead_time_days']], on='supplier_id', how='left')
-        
-    return master_table, products
+    return products
 
-def calculate_inventory_metrics(master_table, products):
+def demand_statistics(master_table, products):
     # 1. Calculate Average Daily Sales (ADS) and Standard Deviation (for Safety Stock)
     # We'll use the last 90 days for recent demand trends
-    recent_period = master_table[master_table['date'] > master_table['date'].max() - pd.Timedelta(days=90)]
+    if demand_tensor.is_tensor(master_table):
+        window_features = [f"rolling_mean_{DEMAND_WINDOW_DAYS}", f"rolling_std_{DEMAND_WINDOW_DAYS}"]
+        if DEMAND_WINDOW_DAYS in feature_store.ROLLING_WINDOWS and feature_store.is_current():
+            # Already computed by the feature store: its last row is the window ending today
+            product_metrics = feature_store.latest(feature_store.load_features(names=window_features), window_features)
+            product_metrics.columns = ['product_id', 'avg_daily_sales', 'std_daily_sales']
+            return product_metrics.merge(products, on='product_id', how='left')
+        # Column statistics over the last rows of the (day x SKU) quantity matrix
+        recent = master_table['quantity'][-DEMAND_WINDOW_DAYS:]
+        product_metrics = pd.DataFrame({
+            'product_id': master_table['products']['product_id'].astype(str),
+            'avg_daily_sales': recent.mean(axis=0, dtype=np.float64),
+            'std_daily_sales': recent.std(axis=0, dtype=np.float64, ddof=1)
+        })
+        return product_metrics.merge(products, on='product_id', how='left')
     
-    product_metrics = recent_period.groupby('product_id').agg(
-        avg_daily_sales=('quantity', 'mean'),
-        std_daily_sales=('quantity', 'std')
-    ).reset_index()
+    # Master table rows (a frame or the stored table's path) over the query engine
+    product_metrics = query_engine.window_stats(master_table, 'product_key', 'quantity', DEMAND_WINDOW_DAYS)
+    product_metrics.columns = ['product_key', 'avg_daily_sales', 'std_daily_sales']
+    # `products` may be the product dimension itself (it already carries the lead times)
+    dim_product = products if 'product_key' in products.columns else None
+    product_metrics.insert(0, 'product_id', dimensions.product_ids(product_metrics.pop('product_key'), dim_product))
     
     # Merge with product details (cost, lead time)
-    product_metrics = product_metrics.merge(products, on='product_id', how='left')
-    
-    # 2. Safety Stock (SS)
-    # Formula: Z-score * StdDev(Demand) * Sqrt(Lead Time)
+    return product_metrics.merge(products, on='product_id', how='left')
+
+def reorder_policy(avg_daily_sales, std_daily_sales, lead_time_days, z_score=Z_SCORE):
+    # Safety stock and reorder point on arrays (one entry per product): returns (safety_stock, reorder_point).
+    # Shared by calculate_inventory_metrics and the inventory monitor, which re-evaluates single SKUs.
+    # Safety Stock formula: Z-score * StdDev(Demand) * Sqrt(Lead Time)
     # Assuming 95% Service Level -> Z = 1.65
-    Z_SCORE = 1.65
-    
-    product_metrics['safety_stock'] = Z_SCORE * product_metrics['std_daily_sales'] * np.sqrt(product_metrics['lead_time_days'])
-    product_metrics['safety_stock'] = product_metrics['safety_stock'].apply(np.ceil)
+    safety_stock = np.ceil(z_score * std_daily_sales * np.sqrt(lead_time_days))
+    # Reorder Point formula: (Avg Daily Sales * Lead Time) + Safety Stock
+    reorder_point = np.ceil((avg_daily_sales * lead_time_days) + safety_stock)
+    return safety_stock, reorder_point
+
+@instrument("Calculating ROP, Safety Stock, EOQ...")
+def calculate_inventory_metrics(master_table, products, z_score=Z_SCORE, order_cost=ORDER_COST,
+                                holding_cost_pct=HOLDING_COST_PCT):
+    product_metrics = demand_statistics(master_table, products)
     
-    # 3. Reorder Point (ROP)
-    # Formula: (Avg Daily Sales * Lead Time) + Safety Stock
-    product_metrics['reorder_point'] = (product_metrics['avg_daily_sales'] * product_metrics['lead_time_days']) + product_metrics['safety_stock']
-    product_metrics['reorder_point'] = product_metrics['reorder_point'].apply(np.ceil)
+    # 2. Safety Stock (SS) and 3. Reorder Point (ROP)
+    product_metrics['safety_stock'], product_metrics['reorder_point'] = reorder_policy(
+        product_metrics['avg_daily_sales'], product_metrics['std_daily_sales'],
+        product_metrics['lead_time_days'], z_score
+    )
     
     # 4. Economic Order Quantity (EOQ)
     # Formula: Sqrt( (2 * Demand * Order Cost) / Holding Cost )
@@ -59,48 +126,122 @@ def calculate_inventory_metrics(master_table, products):
     # - Annual Demand = Avg Daily Sales * 365
     # - Order Cost (Fixed cost per order) = $50 (assumption)
     # - Holding Cost = 20% of Unit Cost per year (assumption)
-    
-    ORDER_COST = 50.0
-    HOLDING_COST_PCT = 0.20
-    
     product_metrics['annual_demand'] = product_metrics['avg_daily_sales'] * 365
-    product_metrics['holding_cost_per_unit'] = product_metrics['cost_price'] * HOLDING_COST_PCT
+    product_metrics['holding_cost_per_unit'] = product_metrics['cost_price'] * holding_cost_pct
     
-    product_metrics['eoq'] = np.sqrt(
-        (2 * product_metrics['annual_demand'] * ORDER_COST) / product_metrics['holding_cost_per_unit']
-    )
-    product_metrics['eoq'] = product_metrics['eoq'].apply(np.ceil)
+    product_metrics['eoq'] = np.ceil(np.sqrt(
+        (2 * product_metrics['annual_demand'] * order_cost) / product_metrics['holding_cost_per_unit']
+    ))
     
     return product_metrics
 
+def service_level_z(service_level):
+    # The exact normal quantile at every level, so z is continuous across the grid.
+    # The baseline level's scenario uses 1.645 instead of the batch policy's rounded
+    # Z_SCORE and can differ from the recommendations by a unit of safety stock.
+    return NormalDist().inv_cdf(service_level)
+
+def scenario_grid(service_levels, order_costs, holding_cost_pcts, lead_time_overrides=(None,)):
+    # Cartesian product of the planning parameters; a lead-time override of None
+    # keeps each SKU's supplier lead time
+    scenarios = pd.DataFrame(
+        list(product(service_levels, order_costs, holding_cost_pcts, lead_time_overrides)),
+        columns=['service_level', 'order_cost', 'holding_cost_pct', 'lead_time_override']
+    )
+    scenarios['lead_time_override'] = scenarios['lead_time_override'].astype(float)
+    scenarios['z_score'] = [service_level_z(level) for level in scenarios['service_level']]
+    scenarios.insert(0, 'scenario_id', np.arange(len(scenarios)))
+    return scenarios
+
+def evaluate_scenarios(product_metrics, scenarios):
+    # Same formulas as calculate_inventory_metrics, broadcast as (SKUs x scenarios)
+    # arrays in one pass. Returns a dict of (N, S) arrays.
+    avg = product_metrics['avg_daily_sales'].to_numpy(dtype=float)[:, None]
+    std = product_metrics['std_daily_sales'].to_numpy(dtype=float)[:, None]
+    unit_cost = product_metrics['cost_price'].to_numpy(dtype=float)[:, None]
+    supplier_lead_time = product_metrics['lead_time_days'].to_numpy(dtype=float)[:, None]
+    
+    override = scenarios['lead_time_override'].to_numpy(dtype=float)[None, :]
+    lead_time = np.where(np.isnan(override), supplier_lead_time, override)
+    z = scenarios['z_score'].to_numpy(dtype=float)[None, :]
+    order_cost = scenarios['order_cost'].to_numpy(dtype=float)[None, :]
+    holding_cost = unit_cost * scenarios['holding_cost_pct'].to_numpy(dtype=float)[None, :]
+    
+    safety_stock, reorder_point = reorder_policy(avg, std, lead_time, z)
+    annual_demand = avg * 365
+    eoq = np.ceil(np.sqrt(2 * annual_demand * order_cost / holding_cost))
+    
+    # Yearly cost of the policy: ordering (orders per year * order cost) plus holding
+    # (average cycle stock EOQ/2 plus safety stock)
+    orders_per_year = np.divide(annual_demand, eoq, out=np.zeros_like(eoq), where=eoq > 0)
+    total_cost = orders_per_year * order_cost + (eoq / 2 + safety_stock) * holding_cost
+    
+    return {
+        'safety_stock': safety_stock,
+        'reorder_point': reorder_point,
+        'eoq': eoq,
+        'total_cost': total_cost
+    }
+
+def scenarios_to_frame(product_metrics, scenarios, results):
+    # Long table: one row per SKU x scenario
+    n, s = results['eoq'].shape
+    frame = pd.DataFrame({
+        'product_id': np.repeat(product_metrics['product_id'].to_numpy(), s),
+        'scenario_id': np.tile(scenarios['scenario_id'].to_numpy(), n)
+    })
+    for name, values in results.items():
+        frame[name] = values.ravel()
+    return frame.merge(scenarios, on='scenario_id', how='left')
+
+def summarize_scenarios(scenarios, results):
+    # Catalog totals per scenario
+    summary = scenarios.copy()
+    summary['total_safety_stock'] = np.nansum(results['safety_stock'], axis=0)
+    summary['total_cost'] = np.nansum(results['total_cost'], axis=0)
+    return summary.sort_values('total_cost').reset_index(drop=True)
+
+def classify_risks(stock_on_hand, reorder_point, avg_daily_sales):
+    # Risk rules on arrays (one entry per product): returns (risk_status, dsi).
+    # Shared by identify_risks and the forecast service, which re-scores posted stock levels.
+    # Risk: Low Stock (Current Stock <= ROP)
+    # Risk: Overstock - Days Sales of Inventory (DSI) > OVERSTOCK_DSI_DAYS
+    with np.errstate(divide='ignore', invalid='ignore'):
+        dsi = stock_on_hand / avg_daily_sales
+    risk_status = np.where(stock_on_hand <= reorder_point, RISK_LOW_STOCK,
+                           np.where(dsi > OVERSTOCK_DSI_DAYS, RISK_OVERSTOCK, RISK_HEALTHY))
+    return risk_status.astype(object), dsi
+
+@instrument("Identifying Inventory Risks...")
 def identify_risks(master_table, product_metrics):
     # Get latest stock levels
-    latest_date = master_table['date'].max()
-    current_stock = master_table[master_table['date'] == latest_date][['product_id', 'stock_on_hand']]
+    if demand_tensor.is_tensor(master_table):
+        current_stock = pd.DataFrame({
+            'product_id': master_table['products']['product_id'].astype(str),
+            'stock_on_hand': master_table['stock_on_hand'][-1]
+        })
+    else:
+        latest = query_engine.latest(master_table, 'product_key', ['stock_on_hand'])
+        current_stock = pd.DataFrame({
+            'product_id': dimensions.product_ids(latest['product_key']),
+            'stock_on_hand': latest['stock_on_hand'].to_numpy()
+        })
     
     # Merge with calculated metrics
     risk_analysis = current_stock.merge(product_metrics, on='product_id', how='left')
     
     # Detect Risks
-    # Risk: Low Stock (Current Stock <= ROP)
-    risk_analysis['risk_status'] = 'Healthy'
-    risk_analysis.loc[risk_analysis['stock_on_hand'] <= risk_analysis['reorder_point'], 'risk_status'] = 'Low Stock - Reorder Now'
-    
-    # Risk: Overstock (Current Stock > 3 * ROP - arbitrary threshold for demo)
-    # Or based on Days Sales of Inventory (DSI) > 60 days
-    risk_analysis['dsi'] = risk_analysis['stock_on_hand'] / risk_analysis['avg_daily_sales']
-    risk_analysis.loc[(risk_analysis['risk_status'] == 'Healthy') & (risk_analysis['dsi'] > 90), 'risk_status'] = 'Overstock - Reduce'
+    risk_analysis['risk_status'], risk_analysis['dsi'] = classify_risks(
+        risk_analysis['stock_on_hand'].to_numpy(dtype=float),
+        risk_analysis['reorder_point'].to_numpy(dtype=float),
+        risk_analysis['avg_daily_sales'].to_numpy(dtype=float)
+    )
     
     return risk_analysis
 
-if __name__ == "__main__":
-    print("Loading data for Optimization...")
-    master_table, products = load_data()
-    
-    print("Calculating ROP, Safety Stock, EOQ...")
+def run_optimization(master_table, products):
     product_metrics = calculate_inventory_metrics(master_table, products)
     
-    print("Identifying Inventory Risks...")
     risk_analysis = identify_risks(master_table, product_metrics)
     
     # Prepare final recommendation table
@@ -116,11 +257,43 @@ if __name__ == "__main__":
     print(recommendations['risk_status'].value_counts())
     
     # Highlight critical products
-    critical_products = recommendations[recommendations['risk_status'] == 'Low Stock - Reorder Now']
+    critical_products = recommendations[recommendations['risk_status'] == RISK_LOW_STOCK]
     if len(critical_products) > 0:
         print(f"\n⚠️  ALERT: {len(critical_products)} products need immediate restocking!")
     
-    output_path = "data/optimization/inventory_recommendations.csv"
-    recommendations.to_csv(output_path, index=False)
+    output_path = "data/optimization/inventory_recommendations"
+    storage.save_table(recommendations, output_path, export_csv=True)
+    # Per-product demand statistics and policy, so consumers can re-score other stock levels
+    storage.save_table(product_metrics, PRODUCT_METRICS_PATH)
     print(f"\n✓ Saved recommendations to {output_path}")
+    return recommendations, product_metrics
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Inventory optimization")
+    parser.add_argument("--scenarios", action="store_true",
+                        help="Also evaluate the what-if grid given by the options below")
+    parser.add_argument("--service-levels", type=float, nargs='+', default=[0.90, SERVICE_LEVEL, 0.98, 0.99])
+    parser.add_argument("--order-costs", type=float, nargs='+', default=[25.0, ORDER_COST, 100.0])
+    parser.add_argument("--holding-pcts", type=float, nargs='+', default=[0.15, HOLDING_COST_PCT, 0.25])
+    parser.add_argument("--lead-times", type=float, nargs='+', default=[],
+                        help="Lead-time overrides in days (supplier lead times are always included)")
+    args = parser.parse_args()
+    
+    master_table, products = load_data()
+    recommendations, product_metrics = run_optimization(master_table, products)
+    
+    if args.scenarios:
+        scenarios = scenario_grid(args.service_levels, args.order_costs, args.holding_pcts,
+                                  [None] + args.lead_times)
+        print(f"\nEvaluating {len(scenarios)} scenarios x {len(product_metrics)} products...")
+        results = evaluate_scenarios(product_metrics, scenarios)
+        
+        summary = summarize_scenarios(scenarios, results)
+        print("\nCheapest scenarios (total yearly cost):")
+        print(summary.head(10).to_string(index=False))
+        
+        storage.save_table(scenarios_to_frame(product_metrics, scenarios, results),
+                           "data/optimization/inventory_scenarios")
+        storage.save_table(summary, "data/optimization/inventory_scenario_summary", export_csv=True)
+        print("✓ Saved scenario results to data/optimization/inventory_scenarios")
 
@@ -0,0 +1,175 @@
+"""
+Inventory Simulation Module
+
+Monte Carlo check of the reorder policies from inventory_optimization.py:
+- Every SKU runs a (reorder point, EOQ) policy with its supplier lead time over
+  many stochastic demand paths; state is held in (SKUs x paths) arrays, one day per step
+- Daily demand is bootstrapped from recent history (whole days), unmet demand is lost
+- Orders in transit sit in a ring buffer indexed by arrival day
+- SKUs are split into chunks across a process pool
+- Output per SKU: realized fill rate, stockout days and average inventory
+"""
+
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+import storage
+import demand_tensor
+import dimensions
+from inventory_optimization import DEMAND_WINDOW_DAYS, load_data, calculate_inventory_metrics
+
+SIMULATION_DAYS = 365
+SIMULATION_PATHS = 1000
+SIMULATION_SKU_CHUNK = 500
+SIMULATION_SEED = 42
+
+def demand_history(master_table, product_ids):
+    # (SKUs x days) matrix of daily quantities, missing days counted as zero demand
+    if demand_tensor.is_tensor(master_table):
+        # Same window the demand statistics use; the tensor columns are in product_id order
+        columns = pd.Index(master_table['products']['product_id'].astype(str))
+        recent = master_table['quantity'][-DEMAND_WINDOW_DAYS:]
+        return recent[:, columns.get_indexer(pd.Index(product_ids).astype(str))].T.astype(float)
+    if isinstance(master_table, str):
+        # Path of the stored table (engines that scan files): only the window is read
+        _, latest_date = storage.date_range(master_table)
+        master_table = storage.load_table(master_table, columns=['date', 'product_key', 'quantity'],
+                                          start_date=latest_date - pd.Timedelta(days=DEMAND_WINDOW_DAYS - 1))
+    history = master_table.pivot_table(index='product_key', columns='date', values='quantity',
+                                       aggfunc='sum', fill_value=0)
+    history.index = dimensions.product_ids(history.index)
+    return history.reindex(pd.Index(product_ids).astype(str), fill_value=0).to_numpy(dtype=float)
+
+def simulate_policy(history, reorder_point, order_qty, lead_time, initial_stock,
+                    days=SIMULATION_DAYS, paths=SIMULATION_PATHS, seed=SIMULATION_SEED):
+    """Simulate a continuous-review (s, Q) policy for N SKUs.
+
+    history is (N, W) daily demand to bootstrap from; the policy arrays are (N,).
+    Each day: receive arrivals, serve demand from stock (lost sales), then order
+    enough multiples of Q to lift the inventory position above the reorder point.
+    Returns a dict of per-SKU arrays averaged over paths.
+    """
+    rng = np.random.default_rng(seed)
+    n, window = history.shape
+    sku = np.arange(n)
+    history = np.asarray(history, dtype=np.float32)
+    lead_time = np.maximum(np.asarray(lead_time, dtype=int), 1)
+    order_qty = np.maximum(order_qty, 1.0).astype(np.float32)[:, None]
+    reorder_point = np.asarray(reorder_point, dtype=np.float32)[:, None]
+
+    # State is (SKUs x paths): all paths of one SKU share its lead time, so the
+    # ring buffer of orders in transit (slot d % R holds what arrives on day d)
+    # is read and written one contiguous row per SKU. Quantities are whole units,
+    # so float32 is exact.
+    ring_size = lead_time.max() + 1
+    pipeline = np.zeros((ring_size, n, paths), dtype=np.float32)
+    on_hand = np.repeat(np.asarray(initial_stock, dtype=np.float32)[:, None], paths, axis=1)
+    on_order = np.zeros((n, paths), dtype=np.float32)
+    filled = np.empty((n, paths), dtype=np.float32)
+    position = np.empty((n, paths), dtype=np.float32)
+
+    demand_total = np.zeros(n)
+    filled_total = np.zeros(n)
+    inventory_total = np.zeros(n)
+    stockout_days = np.zeros(n)
+    orders = np.zeros(n)
+
+    for day in range(days):
+        slot = day % ring_size
+        arrivals = pipeline[slot]
+        on_hand += arrivals
+        on_order -= arrivals
+        arrivals[:] = 0
+
+        # Each path replays a whole historical day for all SKUs, which keeps the
+        # weekday/promotion correlation between SKUs (chunks share the seed, so they
+        # draw the same days)
+        demand = history[:, rng.integers(0, window, size=paths)]
+        np.minimum(on_hand, demand, out=filled)
+        on_hand -= filled
+
+        demand_total += demand.sum(axis=1, dtype=np.float64)
+        filled_total += filled.sum(axis=1, dtype=np.float64)
+        stockout_days += np.count_nonzero(filled < demand, axis=1)
+        inventory_total += on_hand.sum(axis=1, dtype=np.float64)
+
+        # Reorder on the inventory position (stock on hand + in transit): enough
+        # multiples of Q to get back above the reorder point
+        np.add(on_hand, on_order, out=position)
+        reorder = position <= reorder_point
+        if not reorder.any():
+            continue
+        quantity = np.where(reorder, (np.floor((reorder_point - position) / order_qty) + 1) * order_qty, 0)
+        pipeline[(day + lead_time) % ring_size, sku] += quantity
+        on_order += quantity
+        orders += np.count_nonzero(reorder, axis=1)
+
+    return {
+        'fill_rate': np.divide(filled_total, demand_total, out=np.ones(n), where=demand_total > 0),
+        'stockout_days': stockout_days / paths,
+        'avg_inventory': inventory_total / (paths * days),
+        'orders_per_year': orders / paths * 365 / days
+    }
+
+def _simulate_chunk(task):
+    return simulate_policy(*task)
+
+def run_simulation(product_metrics, master_table, days=SIMULATION_DAYS, paths=SIMULATION_PATHS,
+                   workers=None, seed=SIMULATION_SEED):
+    # Every SKU chunk gets the same seed: the seed only drives the (day, path) draws, so
+    # all chunks replay the same historical days and the correlation between SKUs holds
+    # across chunk boundaries. Results do not depend on the chunking or the worker count.
+    # SKUs without a supplier lead time have no reorder policy (NaN reorder point) and
+    # are left out rather than simulated with a made-up lead time.
+    missing = product_metrics['lead_time_days'].isna()
+    if missing.any():
+        print(f"Skipping {missing.sum()} products without a supplier lead time")
+        product_metrics = product_metrics[~missing].reset_index(drop=True)
+    n = len(product_metrics)
+    history = demand_history(master_table, product_metrics['product_id'])
+    reorder_point = np.nan_to_num(product_metrics['reorder_point'].to_numpy(dtype=float))
+    order_qty = np.nan_to_num(product_metrics['eoq'].to_numpy(dtype=float))
+    lead_time = product_metrics['lead_time_days'].to_numpy(dtype=float)
+    # Start every path freshly replenished: one order quantity above the reorder point
+    initial_stock = reorder_point + order_qty
+
+    chunks = [slice(start, min(start + SIMULATION_SKU_CHUNK, n)) for start in range(0, n, SIMULATION_SKU_CHUNK)]
+    tasks = [(history[c], reorder_point[c], order_qty[c], lead_time[c], initial_stock[c], days, paths, seed)
+             for c in chunks]
+    if workers == 1 or len(tasks) == 1:
+        results = list(map(_simulate_chunk, tasks))
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(_simulate_chunk, tasks))
+
+    simulation = product_metrics[['product_id', 'reorder_point', 'safety_stock', 'eoq', 'lead_time_days']].copy()
+    for key in results[0]:
+        simulation[key] = np.concatenate([r[key] for r in results])
+    return simulation
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Monte Carlo simulation of the inventory policies")
+    parser.add_argument("--days", type=int, default=SIMULATION_DAYS)
+    parser.add_argument("--paths", type=int, default=SIMULATION_PATHS)
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: all cores)")
+    parser.add_argument("--seed", type=int, default=SIMULATION_SEED)
+    args = parser.parse_args()
+
+    print("Loading data for Simulation...")
+    master_table, products = load_data()
+    product_metrics = calculate_inventory_metrics(master_table, products)
+
+    print(f"Simulating {len(product_metrics)} products x {args.paths} paths x {args.days} days...")
+    simulation = run_simulation(product_metrics, master_table, args.days, args.paths, args.workers, args.seed)
+
+    print("\n" + "=" * 50)
+    print("POLICY SIMULATION SUMMARY")
+    print("=" * 50)
+    print(simulation[['fill_rate', 'stockout_days', 'avg_inventory', 'orders_per_year']].describe().round(3))
+
+    output_path = "data/optimization/inventory_simulation"
+    storage.save_table(simulation, output_path, export_csv=True)
+    print(f"\n✓ Saved simulation results to {output_path}")
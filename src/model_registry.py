@@ -0,0 +1,199 @@
+"""
+Model Registry
+
+Keeps fitted Holt-Winters models between runs so daily re-forecasting does not
+start from scratch. Models are stored per registry name (data/models/<name>.json),
+keyed by series id, together with a hash of the data they were fitted on:
+- Data unchanged:        the stored model is served, no fit at all
+- Only new days appended: the stored state is rolled forward over the new days
+                          with the stored parameters; every REFIT_EVERY_DAYS days the
+                          parameters are re-estimated, warm-started from the stored ones
+- Anything else:          cold fit
+
+Models use the layout of the vectorized kernel in forecasting.py (params, level,
+trend, season, initial), whichever backend fitted them.
+"""
+
+import hashlib
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from forecasting import (SEASONAL_PERIODS, fit_holt_winters_batch, refit_holt_winters_batch, hw_filter,
+                         fit_statsmodels, kernel_fits)
+
+REGISTRY_PATH = "data/models"
+REFIT_EVERY_DAYS = 7
+
+def data_hash(values, start_date):
+    digest = hashlib.sha1(pd.Timestamp(start_date).strftime("%Y-%m-%d").encode())
+    digest.update(np.ascontiguousarray(values, dtype=np.float64).tobytes())
+    return digest.hexdigest()
+
+def load_registry(name):
+    path = f"{REGISTRY_PATH}/{name}.json"
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+def save_registry(name, registry):
+    os.makedirs(REGISTRY_PATH, exist_ok=True)
+    # Write-then-rename so a crashed run never leaves a truncated registry
+    path = f"{REGISTRY_PATH}/{name}.json"
+    with open(f"{path}.tmp", 'w') as f:
+        json.dump(registry, f)
+    os.replace(f"{path}.tmp", path)
+
+def _failed_entry(message):
+    # Layout of a fitted entry, all NaN, so failed series stack with the rest
+    m = SEASONAL_PERIODS
+    return {'params': [np.nan] * 3, 'initial': {'level': np.nan, 'trend': np.nan, 'season': [np.nan] * m},
+            'level': np.nan, 'trend': np.nan, 'season': [np.nan] * m, 'sse': np.nan,
+            'status': 'failed', 'converged': False, 'aic': np.nan, 'message': message}
+
+def _fit_statsmodels(task):
+    # One statsmodels fit (fit_statsmodels: warnings and convergence recorded),
+    # converted to the kernel's model layout. A series that raises is returned as a
+    # failed entry, so one bad SKU cannot abort the pool.
+    y, start_params = task
+    try:
+        fitted, fit = fit_statsmodels(y, start_params)
+    except Exception as e:
+        return _failed_entry(str(e))
+    return {
+        'params': [fitted.params['smoothing_level'], fitted.params['smoothing_trend'], fitted.params['smoothing_seasonal']],
+        'initial': {
+            'level': float(fitted.params['initial_level']),
+            'trend': float(fitted.params['initial_trend']),
+            'season': np.asarray(fitted.params['initial_seasons'], dtype=float).tolist()
+        },
+        'level': float(fitted.level[-1]),
+        'trend': float(fitted.trend[-1]),
+        # The last m seasonal terms, oldest first, are the next m days' terms
+        'season': np.asarray(fitted.season)[-SEASONAL_PERIODS:].tolist(),
+        'sse': float(fitted.sse),
+        'status': 'ok',
+        'converged': fit['converged'],
+        'aic': float(fit['aic']),
+        'message': fit['message']
+    }
+
+def _fit_with_statsmodels(Y, previous=None, workers=None, chunksize=8):
+    tasks = []
+    for i, y in enumerate(Y):
+        start_params = None
+        if previous is not None:
+            entry = previous[i]
+            start_params = np.concatenate([entry['params'], [entry['initial']['level'], entry['initial']['trend']],
+                                           entry['initial']['season']])
+        tasks.append((y, start_params))
+    if workers == 1 or len(tasks) == 1:
+        return list(map(_fit_statsmodels, tasks))
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(_fit_statsmodels, tasks, chunksize=chunksize))
+
+def _split_model(model):
+    # Kernel model (arrays over N series) -> one registry entry per series
+    entries = []
+    for i, fit in enumerate(kernel_fits(model['sse'])):
+        entries.append({
+            'params': model['params'][i].tolist(),
+            'initial': {key: np.asarray(value[i]).tolist() for key, value in model['initial'].items()},
+            'level': float(model['level'][i]),
+            'trend': float(model['trend'][i]),
+            'season': model['season'][i].tolist(),
+            'sse': float(model['sse'][i]),
+            **fit
+        })
+    return entries
+
+def _stack(entries):
+    # Registry entries -> kernel model arrays
+    return {
+        'params': np.array([e['params'] for e in entries], dtype=float),
+        'level': np.array([e['level'] for e in entries], dtype=float),
+        'trend': np.array([e['trend'] for e in entries], dtype=float),
+        'season': np.array([e['season'] for e in entries], dtype=float),
+        'initial': {
+            'level': np.array([e['initial']['level'] for e in entries], dtype=float),
+            'trend': np.array([e['initial']['trend'] for e in entries], dtype=float),
+            'season': np.array([e['initial']['season'] for e in entries], dtype=float)
+        }
+    }
+
+def fit_with_registry(name, series_ids, Y, start_date, backend='numpy', refit_every=REFIT_EVERY_DAYS, workers=None,
+                      chunksize=8):
+    """Return fitted models for the rows of Y (N, T) and how each was obtained
+    ('cached', 'rolled', 'warm' or 'cold'), reusing and updating the registry.
+    model['fits'] carries each series' fit status, converged flag, aic and message;
+    failed fits are not stored, so they are retried on the next run."""
+    Y = np.asarray(Y, dtype=float)
+    n, n_obs = Y.shape
+    start_key = pd.Timestamp(start_date).strftime("%Y-%m-%d")
+    registry = load_registry(name)
+
+    status = np.full(n, 'cold', dtype=object)
+    for i, series_id in enumerate(series_ids):
+        entry = registry.get(series_id)
+        if entry is None or entry['backend'] != backend or entry['start_date'] != start_key or entry['n_obs'] > n_obs:
+            continue
+        if entry['data_hash'] != data_hash(Y[i, :entry['n_obs']], start_date):
+            continue
+        if entry['n_obs'] == n_obs:
+            status[i] = 'cached'
+        elif n_obs - entry['fitted_n_obs'] < refit_every:
+            status[i] = 'rolled'
+        else:
+            status[i] = 'warm'
+
+    entries = [registry.get(series_id) for series_id in series_ids]
+
+    # Rolled: continue the stored recursion over the appended days only
+    rolled = np.flatnonzero(status == 'rolled')
+    for previous_obs in {entries[i]['n_obs'] for i in rolled}:
+        idx = [i for i in rolled if entries[i]['n_obs'] == previous_obs]
+        model = _stack([entries[i] for i in idx])
+        sse, state = hw_filter(Y[idx, previous_obs:], model['params'], model)
+        for j, i in enumerate(idx):
+            entries[i] = {**entries[i], 'level': float(state['level'][j]), 'trend': float(state['trend'][j]),
+                          'season': state['season'][j].tolist(), 'sse': entries[i]['sse'] + float(sse[j])}
+
+    # Warm: re-estimate starting from the stored parameters and initial state
+    warm = np.flatnonzero(status == 'warm')
+    if len(warm):
+        if backend == 'numpy':
+            previous = _stack([entries[i] for i in warm])
+            fitted = _split_model(refit_holt_winters_batch(Y[warm], previous['params'], previous['initial']))
+        else:
+            fitted = _fit_with_statsmodels(Y[warm], [entries[i] for i in warm], workers, chunksize)
+        for j, i in enumerate(warm):
+            entries[i] = {**fitted[j], 'fitted_n_obs': n_obs}
+
+    # Cold: full fit
+    cold = np.flatnonzero(status == 'cold')
+    if len(cold):
+        if backend == 'numpy':
+            fitted = _split_model(fit_holt_winters_batch(Y[cold]))
+        else:
+            fitted = _fit_with_statsmodels(Y[cold], workers=workers, chunksize=chunksize)
+        for j, i in enumerate(cold):
+            entries[i] = {**fitted[j], 'fitted_n_obs': n_obs}
+
+    for i, series_id in enumerate(series_ids):
+        if status[i] != 'cached' and entries[i].get('status', 'ok') == 'ok':
+            entries[i].update({'backend': backend, 'start_date': start_key, 'n_obs': n_obs,
+                               'data_hash': data_hash(Y[i], start_date)})
+            registry[series_id] = entries[i]
+    if (status != 'cached').any():
+        save_registry(name, registry)
+
+    model = _stack(entries)
+    # Entries stored before fit diagnostics were kept count as ok
+    fits = [{'status': e.get('status', 'ok'), 'converged': e.get('converged', True), 'aic': e.get('aic', np.nan),
+             'message': e.get('message', '')} for e in entries]
+    model.update({'sse': np.array([e['sse'] for e in entries]), 'n_obs': n_obs, 'fits': fits})
+    return model, status
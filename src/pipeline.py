@@ -0,0 +1,248 @@
+"""
+Pipeline Orchestrator
+
+Runs the whole pipeline (clean -> EDA / forecasts / inventory optimization) from
+one entry point:
+- Stages are declared in STAGES with the frames they consume and produce, which
+  defines the DAG; frames are handed from stage to stage in memory
+- A stage is skipped when the content hash of its inputs and the version of its
+  code match the last successful run and its outputs are still on disk (state kept
+  in data/pipeline_state.json). The code version hashes the stage's modules and
+  every src/ module they import, directly or not. Input hashes are always taken
+  from the tables on disk, so a table rewritten outside the pipeline (e.g. a manual
+  incremental cleaning run) reruns the stages that read it.
+- Stages whose inputs are ready run at the same time in a process pool, so the
+  wall time follows the critical path instead of the sum of all stages
+
+Every stage still writes its usual tables, so the dashboard and the single-stage
+scripts keep working unchanged.
+"""
+
+import argparse
+import ast
+import hashlib
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+
+import storage
+
+STATE_FILE = "data/pipeline_state.json"
+SOURCE_DIR = os.path.dirname(os.path.abspath(__file__))
+HASH_BLOCK_BYTES = 1 << 20
+
+# Frames read from disk when a stage needs them and no stage in this run produced them
+SOURCES = {
+    'sales': "data/raw/sales",
+    'inventory': "data/raw/inventory",
+    'products': "data/raw/products",
+    'suppliers': "data/raw/suppliers",
+    'master_table': "data/processed/master_table",
+    'forecast': "data/predictions/forecast_30days",
+    'hierarchical_forecast': "data/predictions/hierarchical_forecast",
+    'recommendations': "data/optimization/inventory_recommendations"
+}
+
+STAGES = {}
+
+def stage(name, inputs, outputs, modules, artifacts=()):
+    # A stage is fn(**input_frames) -> {output name: frame}. `modules` are the src/
+    # modules the stage function imports; with their own imports they make up its
+    # code version. `artifacts` are other files it writes, which must still exist
+    # for the stage to be skipped.
+    def decorator(fn):
+        STAGES[name] = {'fn': fn, 'inputs': list(inputs), 'outputs': list(outputs),
+                        'modules': list(modules), 'artifacts': list(artifacts)}
+        return fn
+    return decorator
+
+@stage('clean', inputs=['sales', 'inventory', 'products', 'suppliers'], outputs=['master_table'],
+       modules=['data_cleaning'])
+def run_clean(sales, inventory, products, suppliers):
+    import data_cleaning
+    master_table = data_cleaning.run_full_build(sales, inventory, products, suppliers)
+    data_cleaning.write_watermark(data_cleaning.raw_max_date())
+    return {'master_table': master_table}
+
+@stage('eda', inputs=['master_table'], outputs=[], modules=['eda_analysis'],
+       artifacts=['reports/figures/daily_sales_trend.png', 'reports/figures/index.html'])
+def run_eda(master_table):
+    import eda_analysis
+    eda_analysis.run_eda(master_table)
+    return {}
+
+@stage('forecast', inputs=['master_table'], outputs=['forecast'], modules=['forecasting'])
+def run_forecast(master_table):
+    import forecasting
+    return {'forecast': forecasting.run_total_forecast(daily_sales=forecasting.daily_revenue(master_table))}
+
+@stage('hierarchical', inputs=['master_table', 'products'], outputs=['hierarchical_forecast'],
+       modules=['hierarchical'])
+def run_hierarchical(master_table, products):
+    import hierarchical
+    return {'hierarchical_forecast': hierarchical.run_hierarchical_forecast(products, master_table)}
+
+@stage('inventory', inputs=['master_table', 'products', 'suppliers'], outputs=['recommendations'],
+       modules=['inventory_optimization', 'demand_tensor'])
+def run_inventory(master_table, products, suppliers):
+    import inventory_optimization
+    import demand_tensor
+    products = inventory_optimization.attach_lead_times(products, suppliers)
+    if demand_tensor.is_current():
+        # Demand statistics then come straight from the feature store
+        master_table = demand_tensor.load_tensor(measures=['quantity', 'stock_on_hand'])
+    recommendations, _ = inventory_optimization.run_optimization(master_table, products)
+    return {'recommendations': recommendations}
+
+def file_hash(paths):
+    digest = hashlib.sha1()
+    for path in paths:
+        digest.update(os.path.basename(path).encode())
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(HASH_BLOCK_BYTES), b''):
+                digest.update(block)
+    return digest.hexdigest()
+
+def source_hash(path):
+    # Content hash of a table on disk (its Parquet files, or the legacy CSV)
+    return file_hash(storage.table_files(path))
+
+def module_imports(module):
+    # src/ modules imported anywhere in the module's source (including imports inside functions)
+    with open(os.path.join(SOURCE_DIR, f"{module}.py")) as f:
+        tree = ast.parse(f.read())
+    names = set()
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            names.update(alias.name for alias in node.names)
+        elif isinstance(node, ast.ImportFrom) and node.level == 0 and node.module:
+            names.add(node.module)
+    return {name for name in names if os.path.exists(os.path.join(SOURCE_DIR, f"{name}.py"))}
+
+def module_closure(modules):
+    # The modules and everything they import from src/, transitively, in name order
+    seen, stack = set(), list(modules)
+    while stack:
+        module = stack.pop()
+        if module not in seen:
+            seen.add(module)
+            stack.extend(module_imports(module) - seen)
+    return sorted(seen)
+
+def code_version(modules):
+    return file_hash([os.path.join(SOURCE_DIR, f"{module}.py") for module in module_closure(modules)])
+
+def load_state():
+    if not os.path.exists(STATE_FILE):
+        return {}
+    with open(STATE_FILE) as f:
+        return json.load(f)
+
+def save_state(state):
+    os.makedirs(os.path.dirname(STATE_FILE), exist_ok=True)
+    with open(f"{STATE_FILE}.tmp", 'w') as f:
+        json.dump(state, f, indent=2)
+    os.replace(f"{STATE_FILE}.tmp", STATE_FILE)
+
+def _call_stage(name, frames):
+    started = time.perf_counter()
+    outputs = STAGES[name]['fn'](**frames)
+    return outputs, time.perf_counter() - started
+
+def run_pipeline(stage_names=None, workers=None, force=False):
+    """Run the selected stages (default: all) and return {stage: 'ran' | 'skipped'}."""
+    stage_names = list(STAGES) if stage_names is None else stage_names
+    producers = {output: name for name in stage_names for output in STAGES[name]['outputs']}
+    state = load_state()
+    frames, hashes, status = {}, {}, {}
+
+    def input_hash(frame_name):
+        # Always the table as it is on disk: hashed once its producer finished or was
+        # skipped, or on first use for a source no selected stage produces. Hashes are
+        # never taken from the state file, so tables rewritten outside the pipeline count.
+        if frame_name not in hashes:
+            hashes[frame_name] = source_hash(SOURCES[frame_name])
+        return hashes[frame_name]
+
+    def get_frame(frame_name):
+        if frame_name not in frames:
+            frames[frame_name] = storage.load_table(SOURCES[frame_name])
+        return frames[frame_name]
+
+    def ready(name):
+        return all(producers.get(i) is None or producers[i] in status for i in STAGES[name]['inputs'])
+
+    def stage_key(name):
+        digest = hashlib.sha1(code_version(STAGES[name]['modules']).encode())
+        for frame_name in STAGES[name]['inputs']:
+            digest.update(f"{frame_name}={input_hash(frame_name)}".encode())
+        return digest.hexdigest()
+
+    def can_skip(name, key):
+        previous = state.get(name)
+        if force or previous is None or previous['key'] != key:
+            return False
+        return (all(storage.table_exists(SOURCES[o]) for o in STAGES[name]['outputs']) and
+                all(os.path.exists(a) for a in STAGES[name]['artifacts']))
+
+    def finish(name, key, outputs, seconds):
+        frames.update(outputs)
+        output_hashes = {o: source_hash(SOURCES[o]) for o in outputs}
+        hashes.update(output_hashes)
+        state[name] = {'key': key, 'outputs': output_hashes, 'seconds': round(seconds, 3)}
+        save_state(state)
+        status[name] = 'ran'
+        print(f"[pipeline] {name} finished in {seconds:.1f}s")
+
+    started = time.perf_counter()
+    pending = list(stage_names)
+    running = {}
+    executor = ProcessPoolExecutor(max_workers=workers) if workers != 1 else None
+    try:
+        while pending or running:
+            launch = []
+            for name in [n for n in pending if ready(n)]:
+                pending.remove(name)
+                key = stage_key(name)
+                if can_skip(name, key):
+                    status[name] = 'skipped'
+                    print(f"[pipeline] {name} unchanged, skipped")
+                else:
+                    launch.append((name, key))
+            if pending and not launch and not running and not any(ready(n) for n in pending):
+                raise ValueError(f"Stages with unsatisfiable inputs: {pending}")
+
+            for name, key in launch:
+                inputs = {i: get_frame(i) for i in STAGES[name]['inputs']}
+                print(f"[pipeline] {name} started")
+                if executor is None or (len(launch) == 1 and not running):
+                    # Nothing to overlap with: run here and skip pickling the inputs
+                    finish(name, key, *_call_stage(name, inputs))
+                else:
+                    running[executor.submit(_call_stage, name, inputs)] = (name, key)
+            if not running:
+                continue
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                name, key = running.pop(future)
+                finish(name, key, *future.result())
+    finally:
+        if executor is not None:
+            executor.shutdown(cancel_futures=True)
+
+    print(f"[pipeline] done in {time.perf_counter() - started:.1f}s "
+          f"({sum(s == 'ran' for s in status.values())} ran, {sum(s == 'skipped' for s in status.values())} skipped)")
+    return status
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the pipeline stages as a DAG")
+    parser.add_argument("--stages", nargs='+', choices=list(STAGES), default=None,
+                        help="Stages to run (default: all); unselected inputs are read from disk")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="Worker processes for independent stages (1 = run everything in this process)")
+    parser.add_argument("--force", action="store_true", help="Run every stage even if nothing changed")
+    args = parser.parse_args()
+
+    run_pipeline(args.stages, args.workers, args.force)
@@ -0,0 +1,209 @@
+"""
+Query Engine Module
+
+Backends for the groupby/filter work of the cleaning, aggregate, EDA and inventory
+stages, so the same business logic runs in memory or out of core:
+- pandas (default): groupbys over in-memory frames; a stored table is loaded with
+  storage.load_table (only the needed columns and dates) before it is queried
+- duckdb (optional, `pip install duckdb`): embedded multi-threaded SQL engine. Frames
+  are queried in place, and stored tables are scanned straight from their Parquet
+  partitions, spilling to QUERY_TEMP_DIR when a query outgrows the memory limit
+
+The backend is chosen with SALES_QUERY_ENGINE (pandas | duckdb) or per call. Every
+query takes a source, either a DataFrame or the path of a stored table, and returns a
+pandas frame with the same columns, dtypes and row order on every backend.
+"""
+
+import os
+
+import numpy as np
+import pandas as pd
+
+import storage
+import dimensions
+
+ENGINE = os.environ.get("SALES_QUERY_ENGINE", "pandas").lower()
+MEMORY_LIMIT = os.environ.get("SALES_QUERY_MEMORY_LIMIT")   # e.g. "4GB" (duckdb default: 80% of RAM)
+QUERY_TEMP_DIR = "data/.query_tmp"
+
+ENGINES = {}
+
+def backend(engine, query):
+    # Registers fn as the `engine` implementation of `query`
+    def decorator(fn):
+        ENGINES.setdefault(engine, {})[query] = fn
+        return fn
+    return decorator
+
+def _implementation(query, engine=None):
+    engine = (engine or ENGINE).lower()
+    if engine not in ENGINES:
+        raise ValueError(f"Unknown query engine '{engine}' (available: {', '.join(sorted(ENGINES))})")
+    return ENGINES[engine][query]
+
+def scans_tables(engine=None):
+    # Whether the engine reads stored tables itself, so callers can pass a table's
+    # path instead of loading it into memory first
+    return (engine or ENGINE).lower() != 'pandas'
+
+def _is_table(source):
+    return isinstance(source, (str, os.PathLike))
+
+def _schema(source):
+    return storage.table_schema(source) if _is_table(source) else source.iloc[:0]
+
+def _latest_date(source):
+    return storage.date_range(source)[1] if _is_table(source) else source['date'].max()
+
+def _conform(result, keys, measures, schema, dim_product=None):
+    # Same dtypes and order as the pandas groupby: keys keep their source (or dimension)
+    # dtype, summed integers are int64, and rows are sorted by the keys
+    for key in keys:
+        dtype = schema[key].dtype if key in schema.columns else dim_product[key].dtype
+        result[key] = result[key].astype(dtype)
+    for measure in measures:
+        integer = pd.api.types.is_integer_dtype(schema[measure].dtype)
+        result[measure] = result[measure].astype(np.int64 if integer else np.float64)
+    return result.sort_values(keys, kind='stable', ignore_index=True)
+
+# ---------------------------------------------------------------------------
+# Queries
+# ---------------------------------------------------------------------------
+
+def group_sum(source, keys, measures, dim_product=None, isin=None, engine=None):
+    """Sums of `measures` per `keys`, ordered by the keys. Keys that are not columns
+    of the source (e.g. 'category') are product-dimension attributes joined by
+    product_key. `isin` ({column: values}) keeps only matching rows first."""
+    return _implementation('group_sum', engine)(source, list(keys), list(measures), dim_product, isin or {})
+
+def window_stats(source, key, measure, days, engine=None):
+    """Mean and sample std of `measure` per `key` over the last `days` days of the
+    source: columns [key, 'mean', 'std'], ordered by key."""
+    return _implementation('window_stats', engine)(source, key, measure, days)
+
+def latest(source, key, columns, engine=None):
+    """Rows of the source's latest date, one per `key`, ordered by key."""
+    return _implementation('latest', engine)(source, key, list(columns))
+
+# ---------------------------------------------------------------------------
+# pandas
+# ---------------------------------------------------------------------------
+
+@backend('pandas', 'group_sum')
+def _pandas_group_sum(source, keys, measures, dim_product, isin):
+    schema = _schema(source)
+    lookups = [key for key in keys if key not in schema.columns]
+    columns = list(dict.fromkeys([key for key in keys if key in schema.columns] +
+                                 (['product_key'] if lookups else []) + measures + list(isin)))
+    df = storage.load_table(source, columns=columns) if _is_table(source) else source[columns]
+    for column, values in isin.items():
+        df = df[df[column].isin(values)]
+    if lookups:
+        if dim_product is None:
+            dim_product = dimensions.load_dimension(dimensions.PRODUCT_DIM_PATH)
+        df = dimensions.attach(df, lookups, dim_product)
+    return df.groupby(keys, observed=True)[measures].sum().reset_index()
+
+@backend('pandas', 'window_stats')
+def _pandas_window_stats(source, key, measure, days):
+    start_date = _latest_date(source) - pd.Timedelta(days=days - 1)
+    if _is_table(source):
+        recent = storage.load_table(source, columns=['date', key, measure], start_date=start_date)
+    else:
+        recent = source[source['date'] >= start_date]
+    return recent.groupby(key).agg(mean=(measure, 'mean'), std=(measure, 'std')).reset_index()
+
+@backend('pandas', 'latest')
+def _pandas_latest(source, key, columns):
+    latest_date = _latest_date(source)
+    if _is_table(source):
+        rows = storage.load_table(source, columns=['date', key] + columns, start_date=latest_date)
+    else:
+        rows = source
+    rows = rows.loc[rows['date'] == latest_date, [key] + columns]
+    return rows.sort_values(key, kind='stable', ignore_index=True)
+
+# ---------------------------------------------------------------------------
+# duckdb
+# ---------------------------------------------------------------------------
+
+def _connect():
+    import duckdb
+    config = {'temp_directory': QUERY_TEMP_DIR}
+    if MEMORY_LIMIT:
+        config['memory_limit'] = MEMORY_LIMIT
+    return duckdb.connect(config=config)
+
+def _relation(connection, source, name='source'):
+    # SQL relation for a source: a Parquet scan for stored tables (legacy CSV tables
+    # are loaded first), the frame itself otherwise
+    if _is_table(source) and os.path.isdir(source):
+        return f"read_parquet('{os.path.join(source, '*.parquet')}')"
+    connection.register(name, storage.load_table(source) if _is_table(source) else source)
+    return name
+
+def _quote(column):
+    return '"' + column.replace('"', '""') + '"'
+
+def _sum(column, schema):
+    # Integer sums are exact; float sums are compensated, like pandas
+    integer = pd.api.types.is_integer_dtype(schema[column].dtype)
+    return f"{'sum' if integer else 'fsum'}({_quote(column)}) AS {_quote(column)}"
+
+def _date_literal(date):
+    return f"TIMESTAMP '{pd.Timestamp(date):%Y-%m-%d %H:%M:%S}'"
+
+@backend('duckdb', 'group_sum')
+def _duckdb_group_sum(source, keys, measures, dim_product, isin):
+    schema = _schema(source)
+    connection = _connect()
+    relation = _relation(connection, source)
+    lookups = [key for key in keys if key not in schema.columns]
+    if lookups:
+        if dim_product is None:
+            dim_product = dimensions.load_dimension(dimensions.PRODUCT_DIM_PATH)
+        connection.register('dim_product', dim_product[['product_key'] + lookups])
+        relation = f"{relation} JOIN dim_product USING (product_key)"
+
+    conditions = []
+    for i, (column, values) in enumerate(isin.items()):
+        connection.register(f"isin_{i}", pd.DataFrame({'value': np.asarray(values)}))
+        conditions.append(f"{_quote(column)} IN (SELECT value FROM isin_{i})")
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+
+    key_list = ", ".join(_quote(key) for key in keys)
+    sums = ", ".join(_sum(measure, schema) for measure in measures)
+    result = connection.execute(f"SELECT {key_list}, {sums} FROM {relation} {where} GROUP BY {key_list}").df()
+    connection.close()
+    return _conform(result, keys, measures, schema, dim_product)
+
+@backend('duckdb', 'window_stats')
+def _duckdb_window_stats(source, key, measure, days):
+    schema = _schema(source)
+    start_date = _latest_date(source) - pd.Timedelta(days=days - 1)
+    connection = _connect()
+    relation = _relation(connection, source)
+    # Literal date bound, so Parquet row groups before the window are skipped
+    integer = pd.api.types.is_integer_dtype(schema[measure].dtype)
+    result = connection.execute(
+        f"SELECT {_quote(key)}, {'avg' if integer else 'favg'}({_quote(measure)}) AS mean, "
+        f"stddev_samp({_quote(measure)}) AS std FROM {relation} "
+        f"WHERE date >= {_date_literal(start_date)} GROUP BY {_quote(key)}"
+    ).df()
+    connection.close()
+    result[key] = result[key].astype(schema[key].dtype)
+    return result.sort_values(key, kind='stable', ignore_index=True)
+
+@backend('duckdb', 'latest')
+def _duckdb_latest(source, key, columns):
+    schema = _schema(source)
+    connection = _connect()
+    relation = _relation(connection, source)
+    result = connection.execute(
+        f"SELECT {', '.join(_quote(c) for c in [key] + columns)} FROM {relation} "
+        f"WHERE date = {_date_literal(_latest_date(source))} ORDER BY {_quote(key)}"
+    ).df()
+    connection.close()
+    for column in [key] + columns:
+        result[column] = result[column].astype(schema[column].dtype)
+    return result
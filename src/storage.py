@@ -0,0 +1,223 @@
+"""
+Storage Module
+
+Shared columnar storage for the hand-offs between pipeline stages:
+- Every table is a directory of Parquet files (e.g. data/processed/master_table/)
+- Tables with a `date` column are partitioned by month (part-YYYY-MM-NNNNN.parquet),
+  so date-filtered reads skip whole files and Parquet statistics prune the rest
+- Key columns (product_id, category, supplier_id) are stored as categoricals
+
+CSV is kept as an export format (`export_csv`). If a table has not been written
+as Parquet yet, the loaders fall back to the legacy `<path>.csv` file.
+"""
+
+import glob
+import os
+import shutil
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+DATE_COLUMN = 'date'
+CATEGORICAL_COLUMNS = ['product_id', 'category', 'supplier_id']
+
+# Rows per read when a date-filtered load falls back to a legacy CSV file
+CSV_CHUNK_ROWS = 500_000
+
+def prepare(df):
+    """The frame with the stored dtypes (categorical key columns, datetime `date`),
+    as load_table returns it. Shallow copy, so the caller's frame keeps its dtypes."""
+    df = df.copy(deep=False)
+    for col in CATEGORICAL_COLUMNS:
+        if col in df.columns and not isinstance(df[col].dtype, pd.CategoricalDtype):
+            df[col] = df[col].astype('category')
+    if DATE_COLUMN in df.columns:
+        df[DATE_COLUMN] = pd.to_datetime(df[DATE_COLUMN])
+    return df
+
+def _month_of(file_name):
+    # part-YYYY-MM-NNNNN.parquet -> "YYYY-MM" (None for undated tables)
+    parts = os.path.basename(file_name).split('-')
+    return f"{parts[1]}-{parts[2]}" if len(parts) == 4 else None
+
+def _partition_files(path, start_date=None, end_date=None):
+    files = sorted(glob.glob(os.path.join(path, "*.parquet")))
+    if start_date is not None:
+        start_month = pd.Timestamp(start_date).strftime("%Y-%m")
+        files = [f for f in files if _month_of(f) is None or _month_of(f) >= start_month]
+    if end_date is not None:
+        end_month = pd.Timestamp(end_date).strftime("%Y-%m")
+        files = [f for f in files if _month_of(f) is None or _month_of(f) <= end_month]
+    return files
+
+def _next_sequence(path):
+    # Sequence numbers only grow, so rewritten partitions never reuse a file name
+    sequences = [int(os.path.basename(f)[:-len(".parquet")].split('-')[-1])
+                 for f in glob.glob(os.path.join(path, "*.parquet"))]
+    return max(sequences, default=-1) + 1
+
+def _key_index(df, keys):
+    return pd.MultiIndex.from_arrays([df[k].astype(object) if isinstance(df[k].dtype, pd.CategoricalDtype)
+                                      else df[k] for k in keys])
+
+def _write_partitions(df, path):
+    os.makedirs(path, exist_ok=True)
+    sequence = _next_sequence(path)
+    existing = _partition_files(path)
+
+    if df.empty:
+        # Nothing to add. A table without files yet gets one schema-only file, so it
+        # loads as an empty frame with its columns; the first rows written replace it.
+        if not existing:
+            table = pa.Table.from_pandas(df, preserve_index=False)
+            # Empty categoricals have no value type; store them as string dictionaries like filled ones
+            fields = [field.with_type(pa.dictionary(field.type.index_type, pa.string()))
+                      if pa.types.is_dictionary(field.type) and pa.types.is_null(field.type.value_type) else field
+                      for field in table.schema]
+            table = table.cast(pa.schema(fields, metadata=table.schema.metadata))
+            pq.write_table(table, os.path.join(path, f"part-{sequence:05d}.parquet"))
+        return
+
+    if DATE_COLUMN not in df.columns:
+        groups = [(None, df)]
+    else:
+        groups = df.groupby(df[DATE_COLUMN].dt.strftime("%Y-%m"), sort=True)
+
+    for month, part in groups:
+        name = f"part-{month}-{sequence:05d}.parquet" if month else f"part-{sequence:05d}.parquet"
+        table = pa.Table.from_pandas(part, preserve_index=False)
+        pq.write_table(table, os.path.join(path, name))
+        sequence += 1
+    for file_name in existing:
+        if _month_of(file_name) is None and pq.ParquetFile(file_name).metadata.num_rows == 0:
+            os.remove(file_name)
+
+def table_exists(path):
+    return os.path.isdir(path) or os.path.exists(f"{path}.csv")
+
+def save_table(df, path, export_csv=False):
+    # Replace the whole table
+    if os.path.isdir(path):
+        shutil.rmtree(path)
+    _write_partitions(prepare(df), path)
+    if export_csv:
+        df.to_csv(f"{path}.csv", index=False)
+
+def append_table(df, path):
+    # Add rows as new partition files (used for chunked/streamed writes)
+    _write_partitions(prepare(df), path)
+
+def upsert_table(df, path, keys):
+    # Merge rows into a dated table by key: rows with matching keys are replaced, and
+    # only the month partitions the new rows fall into are rewritten
+    df = prepare(df)
+    if not os.path.isdir(path):
+        _write_partitions(df, path)
+        return
+
+    for month, new_rows in df.groupby(df[DATE_COLUMN].dt.strftime("%Y-%m"), sort=True):
+        month_files = [f for f in _partition_files(path) if _month_of(f) == month]
+        if month_files:
+            existing = ds.dataset(month_files, format='parquet').to_table().to_pandas()
+            existing = existing[~_key_index(existing, keys).isin(_key_index(new_rows, keys))]
+            new_rows = pd.concat([existing, new_rows], ignore_index=True)
+            new_rows = prepare(new_rows).sort_values(DATE_COLUMN, kind='stable')
+        _write_partitions(new_rows, path)
+        for file_name in month_files:
+            os.remove(file_name)
+
+def _load_csv(path, columns=None, start_date=None, end_date=None):
+    header = pd.read_csv(f"{path}.csv", nrows=0).columns
+    parse_dates = [DATE_COLUMN] if DATE_COLUMN in header else None
+    usecols = None
+    if columns is not None:
+        usecols = list(columns)
+        if (start_date is not None or end_date is not None) and DATE_COLUMN not in usecols:
+            usecols.append(DATE_COLUMN)
+
+    if start_date is None and end_date is None:
+        df = pd.read_csv(f"{path}.csv", usecols=usecols, parse_dates=parse_dates)
+    else:
+        # Filter while reading so only the requested date range is held in memory
+        pieces = []
+        for chunk in pd.read_csv(f"{path}.csv", usecols=usecols, parse_dates=parse_dates,
+                                 chunksize=CSV_CHUNK_ROWS):
+            if start_date is not None:
+                chunk = chunk[chunk[DATE_COLUMN] >= pd.Timestamp(start_date)]
+            if end_date is not None:
+                chunk = chunk[chunk[DATE_COLUMN] <= pd.Timestamp(end_date)]
+            pieces.append(chunk)
+        df = pd.concat(pieces, ignore_index=True)
+    if columns is not None:
+        df = df[list(columns)]
+    return prepare(df).reset_index(drop=True)
+
+def load_table(path, columns=None, start_date=None, end_date=None):
+    """Load a table, reading only `columns` and rows with start_date <= date <= end_date."""
+    if not os.path.isdir(path):
+        return _load_csv(path, columns, start_date, end_date)
+
+    files = _partition_files(path, start_date, end_date)
+    if not files:
+        # Nothing in range: return an empty frame with the table's schema
+        table = pq.read_schema(_partition_files(path)[0]).empty_table()
+        return (table.select(columns) if columns is not None else table).to_pandas()
+
+    row_filter = None
+    if start_date is not None:
+        row_filter = ds.field(DATE_COLUMN) >= pd.Timestamp(start_date).to_datetime64()
+    if end_date is not None:
+        end_filter = ds.field(DATE_COLUMN) <= pd.Timestamp(end_date).to_datetime64()
+        row_filter = end_filter if row_filter is None else row_filter & end_filter
+
+    table = ds.dataset(files, format='parquet').to_table(columns=columns, filter=row_filter)
+    return table.to_pandas()
+
+def table_schema(path):
+    """Empty frame with the table's columns and dtypes, read from file metadata only."""
+    if not os.path.isdir(path):
+        # CSV has no schema: dtypes are inferred from the first rows
+        return prepare(pd.read_csv(f"{path}.csv", nrows=CSV_CHUNK_ROWS)).iloc[:0]
+    return pq.read_schema(_partition_files(path)[0]).empty_table().to_pandas()
+
+def table_files(path):
+    """The files holding a table: its Parquet partitions in name order, or the legacy CSV."""
+    if os.path.isdir(path):
+        return _partition_files(path)
+    return [f"{path}.csv"] if os.path.exists(f"{path}.csv") else []
+
+def table_signature(path):
+    """Cheap change token for a table: (name, size, mtime) of each of its files, without reading them."""
+    signature = []
+    for file_name in table_files(path):
+        stat = os.stat(file_name)
+        signature.append((os.path.basename(file_name), stat.st_size, stat.st_mtime_ns))
+    return tuple(signature)
+
+def date_range(path):
+    """(min, max) of the date column, read from Parquet statistics without loading rows."""
+    if not os.path.isdir(path):
+        dates = _load_csv(path, columns=[DATE_COLUMN])[DATE_COLUMN]
+        return dates.min(), dates.max()
+
+    min_date, max_date = None, None
+    for file_name in _partition_files(path):
+        metadata = pq.ParquetFile(file_name).metadata
+        column = metadata.schema.to_arrow_schema().get_field_index(DATE_COLUMN)
+        for i in range(metadata.num_row_groups):
+            stats = metadata.row_group(i).column(column).statistics
+            if stats is None or not stats.has_min_max:
+                continue
+            low, high = pd.Timestamp(stats.min), pd.Timestamp(stats.max)
+            min_date = low if min_date is None else min(min_date, low)
+            max_date = high if max_date is None else max(max_date, high)
+    return min_date, max_date
+
+def export_csv(path, csv_path=None):
+    # Written one partition file at a time so large tables never sit in memory
+    csv_path = csv_path or f"{path}.csv"
+    for i, file_name in enumerate(_partition_files(path)):
+        part = pq.read_table(file_name).to_pandas()
+        part.to_csv(csv_path, mode='w' if i == 0 else 'a', header=i == 0, index=False)